@@ -0,0 +1,60 @@
+# /// script
+# requires-python = ">=3.9"
+# dependencies = ["mrc"]
+# ///
+"""Per-file open cost of DVFile for header-only use (sizes/voxel_size).
+
+Usage: python scripts/benchmark_open.py [--n-files N] [--n-sections N]
+"""
+
+import argparse
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+import mrc
+from mrc import DVFile
+
+
+def make_files(dest: Path, n_files: int, n_sections: int) -> list[Path]:
+    arr = np.zeros((n_sections, 64, 64), np.uint16)
+    paths = []
+    for i in range(n_files):
+        path = dest / f"file_{i:05}.dv"
+        m = mrc.Mrc2(str(path), "w")
+        m.initHdrForArr(arr, "z")
+        m.makeExtendedHdr(8, 32)
+        m.writeHeader()
+        m.writeExtHeader(seekTo0=True)
+        m.writeStack(arr)
+        m.close()
+        paths.append(path)
+    return paths
+
+
+def bench(paths: list[Path], lazy: bool) -> float:
+    start = time.perf_counter()
+    for path in paths:
+        with DVFile(path, lazy=lazy) as f:
+            f.sizes, f.voxel_size  # noqa: B018
+    return (time.perf_counter() - start) / len(paths)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--n-files", type=int, default=500)
+    parser.add_argument("--n-sections", type=int, default=2000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = make_files(Path(tmp), args.n_files, args.n_sections)
+        for lazy in (False, True):
+            bench(paths[:10], lazy)  # warm up
+            per_file = bench(paths, lazy)
+            print(f"lazy={lazy!s:5}  {per_file * 1e6:8.1f} µs/file")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+# /// script
+# requires-python = ">=3.9"
+# dependencies = ["mrc"]
+# ///
+"""Compare DVFile.read_roi with slicing the memmap, for a small Y/X box.
+
+Usage: python scripts/benchmark_roi.py [--planes N] [--size N] [--roi N] [--cold]
+
+With --cold, the file's pages are evicted from the OS page cache (where
+supported) before each repetition, so that timings reflect disk reads.  Use
+--dest to put the test file on another (e.g. network) filesystem.
+"""
+
+import argparse
+import os
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+import mrc
+from mrc import DVFile
+
+
+def evict(path: str) -> None:
+    if hasattr(os, "posix_fadvise"):
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+        finally:
+            os.close(fd)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--planes", type=int, default=64)
+    parser.add_argument("--size", type=int, default=2048)
+    parser.add_argument("--roi", type=int, default=256)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--dest", default=None)
+    parser.add_argument("--cold", action="store_true")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(dir=args.dest) as tmp:
+        path = str(Path(tmp) / "roi.dv")
+        data = np.random.randint(0, 4000, (args.planes, args.size, args.size), "u2")
+        mrc.save(data, path, zAxisOrder="z")
+        del data
+
+        start = (args.size - args.roi) // 2
+        ys = xs = slice(start, start + args.roi)
+
+        def memmap_slice() -> np.ndarray:
+            with DVFile(path) as f:
+                return np.array(f.data[..., ys, xs])
+
+        def read_roi() -> np.ndarray:
+            with DVFile(path) as f:
+                return f.read_roi(y=ys, x=xs)
+
+        expected = memmap_slice()
+        for func in (memmap_slice, read_roi):
+            np.testing.assert_array_equal(func(), expected)
+            times = []
+            for _ in range(args.repeat):
+                if args.cold:
+                    evict(path)
+                t0 = time.perf_counter()
+                func()
+                times.append(time.perf_counter() - t0)
+            print(f"{func.__name__:14} {min(times) * 1e3:8.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+# /// script
+# requires-python = ">=3.9"
+# dependencies = ["mrc"]
+# ///
+"""Header-only cataloguing throughput: mrc.scan vs. opening each file with DVFile.
+
+Usage: python scripts/benchmark_scan.py [--n-files N] [--workers N]
+"""
+
+import argparse
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+import mrc
+from mrc import DVFile
+
+
+def make_files(dest: Path, n_files: int) -> None:
+    # write one file, then copy its bytes (writing many files with Mrc2 is slow)
+    template = dest / "template.dv"
+    mrc.save(np.zeros((4, 32, 32), np.uint16), str(template), zAxisOrder="z")
+    data = template.read_bytes()
+    template.unlink()
+    for i in range(n_files):
+        (dest / f"file_{i:06}.dv").write_bytes(data)
+
+
+def bench_dvfile(dest: Path) -> int:
+    n = 0
+    for path in sorted(dest.iterdir()):
+        if DVFile.is_supported_file(str(path)):
+            with DVFile(path) as f:
+                f.sizes, f.dtype, f.voxel_size, f.hdr.lens_num  # noqa: B018
+            n += 1
+    return n
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--n-files", type=int, default=20000)
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        dest = Path(tmp)
+        make_files(dest, args.n_files)
+        for name, func in [
+            ("DVFile", lambda: bench_dvfile(dest)),
+            ("scan", lambda: len(mrc.scan(dest, workers=args.workers))),
+        ]:
+            start = time.perf_counter()
+            n = func()
+            elapsed = time.perf_counter() - start
+            print(f"{name:7} {n / elapsed:10.0f} files/s")
+
+
+if __name__ == "__main__":
+    main()
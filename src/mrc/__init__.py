@@ -6,7 +6,14 @@ except ImportError:
     __version__ = "unknown"
 
 
+from ._async import AsyncDVFile
+from ._dataset import DVDataset
+from ._header_cache import HeaderCache
 from ._new import DVFile, imread
+from ._plane_cache import PlaneCache, plane_cache
+from ._scan import scan
+from ._store import DVStore, create
+from ._writer import DVWriter
 from .mrc import (
     Mrc,
     Mrc2,
@@ -23,11 +30,18 @@ from .mrc import (
 )
 
 __all__ = [
+    "AsyncDVFile",
+    "DVDataset",
     "DVFile",
+    "DVStore",
+    "DVWriter",
+    "HeaderCache",
     "Mrc",
     "Mrc2",
+    "PlaneCache",
     "bindFile",
     "copyHdrInfo",
+    "create",
     "hdrInfo",
     "imread",
     "imsave",
@@ -35,6 +49,8 @@ __all__ = [
     "load",
     "makeHdrArray",
     "open",
+    "plane_cache",
     "save",
+    "scan",
     "shapeFromHdr",
 ]
@@ -0,0 +1,193 @@
+"""asyncio interface for reading DV files."""
+
+from __future__ import annotations
+
+import asyncio
+from collections.abc import Hashable, Mapping, Sequence
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Callable
+
+import numpy as np
+
+from ._new import DVFile
+
+if TYPE_CHECKING:
+    from typing import Literal
+
+
+class _Read:
+    """A read in flight, which other requests may join."""
+
+    def __init__(self, future: asyncio.Future) -> None:
+        self.future = future
+        # whether other requests use the result (so it mustn't be handed out)
+        self.shared = False
+
+
+class AsyncDVFile:
+    """A DV file with coroutine methods for reading pixel data.
+
+    Blocking reads run on a bounded thread pool, so they don't block the event
+    loop.  Concurrent requests are merged: a plane that is already being read
+    (for any request) is not read again, and identical ROI requests share one
+    read.  Arrays returned by merged requests are independent copies.
+
+    Parameters
+    ----------
+    path : str | Path
+        Path to the DV file.  Only the header is read on creation.
+    max_workers : int, optional
+        Maximum number of concurrent reads, by default 4.
+    backend : {"mmap", "pread", "auto"}, optional
+        I/O backend (see `DVFile`).  By default "pread", which reads with explicit
+        positional reads rather than page faults.
+    **kwargs
+        Passed to `DVFile`.
+
+    Examples
+    --------
+    >>> async with AsyncDVFile("some_file.dv") as f:
+    ...     plane = await f.read_plane(t=0, c=1, z=10)
+    ...     tile = await f.read_roi(y=slice(0, 256), x=slice(256, 512), T=0, C=1)
+    """
+
+    def __init__(
+        self,
+        path: str | Path,
+        *,
+        max_workers: int = 4,
+        backend: Literal["mmap", "pread", "auto"] = "pread",
+        **kwargs: Any,
+    ) -> None:
+        self.file = DVFile(path, lazy=True, backend=backend, **kwargs)
+        self._executor = ThreadPoolExecutor(max_workers, thread_name_prefix="dvfile")
+        # in-flight reads: section -> (future of a block of planes, index in block)
+        self._planes: dict[int, tuple[_Read, int]] = {}
+        self._requests: dict[Hashable, _Read] = {}
+
+    async def __aenter__(self) -> AsyncDVFile:
+        return self
+
+    async def __aexit__(self, *args: Any) -> None:
+        await self.aclose()
+
+    def close(self) -> None:
+        """Wait for running reads to finish, and close the file."""
+        self._executor.shutdown(wait=True)
+        self.file.close()
+
+    async def aclose(self) -> None:
+        """Close the file, without blocking the event loop."""
+        await asyncio.get_running_loop().run_in_executor(None, self.close)
+
+    @property
+    def path(self) -> str:
+        return self.file.path
+
+    @property
+    def sizes(self) -> dict[str, int]:
+        return self.file.sizes
+
+    @property
+    def axes(self) -> str:
+        return self.file.axes
+
+    @property
+    def shape(self) -> tuple[int, ...]:
+        return self.file.shape
+
+    @property
+    def dtype(self) -> np.dtype:
+        return self.file.dtype
+
+    async def read_plane(self, t: int = 0, c: int = 0, z: int = 0) -> np.ndarray:
+        """Read the (Y, X) plane at timepoint `t`, channel `c` and section `z`."""
+        return await self._read_sections(self.file._sections({"T": t, "C": c, "Z": z}))
+
+    async def read_planes(
+        self, indices: Mapping[str, int | slice | Sequence[int]] | Any
+    ) -> np.ndarray:
+        """Read a selection of planes (see `DVFile.read_planes`)."""
+        return await self._read_sections(self.file._sections(indices))
+
+    async def asarray(self, squeeze: bool = True) -> np.ndarray:
+        """Read all pixel data into memory."""
+        sections = self.file._sections({})
+        data = await self._read_sections(sections)
+        return data.squeeze() if squeeze else data
+
+    async def read_roi(
+        self,
+        y: slice = slice(None),
+        x: slice = slice(None),
+        **dim_selection: int | slice | Sequence[int],
+    ) -> np.ndarray:
+        """Read a Y/X sub-rectangle of a selection of planes (see `DVFile.read_roi`).
+
+        Identical concurrent requests share one read.
+        """
+        sections = self.file._sections(dim_selection)
+        ny, nx = self.shape[-2:]
+        key = (sections.shape, *sections.ravel().tolist(), y.indices(ny), x.indices(nx))
+        return await self._single_flight(key, self.file.read_roi, y, x, **dim_selection)
+
+    async def _single_flight(
+        self, key: Hashable, func: Callable[..., np.ndarray], *args: Any, **kwargs: Any
+    ) -> np.ndarray:
+        read = self._requests.get(key)
+        if read is not None:
+            read.shared = True
+            return np.array(await asyncio.shield(read.future))
+        loop = asyncio.get_running_loop()
+        read = _Read(
+            loop.run_in_executor(self._executor, lambda: func(*args, **kwargs))
+        )
+        self._requests[key] = read
+        read.future.add_done_callback(lambda f: self._requests.pop(key, None))
+        data = await asyncio.shield(read.future)
+        # don't hand out an array that other requests copy from
+        return np.array(data) if read.shared else data
+
+    async def _read_sections(self, sections: np.ndarray) -> np.ndarray:
+        """Read (flat) `sections`, joining reads of planes that are in flight."""
+        flat = sections.ravel().tolist()
+        positions: dict[int, list[int]] = {}
+        for p, s in enumerate(flat):
+            positions.setdefault(s, []).append(p)
+        missing = [s for s in positions if s not in self._planes]
+        own: _Read | None = None
+        if missing:
+            # read all planes that are not in flight with one (coalesced) read
+            loop = asyncio.get_running_loop()
+            own = _Read(
+                loop.run_in_executor(
+                    self._executor,
+                    self.file._read_sections,
+                    np.asarray(missing, np.intp),
+                )
+            )
+            for i, s in enumerate(missing):
+                self._planes[s] = (own, i)
+            own.future.add_done_callback(lambda f: self._forget(own, missing))
+        blocks = {s: self._planes[s] for s in positions}
+        for read, _ in blocks.values():
+            read.shared = read.shared or read is not own
+
+        if own is not None and missing == flat:
+            # all planes come from our own read, in order: use it directly
+            data = await asyncio.shield(own.future)
+            if not own.shared:
+                return data.reshape(sections.shape + data.shape[1:])  # type: ignore
+        out = np.empty((len(flat), *self.shape[-2:]), self.dtype)
+        for s, (read, i) in blocks.items():
+            out[positions[s]] = (await asyncio.shield(read.future))[i]
+        return out.reshape(sections.shape + out.shape[1:])
+
+    def _forget(self, read: _Read, sections: list[int]) -> None:
+        for s in sections:
+            if s in self._planes and self._planes[s][0] is read:
+                del self._planes[s]
+
+    def __repr__(self) -> str:
+        return f"<AsyncDVFile {self.file!r}>"
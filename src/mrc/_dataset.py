@@ -0,0 +1,293 @@
+from __future__ import annotations
+
+import glob
+from collections.abc import Sequence
+from pathlib import Path
+from typing import TYPE_CHECKING, Any
+
+import numpy as np
+
+from ._io import ArrayReader, expand_key, is_advanced, release
+from ._new import DaskChunks, DVFile, _normalize_chunks
+
+if TYPE_CHECKING:
+    from typing import Literal
+
+    import dask.array
+    import xarray
+
+
+class DVDataset:
+    """A series of DV files, presented as one (lazy) N-D array.
+
+    Only headers are read when the dataset is created; pixel data is read on
+    indexing (or `asarray`, `to_dask` ...), from whichever files hold it.
+
+    Parameters
+    ----------
+    paths : str | Path | Sequence[str | Path]
+        A glob pattern (matches are sorted), or a sequence of paths.
+    axis : str, optional
+        Dimension along which files are combined.  If it is one of the file
+        dimensions ("T", "C" or "Z"), files are concatenated along it, and may
+        have different sizes along that dimension only.  Otherwise, files must
+        all have the same sizes, and are stacked along a new, leading dimension
+        with this name.  By default "P" (position).
+    backend : {"mmap", "pread", "auto"}, optional
+        I/O backend used to read the files (see `DVFile`).  By default "mmap".
+
+    Examples
+    --------
+    >>> ds = DVDataset("/data/pos*.dv")  # stack positions along a new "P" axis
+    >>> ds = DVDataset(["t0.dv", "t1.dv"], axis="T")  # concatenate time blocks
+    """
+
+    def __init__(
+        self,
+        paths: str | Path | Sequence[str | Path],
+        axis: str = "P",
+        *,
+        backend: Literal["mmap", "pread", "auto"] = "mmap",
+    ) -> None:
+        if isinstance(paths, (str, Path)):
+            self._paths = sorted(glob.glob(str(paths)))
+        else:
+            self._paths = [str(p) for p in paths]
+        if not self._paths:
+            raise ValueError(f"No files found: {paths!r}")
+
+        # read headers only
+        self.files: list[DVFile] = []
+        for path in self._paths:
+            with DVFile(path, lazy=True, backend=backend) as f:
+                self.files.append(f)
+        self._axis = axis
+        self._validate()
+
+        first = self.files[0]
+        if axis in first.sizes:
+            self._axis_index = first.axes.index(axis)
+            lengths = [f.sizes[axis] for f in self.files]
+        else:
+            self._axis_index = 0
+            lengths = [1] * len(self.files)
+        self._reader = ConcatReader(
+            [ArrayReader(f._layout(), f.backend) for f in self.files],
+            self._axis_index,
+            new_axis=axis not in first.sizes,
+            lengths=lengths,
+        )
+
+    def _validate(self) -> None:
+        first = self.files[0]
+        for f in self.files[1:]:
+            if f.dtype != first.dtype:
+                raise ValueError(
+                    f"{f.path} has dtype {f.dtype}, expected {first.dtype} "
+                    f"(from {first.path})"
+                )
+            if f.axes != first.axes:
+                raise ValueError(
+                    f"{f.path} has axes {f.axes!r}, expected {first.axes!r} "
+                    f"(from {first.path})"
+                )
+            mismatch = {
+                k: v
+                for k, v in f.sizes.items()
+                if k != self._axis and v != first.sizes[k]
+            }
+            if mismatch:
+                raise ValueError(
+                    f"{f.path} has sizes {f.sizes}, incompatible with {first.sizes} "
+                    f"(from {first.path}) for axis {self._axis!r}"
+                )
+
+    @property
+    def paths(self) -> list[str]:
+        return list(self._paths)
+
+    @property
+    def axis(self) -> str:
+        return self._axis
+
+    @property
+    def sizes(self) -> dict[str, int]:
+        return dict(zip(self.axes, self.shape))
+
+    @property
+    def axes(self) -> str:
+        axes = self.files[0].axes
+        return axes if self._axis in axes else f"{self._axis}{axes}"
+
+    @property
+    def shape(self) -> tuple[int, ...]:
+        return self._reader.shape
+
+    @property
+    def ndim(self) -> int:
+        return len(self.shape)
+
+    @property
+    def dtype(self) -> np.dtype:
+        return self.files[0].dtype
+
+    @property
+    def voxel_size(self) -> Any:
+        return self.files[0].voxel_size
+
+    def __len__(self) -> int:
+        return self.shape[0]
+
+    def __getitem__(self, key: Any) -> np.ndarray:
+        return self._reader[key]
+
+    def __array__(self) -> np.ndarray:
+        return self.asarray()
+
+    def asarray(self, squeeze: bool = True) -> np.ndarray:
+        data = self._reader[...]
+        return data.squeeze() if squeeze else data
+
+    def to_dask(self, chunks: DaskChunks = None) -> dask.array.Array:
+        """Return a delayed dask array.
+
+        `chunks` is as in `DVFile.to_dask`, applied to each file.  Chunks never
+        span more than one file.
+        """
+        import dask.array as da
+        from dask.base import tokenize
+
+        ax = self._axis_index
+        per_file = [
+            _normalize_chunks(chunks, f.sizes, f.dtype.itemsize) for f in self.files
+        ]
+        if self._reader.new_axis:
+            _chunks = ((1,) * len(self.files), *per_file[0])
+        else:
+            along = tuple(c for file_chunks in per_file for c in file_chunks[ax])
+            _chunks = (*per_file[0][:ax], along, *per_file[0][ax + 1 :])
+        return da.from_array(  # type: ignore [no-untyped-call,no-any-return]
+            self._reader,
+            chunks=_chunks,
+            name=f"dvdataset-{tokenize(self._reader.token(), _chunks)}",
+            asarray=False,
+            lock=False,
+            fancy=False,
+            meta=np.empty((0,) * self.ndim, self.dtype),
+            inline_array=True,
+        )
+
+    def to_xarray(
+        self, delayed: bool = False, squeeze: bool = True
+    ) -> xarray.DataArray:
+        import xarray as xr
+
+        arr = xr.DataArray(
+            self.to_dask() if delayed else self.asarray(squeeze=False),
+            dims=list(self.sizes),
+            coords=self._expand_coords(),
+            attrs={"paths": self.paths},
+        )
+        return arr.squeeze() if squeeze else arr
+
+    def _expand_coords(self) -> dict[str, Any]:
+        coords = self.files[0]._expand_coords()
+        if self._reader.new_axis:
+            coords[self._axis] = [Path(p).name for p in self._paths]
+        elif self._axis in coords:
+            coords[self._axis] = [
+                x for f in self.files for x in f._expand_coords()[self._axis]
+            ]
+        return coords
+
+    def close(self) -> None:
+        """Release any file handles cached by reads from this dataset."""
+        for path in self._paths:
+            release(path)
+
+    def __enter__(self) -> DVDataset:
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        self.close()
+
+    def __repr__(self) -> str:
+        return (
+            f"<DVDataset of {len(self.files)} files along {self._axis!r} "
+            f"{self.dtype}: {self.sizes!r}>"
+        )
+
+
+class ConcatReader:
+    """Picklable array-like that routes reads to the files of a dataset.
+
+    Files are stacked along a new dimension `axis` (if `new_axis`), or
+    concatenated along existing dimension `axis` (with `lengths` elements each).
+    """
+
+    def __init__(
+        self,
+        readers: list[ArrayReader],
+        axis: int,
+        new_axis: bool,
+        lengths: list[int],
+    ) -> None:
+        self.readers = readers
+        self.axis = axis
+        self.new_axis = new_axis
+        self.offsets = np.cumsum([0, *lengths])
+        file_shape = readers[0].shape
+        if new_axis:
+            self.shape: tuple[int, ...] = (len(readers), *file_shape)
+        else:
+            total = int(self.offsets[-1])
+            self.shape = (*file_shape[:axis], total, *file_shape[axis + 1 :])
+        self.dtype = readers[0].dtype
+
+    @property
+    def ndim(self) -> int:
+        return len(self.shape)
+
+    def token(self) -> tuple:
+        return ([r.layout for r in self.readers], self.axis, self.new_axis)
+
+    def __getitem__(self, key: Any) -> np.ndarray:
+        key = expand_key(key, self.ndim)
+        ax = self.axis
+        before, sel, after = key[:ax], key[ax], key[ax + 1 :]
+        if is_advanced(before + after):
+            raise IndexError(
+                "Only integers and slices are supported for dimensions other than "
+                "the one along which files are combined."
+            )
+        idx = np.arange(self.shape[ax])[sel]
+        if idx.ndim > 1:
+            raise IndexError("Only 1-dimensional indices are supported.")
+        # which file holds each selected index, and where
+        file_idx = np.searchsorted(self.offsets, idx, side="right") - 1
+        local = idx - self.offsets[file_idx]
+
+        if idx.ndim == 0:
+            reader = self.readers[int(file_idx)]
+            sub = before + after if self.new_axis else (*before, int(local), *after)
+            return reader[sub]
+
+        # output position of the combined dimension (integers drop dimensions)
+        out_ax = sum(not isinstance(k, (int, np.integer)) for k in before)
+        dummy = np.broadcast_to(np.empty((), self.dtype), self.shape)
+        out = np.empty(dummy[key].shape, self.dtype)
+        # read each run of consecutive positions that come from the same file
+        breaks = np.flatnonzero(np.diff(file_idx) != 0) + 1
+        bounds = [0, *breaks.tolist(), idx.size]
+        for p0, p1 in zip(bounds[:-1], bounds[1:]):
+            reader = self.readers[int(file_idx[p0])]
+            dest = (slice(None),) * out_ax + (slice(p0, p1),)
+            if self.new_axis:
+                part = reader[before + after]
+                out[dest] = np.expand_dims(part, out_ax)
+                continue
+            loc = local[p0:p1]
+            if np.all(np.diff(loc) == 1):
+                loc = slice(int(loc[0]), int(loc[-1]) + 1)
+            out[dest] = reader[(*before, loc, *after)]
+        return out
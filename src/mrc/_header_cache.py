@@ -0,0 +1,165 @@
+"""Persistent, on-disk cache of DV headers and extended headers."""
+
+from __future__ import annotations
+
+import contextlib
+import hashlib
+import os
+import struct
+import tempfile
+from pathlib import Path
+from typing import NamedTuple
+
+_MAGIC = b"MRCHDRC1"
+# identity of the cached file: st_size, st_mtime_ns, st_ino, st_dev, len(path)
+_IDENTITY = struct.Struct("<QQQQI")
+_SUFFIX = ".dvhdr"
+# the directory is rescanned (for entries of other processes) every this many stores
+_RESCAN_STORES = 1000
+# once over max_bytes, entries are removed down to this fraction of it
+_EVICT_TO = 0.9
+
+
+class FileIdentity(NamedTuple):
+    st_size: int
+    st_mtime_ns: int
+    st_ino: int
+    st_dev: int
+
+
+class HeaderCache:
+    """A directory of cached DV headers, shared across processes.
+
+    Each entry holds the raw 1024-byte header and the packed extended header (the
+    named fields of one record per section, see `ExtHeader`) of one file, and is
+    keyed by the file's absolute path.  Files opened lazily store only the header,
+    until their extended header is read.
+    An entry is only used if the file's size, modification time, inode and device
+    are unchanged since it was stored; otherwise it is replaced on the next read.
+    Once the entries exceed `max_bytes` in total, the oldest-written are removed
+    (down to 90% of it, but keeping the newest).  The total is tracked as entries
+    are stored, and the directory only rescanned when it exceeds `max_bytes` (or
+    every so often, to count the entries stored by other processes).
+
+    Parameters
+    ----------
+    directory : str | Path
+        Directory in which to store entries (created if necessary).
+    max_bytes : int, optional
+        Maximum total size of the entries, by default 256 MiB.
+
+    Examples
+    --------
+    >>> cache = HeaderCache("~/.cache/mrc-headers")
+    >>> f = DVFile("big_file.dv", lazy=True, header_cache=cache)
+    """
+
+    def __init__(self, directory: str | Path, max_bytes: int = 256 * 1024**2) -> None:
+        self.directory = Path(directory).expanduser()
+        self.max_bytes = max_bytes
+        self.directory.mkdir(parents=True, exist_ok=True)
+        # estimated total size of the entries (None until the directory is scanned)
+        self._total: int | None = None
+        self._n_stores = 0
+
+    def _entry_path(self, path: str) -> Path:
+        digest = hashlib.blake2b(path.encode(), digest_size=16).hexdigest()
+        return self.directory / f"{digest}{_SUFFIX}"
+
+    def lookup(self, path: str) -> tuple[FileIdentity, tuple[bytes, memoryview] | None]:
+        """Stat `path` and return its identity and cached (header, ext_header).
+
+        The cached value is None if there is no valid entry for the file as it
+        currently is on disk.
+        """
+        path = os.path.abspath(path)
+        st = os.stat(path)
+        identity = FileIdentity(st.st_size, st.st_mtime_ns, st.st_ino, st.st_dev)
+        try:
+            with open(self._entry_path(path), "rb") as fh:
+                buf = fh.read()
+        except OSError:
+            return identity, None
+
+        start = len(_MAGIC) + _IDENTITY.size
+        if len(buf) < start or not buf.startswith(_MAGIC):
+            return identity, None
+        *stored, path_len = _IDENTITY.unpack_from(buf, len(_MAGIC))
+        hdr_start = start + path_len
+        if (
+            tuple(stored) != identity
+            or buf[start:hdr_start] != path.encode()
+            or len(buf) < hdr_start + 1024
+        ):
+            return identity, None
+        view = memoryview(buf)  # avoid copying the (possibly large) ext header
+        return identity, (buf[hdr_start : hdr_start + 1024], view[hdr_start + 1024 :])
+
+    def store(
+        self, path: str, identity: FileIdentity, header: bytes, ext_header: bytes
+    ) -> None:
+        """Store the raw header and extended header of the file at `path`.
+
+        `identity` should be the one returned by `lookup` before the file was
+        read, so that an entry is never stored for a file that has since changed.
+        """
+        path = os.path.abspath(path)
+        encoded = path.encode()
+        entry_path = self._entry_path(path)
+        try:
+            replaced = entry_path.stat().st_size
+        except OSError:
+            replaced = 0
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as fh:
+                fh.write(_MAGIC)
+                fh.write(_IDENTITY.pack(*identity, len(encoded)))
+                fh.write(encoded)
+                fh.write(header)
+                fh.write(ext_header)
+            # atomic, so that concurrent readers never see a partial entry
+            os.replace(tmp, entry_path)
+        except BaseException:
+            with contextlib.suppress(FileNotFoundError):
+                os.unlink(tmp)
+            raise
+        size = len(_MAGIC) + _IDENTITY.size + len(encoded)
+        size += len(header) + len(ext_header)
+        self._n_stores += 1
+        if self._total is None or self._n_stores % _RESCAN_STORES == 0:
+            self.evict()
+        else:
+            self._total += size - replaced
+            if self._total > self.max_bytes:
+                self.evict()
+
+    def evict(self) -> None:
+        """If over `max_bytes` in total, remove the oldest-written entries."""
+        entries = []
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                # entries may be removed concurrently by other processes
+                if entry.name.endswith(_SUFFIX):
+                    with contextlib.suppress(FileNotFoundError):
+                        st = entry.stat()
+                        entries.append((st.st_mtime_ns, st.st_size, entry.path))
+        total = sum(size for _, size, _ in entries)
+        target = self.max_bytes * _EVICT_TO if total > self.max_bytes else total
+        for _, size, entry_path in sorted(entries)[:-1]:
+            if total <= target:
+                break
+            with contextlib.suppress(FileNotFoundError):
+                os.unlink(entry_path)
+            total -= size
+        self._total = total
+
+    def clear(self) -> None:
+        """Remove all entries."""
+        for entry in self.directory.glob(f"*{_SUFFIX}"):
+            with contextlib.suppress(FileNotFoundError):
+                entry.unlink()
+        self._total = 0
+
+    def __repr__(self) -> str:
+        return f"HeaderCache({str(self.directory)!r}, max_bytes={self.max_bytes})"
@@ -0,0 +1,310 @@
+"""Histograms of a DV file along one of its T, C or Z dimensions."""
+
+from __future__ import annotations
+
+import contextlib
+import threading
+from typing import TYPE_CHECKING, NamedTuple, Sequence
+
+import numpy as np
+
+from ._project import stream_sections
+
+if TYPE_CHECKING:
+    from ._new import DVFile
+
+# approximate number of bytes read in "sampled" mode
+HISTOGRAM_SAMPLE_BYTES = 8 * 1024 * 1024
+# header min/max of the 1st and other waves, as written by mrc.init_simple
+UNSET_WAVE_RANGES = ((0, 100000), (0, 10000))
+# stored bounds wider than this many times the observed range are not used
+MAX_BOUNDS_RATIO = 2
+# integers are only counted per value if the tables of all groups fit in this
+MAX_VALUE_TABLE_BYTES = 64 * 1024 * 1024
+
+
+class Histogram(NamedTuple):
+    """Histograms of a DV file, one per position along a dimension.
+
+    Attributes
+    ----------
+    counts : np.ndarray
+        Number of pixels in each bin, with shape ``(n, bins)`` (or ``(bins,)``
+        for a single histogram).
+    edges : np.ndarray
+        Bin edges of each histogram (as returned by `np.histogram`), with
+        shape ``(n, bins + 1)`` (or ``(bins + 1,)``).
+    """
+
+    counts: np.ndarray
+    edges: np.ndarray
+
+    def percentile(self, q: float | Sequence[float]) -> np.ndarray:
+        """Estimate the `q`-th percentiles (0-100) of each histogram.
+
+        Values are interpolated linearly within bins, so the error is at most
+        one bin width.  Empty histograms give NaN.
+        """
+        qs = np.asarray(q, float)
+        counts = self.counts.reshape(-1, self.counts.shape[-1])
+        edges = self.edges.reshape(-1, self.edges.shape[-1])
+        out = np.full((len(counts), qs.size), np.nan)
+        for i, (c, e) in enumerate(zip(counts, edges)):
+            cdf = np.concatenate([[0], np.cumsum(c)])
+            if cdf[-1]:
+                out[i] = np.interp(qs.ravel() / 100 * cdf[-1], cdf, e)
+        return out.reshape(self.counts.shape[:-1] + qs.shape)
+
+
+def _plausible(bounds: np.ndarray) -> np.ndarray:
+    """Which rows of (n, 2) `bounds` look like real (rather than unset) values."""
+    lo, hi = bounds.T
+    with np.errstate(invalid="ignore"):
+        ok: np.ndarray = np.isfinite(lo) & np.isfinite(hi) & (lo <= hi)
+    ok &= (lo != 0) | (hi != 0)
+    return ok
+
+
+def header_ranges(file: DVFile) -> np.ndarray:
+    """Per-wave min/max of the header, shape ``(sizes["C"], 2)``.
+
+    Waves beyond the 5th, and ranges that are implausible or the defaults of
+    `mrc.init_simple`, are NaN.
+    """
+    hdr = file.hdr
+    waves = [(hdr.min, hdr.max)]
+    waves += [(getattr(hdr, f"min{i}"), getattr(hdr, f"max{i}")) for i in range(2, 6)]
+    ranges = np.full((file.sizes["C"], 2), np.nan)
+    n = min(len(ranges), len(waves))
+    ranges[:n] = waves[:n]
+    unset = np.isin(ranges[:, 1], [hi for _, hi in UNSET_WAVE_RANGES])
+    unset &= ranges[:, 0] == 0
+    ranges[unset | ~_plausible(ranges)] = np.nan
+    return ranges
+
+
+def stored_bounds(file: DVFile, dim: str | None) -> np.ndarray | None:
+    """Intensity bounds of each group along `dim`, from the (extended) header.
+
+    The per-plane `minInten` / `maxInten` of the extended header are used if
+    present, else the per-wave min/max of the header.  Returns an array of
+    shape ``(n, 2)``, NaN for groups without plausible bounds, or None if no
+    group has any.  These may be stale or far too wide, so are only trusted
+    when they hold the observed values closely.
+    """
+    lead = file.axes[:-2]
+    n_groups = file.sizes[dim] if dim is not None else 1
+    ext = file.ext_hdr
+    if (
+        ext is not None
+        and {"minInten", "maxInten"} <= set(ext.fields)
+        and len(ext) == np.prod(file.shape[:-2])
+    ):
+        planes = np.stack([ext["minInten"], ext["maxInten"]], axis=-1).astype(float)
+        planes[~_plausible(planes.reshape(-1, 2)).reshape(planes.shape[:-1])] = np.nan
+        if dim is not None:
+            planes = np.moveaxis(planes, lead.index(dim), 0)
+        planes = planes.reshape(n_groups, -1, 2)
+        # NaN (from any implausible plane) propagates to the group's bounds
+        bounds = np.stack([planes[..., 0].min(1), planes[..., 1].max(1)], axis=-1)
+        if np.isfinite(bounds).all():
+            return bounds
+
+    bounds = header_ranges(file)
+    if dim != "C":
+        # the same (combined) bounds for every group
+        bounds = np.tile([bounds[:, 0].min(), bounds[:, 1].max()], (n_groups, 1))
+    return bounds if np.isfinite(bounds).any() else None
+
+
+class _Counts:
+    """Running histograms of groups of pixels, shared by all reading threads.
+
+    Integer data of up to 16 bits is counted per value, with `np.bincount`, and
+    binned at the end, if the per-value tables of all groups fit in
+    MAX_VALUE_TABLE_BYTES.  Other data is binned as it is added, within `bounds`.
+    """
+
+    def __init__(
+        self, n_groups: int, dtype: np.dtype, bins: int, bounds: np.ndarray | None
+    ) -> None:
+        self.dtype = dtype
+        self.bins = bins
+        n_values = 1 << (8 * dtype.itemsize)
+        self.by_value = (
+            dtype.kind in "ui"
+            and dtype.itemsize <= 2
+            and n_groups * n_values * 8 <= MAX_VALUE_TABLE_BYTES
+        )
+        self.offset = -int(np.iinfo(dtype).min) if self.by_value else 0
+        n_counts = n_values if self.by_value else bins
+        self.counts = np.zeros((n_groups, n_counts), np.int64)
+        self.min = np.full(n_groups, np.inf)
+        self.max = np.full(n_groups, -np.inf)
+        # if None, only the min and max of non-integer data are tracked
+        self.bounds = bounds
+
+    def add(
+        self, group: int, values: np.ndarray, lock: threading.Lock | None = None
+    ) -> None:
+        """Count `values` in `group`, holding `lock` (if any) only to update."""
+        values = values.ravel()
+        if self.by_value:
+            if self.offset:
+                values = values.astype(np.intp) + self.offset
+            partial = np.bincount(values)
+            with lock or contextlib.nullcontext():
+                self.counts[group, : len(partial)] += partial
+            return
+        lo, hi = np.fmin.reduce(values), np.fmax.reduce(values)
+        binned = None
+        if self.bounds is not None:
+            bounds = tuple(self.bounds[group])
+            binned = np.histogram(values, self.bins, bounds)[0]
+        with lock or contextlib.nullcontext():
+            self.min[group] = np.fmin(self.min[group], lo)
+            self.max[group] = np.fmax(self.max[group], hi)
+            if binned is not None:
+                self.counts[group] += binned
+
+    def observed(self) -> np.ndarray:
+        """Smallest and largest value of each group, shape ``(n, 2)``."""
+        if self.by_value:
+            for g, counts in enumerate(self.counts):
+                nonzero = np.flatnonzero(counts)
+                if nonzero.size:
+                    self.min[g], self.max[g] = nonzero[[0, -1]] - self.offset
+        return np.stack([self.min, self.max], axis=-1)
+
+    def histogram(self, bounds: np.ndarray) -> Histogram:
+        """Bin the counts of each group within `bounds`."""
+        n_groups = len(self.counts)
+        counts = np.zeros((n_groups, self.bins), np.int64)
+        edges = np.empty((n_groups, self.bins + 1))
+        values = np.arange(self.counts.shape[1]) - self.offset
+        for g in range(n_groups):
+            edges[g] = np.histogram_bin_edges([], self.bins, tuple(bounds[g]))
+            if self.by_value:
+                weights = self.counts[g]
+                counts[g] = np.histogram(values, edges[g], weights=weights)[0]
+            else:
+                counts[g] = self.counts[g]
+        return Histogram(counts, edges)
+
+
+def _choose_bounds(
+    value_range: np.ndarray | None, stored: np.ndarray | None, observed: np.ndarray
+) -> np.ndarray:
+    """Bounds of each group: `value_range`, else `stored` if they fit the data.
+
+    Stored bounds must hold the `observed` min and max, and be at most
+    MAX_BOUNDS_RATIO times as wide (defaults such as 0..10000 often hold, but
+    would put all values in one bin).
+    """
+    if value_range is not None:
+        return value_range
+    # groups without (finite) values
+    observed = np.where(np.isfinite(observed).all(1, keepdims=True), observed, [0, 1])
+    if stored is None:
+        return observed
+    lo, hi = observed.T
+    with np.errstate(invalid="ignore"):
+        fits = (stored[:, 0] <= lo) & (hi <= stored[:, 1])
+        fits &= stored[:, 1] - stored[:, 0] <= MAX_BOUNDS_RATIO * (hi - lo)
+    return np.where(fits[:, None], stored, observed)
+
+
+def _sample(file: DVFile, group_of: np.ndarray, n_groups: int) -> list[np.ndarray]:
+    """Read an evenly spaced subset of the planes and rows of each group."""
+    ny, nx = file.shape[-2:]
+    plane_bytes = ny * nx * file.dtype.itemsize
+    budget = max(HISTOGRAM_SAMPLE_BYTES // n_groups, 1)
+    samples = []
+    for g in range(n_groups):
+        sections = np.flatnonzero(group_of == g)
+        # subsample planes and rows by about the same factor
+        fraction = min(budget / (len(sections) * plane_bytes), 1.0)
+        n_planes = min(max(round(len(sections) * fraction**0.5), 1), len(sections))
+        step = max(-(-n_planes * plane_bytes // budget), 1)
+        picked = np.unique(np.linspace(0, len(sections) - 1, n_planes).round())
+        samples.append(
+            file._reader.read_roi(
+                sections[picked.astype(np.intp)], slice(None, None, step), slice(None)
+            )
+        )
+    return samples
+
+
+def _group_of(file: DVFile, dim: str | None) -> tuple[np.ndarray, int]:
+    """Position along `dim` of each section (in file order), and size of `dim`."""
+    lead = file.axes[:-2]
+    n_sections = int(np.prod(file.shape[:-2]))
+    if dim is None:
+        return np.zeros(n_sections, np.intp), 1
+    if dim not in lead:
+        raise ValueError(f"dim must be one of {(*lead, None)}, got {dim!r}")
+    coords = np.unravel_index(np.arange(n_sections), file.shape[:-2])
+    return coords[lead.index(dim)], file.sizes[dim]
+
+
+def histogram(
+    file: DVFile,
+    dim: str | None = "C",
+    bins: int = 256,
+    mode: str = "exact",
+    value_range: tuple[float, float] | None = None,
+    max_workers: int | None = None,
+) -> Histogram:
+    """Histograms of `file` along `dim` (see `DVFile.histogram`)."""
+    if mode not in ("exact", "sampled"):
+        raise ValueError(f"mode must be 'exact' or 'sampled', got {mode!r}")
+    if file.dtype.kind == "c":
+        raise TypeError(f"Cannot compute histograms of {file.dtype} data")
+    group_of, n_groups = _group_of(file, dim)
+    if mode == "sampled":
+        samples = _sample(file, group_of, n_groups)
+
+        def fill(counts: _Counts) -> None:
+            for g, sample in enumerate(samples):
+                counts.add(g, sample)
+
+    else:
+
+        def fill(counts: _Counts) -> None:
+            _stream(file, group_of, counts, max_workers)
+
+    fixed = None if value_range is None else np.tile(value_range, (n_groups, 1))
+    counts = _Counts(n_groups, file.dtype, bins, fixed)
+    # small integers are binned by their observed range (for free if counted
+    # per value, else found by a first pass)
+    small_ints = file.dtype.kind in "ui" and file.dtype.itemsize <= 2
+    stored = None if small_ints else stored_bounds(file, dim)
+    if fixed is None and stored is not None and np.isfinite(stored).all():
+        counts.bounds = stored
+    fill(counts)
+    bounds = _choose_bounds(fixed, stored, counts.observed())
+    if not counts.by_value and (
+        counts.bounds is None or not np.array_equal(bounds, counts.bounds)
+    ):
+        # data was binned within bounds that turned out not to hold it: redo
+        counts = _Counts(n_groups, file.dtype, bins, bounds)
+        fill(counts)
+    result = counts.histogram(bounds)
+    if dim is None:
+        return Histogram(result.counts[0], result.edges[0])
+    return result
+
+
+def _stream(
+    file: DVFile, group_of: np.ndarray, counts: _Counts, max_workers: int | None
+) -> None:
+    """Add all planes of `file`, read once in file order, on a thread pool."""
+    # planes are counted outside the lock; only updating the totals is serialized
+    lock = threading.Lock()
+
+    def _reduce(planes: np.ndarray, start: int, sections: Sequence[int]) -> None:
+        for s in sections:
+            counts.add(int(group_of[s]), planes[s - start], lock)
+
+    # spread sections (rather than groups) over tasks: there may be few groups
+    stream_sections(file, np.arange(len(group_of)), _reduce, max_workers)
@@ -0,0 +1,555 @@
+"""Low-level, path-based access to DV pixel data.
+
+Objects in this module hold only a file path and header-derived layout (no open
+file handles), so they can be pickled and sent to other processes.  File handles
+are (re)opened lazily and cached per process.
+
+Two I/O backends are available:
+
+- "mmap": index a (cached) memory map of the file.
+- "pread": explicit positional reads (`os.preadv`) of whole runs of sections into
+  preallocated arrays.  Reads release the GIL, so they overlap across threads, and
+  don't rely on page faults (which perform poorly on network/FUSE filesystems).
+"""
+
+from __future__ import annotations
+
+import contextlib
+import io
+import mmap
+import os
+import sys
+import threading
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Any, BinaryIO, Callable, NamedTuple
+
+import numpy as np
+
+if TYPE_CHECKING:
+    from typing import Literal
+
+    Backend = Literal["mmap", "pread"]
+
+# reads are split into blocks of (at most) this many bytes, aligned to file offsets
+READ_BLOCK_SIZE = 16 * 1024 * 1024
+# gaps of up to this many bytes between requested sections are read and discarded
+MAX_GAP_BYTES = 1024 * 1024
+# maximum size of a range merged across gaps (and of scratch buffers)
+MAX_MERGE_BYTES = 64 * 1024 * 1024
+# filesystem types for which "auto" picks the pread backend
+_NETWORK_FS = {
+    "9p", "afs", "ceph", "cifs", "davfs", "fuse", "fuseblk", "glusterfs", "gpfs",
+    "lustre", "ncpfs", "nfs", "nfs4", "smb", "smb2", "smb3", "smbfs", "sshfs",
+}  # fmt: skip
+_HAS_PREADV = hasattr(os, "preadv")
+_HAS_PWRITE = hasattr(os, "pwrite")
+# before python 3.13 a memory map holds a duplicate file descriptor, so maps are
+# only cached (across reads) when they can be made without one
+_CACHE_MEMMAPS = sys.version_info >= (3, 13)
+_MAX_CACHED_MEMMAPS = 64
+_MEMMAPS: OrderedDict[Layout, np.ndarray] = OrderedDict()
+_MEMMAPS_LOCK = threading.Lock()
+
+
+class Layout(NamedTuple):
+    """Location and shape of the pixel data in a DV file."""
+
+    path: str
+    dtype: str
+    shape: tuple[int, ...]
+    offset: int
+    # file identity, so that cached handles are not reused after a file changes
+    st_size: int = 0
+    st_mtime_ns: int = 0
+
+    @classmethod
+    def from_file(
+        cls, path: str, dtype: np.dtype, shape: tuple[int, ...], offset: int
+    ) -> Layout:
+        st = os.stat(path)
+        return cls(path, dtype.str, shape, offset, st.st_size, st.st_mtime_ns)
+
+
+def _mmap(path: str) -> mmap.mmap:
+    with open(path, "rb") as fh:
+        # on python >= 3.13, don't keep a duplicate file descriptor open
+        kwargs = {"trackfd": False} if _CACHE_MEMMAPS else {}
+        return mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ, **kwargs)
+
+
+def cached_memmap(layout: Layout) -> np.ndarray:
+    """Return a read-only memory-mapped array for `layout`, cached per process."""
+    with _MEMMAPS_LOCK:
+        mm = _MEMMAPS.get(layout)
+        if mm is not None:
+            _MEMMAPS.move_to_end(layout)
+            return mm
+    buf = _mmap(layout.path)
+    mm = np.ndarray(layout.shape, layout.dtype, buffer=buf, offset=layout.offset)
+    with _MEMMAPS_LOCK:
+        _MEMMAPS[layout] = mm
+        while len(_MEMMAPS) > _MAX_CACHED_MEMMAPS:
+            _MEMMAPS.popitem(last=False)
+    return mm
+
+
+def read_memmap(layout: Layout, read: Callable[[np.ndarray], np.ndarray]) -> np.ndarray:
+    """Return `read` applied to a read-only memory-mapped array for `layout`.
+
+    On python >= 3.13 the map is cached (see `cached_memmap`).  Otherwise it is
+    closed again once `read` returns, so that no file descriptor is left open
+    between reads: `read` must return a copy, not a view of the map.
+    """
+    if _CACHE_MEMMAPS:
+        return read(cached_memmap(layout))
+    buf = _mmap(layout.path)
+    try:
+        return read(
+            np.ndarray(layout.shape, layout.dtype, buffer=buf, offset=layout.offset)
+        )
+    finally:
+        with contextlib.suppress(BufferError):
+            # still referenced (e.g. by a traceback): closed when collected
+            buf.close()
+
+
+def release(path: str) -> None:
+    """Drop cached handles for `path` (they close once no array references them)."""
+    with _MEMMAPS_LOCK:
+        for key in [k for k in _MEMMAPS if k.path == path]:
+            del _MEMMAPS[key]
+
+
+def resolve_backend(backend: str, path: str) -> Backend:
+    """Resolve `backend` ("mmap", "pread" or "auto") for the file at `path`."""
+    if backend == "auto":
+        return "pread" if _is_network_fs(path) else "mmap"
+    if backend not in ("mmap", "pread"):
+        raise ValueError(
+            f"backend must be one of 'mmap', 'pread' or 'auto', got {backend!r}"
+        )
+    return backend  # type: ignore [return-value]
+
+
+def filesystem_type(path: str) -> str:
+    """Return the type of the filesystem holding `path` (Linux only, else "")."""
+    try:
+        with open("/proc/self/mounts") as f:
+            mounts = [line.split()[1:3] for line in f]
+    except OSError:
+        return ""
+    path = os.path.realpath(path)
+    best, fs_type = "", ""
+    for mount_point, fs in mounts:
+        mount_point = mount_point.replace("\\040", " ")
+        if (
+            path == mount_point or path.startswith(mount_point.rstrip("/") + "/")
+        ) and len(mount_point) >= len(best):
+            best, fs_type = mount_point, fs
+    return fs_type
+
+
+def _is_network_fs(path: str) -> bool:
+    if os.name == "nt":
+        return os.path.abspath(path).startswith("\\\\")  # UNC path
+    fs_type = filesystem_type(path)
+    return fs_type in _NETWORK_FS or fs_type.startswith("fuse.")
+
+
+class PreadFile:
+    """Reads sections of a DV file with (coalesced) positional reads.
+
+    The file descriptor is opened on first read, and may be shared by threads.
+    """
+
+    def __init__(self, layout: Layout) -> None:
+        self.layout = layout
+        self._file: io.FileIO | None = None
+        self._lock = threading.Lock()
+        ny, nx = layout.shape[-2:]
+        self._plane_shape = (ny, nx)
+        self._plane_bytes = ny * nx * np.dtype(layout.dtype).itemsize
+        self._n_sections = int(np.prod(layout.shape[:-2]))
+
+    def __enter__(self) -> PreadFile:
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        self.close()
+
+    def close(self) -> None:
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def _fileio(self) -> io.FileIO:
+        with self._lock:
+            if self._file is None:
+                self._file = io.FileIO(self.layout.path, "r")
+            return self._file
+
+    def read_sections(
+        self, sections: np.ndarray, out: np.ndarray | None = None
+    ) -> np.ndarray:
+        """Read the (flat) section indices in `sections` (see `read_sections`)."""
+        return read_sections(
+            self._fileio(),
+            self.layout.offset,
+            self._plane_shape,
+            np.dtype(self.layout.dtype),
+            sections,
+            out=out,
+            lock=self._lock,
+        )
+
+    def read_roi(
+        self,
+        sections: np.ndarray,
+        y: slice,
+        x: slice,
+        out: np.ndarray | None = None,
+    ) -> np.ndarray:
+        """Read a Y/X region of the sections in `sections` (see `read_roi`)."""
+        return read_roi(
+            self._fileio(),
+            self.layout.offset,
+            self._plane_shape,
+            np.dtype(self.layout.dtype),
+            sections,
+            y,
+            x,
+            out=out,
+            lock=self._lock,
+        )
+
+    def willneed(self, sections: np.ndarray) -> None:
+        """Advise the kernel that (sorted) `sections` will be read soon.
+
+        Does nothing where `posix_fadvise` is not available.
+        """
+        if not hasattr(os, "posix_fadvise"):
+            return  # pragma: no cover
+        fd = self._fileio().fileno()
+        for first, stop in coalesce(sections, self._plane_bytes):
+            offset = self.layout.offset + first * self._plane_bytes
+            length = (stop - first) * self._plane_bytes
+            os.posix_fadvise(fd, offset, length, os.POSIX_FADV_WILLNEED)
+
+    def __getitem__(self, key: Any) -> np.ndarray:
+        shape = self.layout.shape
+        plane_key, yx_key = split_key(key, len(shape))
+        if spans_planes(plane_key, yx_key):
+            # indices that broadcast across the plane and YX dimensions
+            out = self.read_sections(np.arange(self._n_sections))
+            return out.reshape(shape)[key]  # type: ignore [no-any-return]
+        sections = np.arange(self._n_sections).reshape(shape[:-2])[plane_key]
+        out = self.read_sections(sections)
+        if any(k != slice(None) for k in yx_key):
+            out = np.ascontiguousarray(out[(Ellipsis, *yx_key)])
+        return out
+
+
+def readinto(
+    file: BinaryIO, buf: memoryview, offset: int, lock: threading.Lock | None = None
+) -> None:
+    """Fill `buf` with bytes from `file`, starting at `offset`.
+
+    Uses positional reads where available (which neither move nor depend on the
+    file position, and release the GIL).  Otherwise falls back to seek + readinto,
+    holding `lock` (if given).  Large reads are split into blocks that end on
+    multiples of READ_BLOCK_SIZE in the file, so all but the first are aligned.
+    """
+    buf = buf.cast("B")
+    pos, end = 0, len(buf)
+    while pos < end:
+        boundary = (offset // READ_BLOCK_SIZE + 1) * READ_BLOCK_SIZE
+        stop = min(end, pos + boundary - offset)
+        if _HAS_PREADV:
+            n = os.preadv(file.fileno(), [buf[pos:stop]], offset)
+        else:  # pragma: no cover
+            with lock or contextlib.nullcontext():
+                file.seek(offset)
+                n = file.readinto(buf[pos:stop])  # type: ignore [attr-defined]
+        if not n:
+            raise OSError(f"Unexpected end of file reading {file.name} at {offset}")
+        pos += n
+        offset += n
+
+
+def writefrom(
+    file: BinaryIO, buf: memoryview, offset: int, lock: threading.Lock | None = None
+) -> None:
+    """Write all of `buf` to `file`, starting at `offset`.
+
+    The counterpart of `readinto`: uses positional writes where available (so
+    that threads and processes can write to one file concurrently), otherwise
+    seek + write, holding `lock` (if given).
+    """
+    buf = buf.cast("B")
+    pos, end = 0, len(buf)
+    while pos < end:
+        if _HAS_PWRITE:
+            n = os.pwrite(file.fileno(), buf[pos:], offset)
+        else:  # pragma: no cover
+            with lock or contextlib.nullcontext():
+                file.seek(offset)
+                n = file.write(buf[pos:])
+        pos += n
+        offset += n
+
+
+def read_sections(
+    file: BinaryIO,
+    offset: int,
+    plane_shape: tuple[int, int],
+    dtype: np.dtype,
+    sections: Any,
+    out: np.ndarray | None = None,
+    lock: threading.Lock | None = None,
+) -> np.ndarray:
+    """Read sections (planes) of `plane_shape` stored from `offset` in `file`.
+
+    `sections` holds flat section indices, in any order and possibly repeated.
+    They are sorted and merged into as few reads as possible (see `coalesce`), and
+    the planes are scattered into the output in the requested order.  Ranges of
+    sections that are requested in file order are read directly into the output.
+
+    The result has shape ``np.shape(sections) + plane_shape``, and is written to
+    `out` if provided.
+    """
+    sections = np.asarray(sections, dtype=np.intp)
+    flat = sections.ravel()
+    shape = sections.shape + tuple(plane_shape)
+    if out is not None and out.shape != shape:
+        raise ValueError(f"out must have shape {shape}, got {out.shape}")
+    direct = out is not None and out.dtype == dtype and out.flags.c_contiguous
+    buf = out if direct else np.empty(shape, dtype)
+    planes = buf.reshape(flat.size, -1).view(np.uint8)  # type: ignore [union-attr]
+    nbytes = planes.shape[1]
+    max_planes = max(1, MAX_MERGE_BYTES // nbytes) if nbytes else 1
+
+    order = np.argsort(flat, kind="stable")
+    sorted_sections = flat[order]
+    for first, stop in coalesce(sorted_sections, nbytes):
+        lo, hi = np.searchsorted(sorted_sections, [first, stop])
+        positions = order[lo:hi]
+        if np.array_equal(sorted_sections[lo:hi], np.arange(first, stop)) and np.all(
+            np.diff(positions) == 1
+        ):
+            # each section of the range was requested once, in file order: read
+            # the range in place
+            p = int(positions[0])
+            readinto(file, planes[p : p + hi - lo].data, offset + first * nbytes, lock)
+            continue
+        # otherwise read (bounded) pieces of the range and scatter the planes
+        scratch = np.empty((min(max_planes, stop - first), nbytes), np.uint8)
+        for start in range(first, stop, max_planes):
+            end = min(start + max_planes, stop)
+            a, b = np.searchsorted(sorted_sections, [start, end])
+            if a == b:
+                continue
+            readinto(file, scratch[: end - start].data, offset + start * nbytes, lock)
+            planes[order[a:b]] = scratch[sorted_sections[a:b] - start]
+
+    if out is None:
+        return buf  # type: ignore [return-value]
+    if not direct:
+        out[...] = buf
+    return out
+
+
+def read_roi(
+    file: BinaryIO,
+    offset: int,
+    plane_shape: tuple[int, int],
+    dtype: np.dtype,
+    sections: Any,
+    y: slice,
+    x: slice,
+    out: np.ndarray | None = None,
+    lock: threading.Lock | None = None,
+) -> np.ndarray:
+    """Read the `y`, `x` region of sections stored from `offset` in `file`.
+
+    Only the byte ranges of the selected rows are read.  Within each plane, rows
+    separated by at most MAX_GAP_BYTES are read together (at most
+    MAX_MERGE_BYTES per read) and the gaps discarded, so each plane typically
+    costs a single read.  Rows separated by larger gaps are read one by one.
+
+    The result has shape ``np.shape(sections) + (n_rows, n_cols)``, and is written
+    to `out` if provided.
+    """
+    sections = np.asarray(sections, dtype=np.intp)
+    ny, nx = plane_shape
+    rows = range(*y.indices(ny))
+    cols = range(*x.indices(nx))
+    shape = (*sections.shape, len(rows), len(cols))
+    if out is not None and out.shape != shape:
+        raise ValueError(f"out must have shape {shape}, got {out.shape}")
+    result = np.empty(shape, dtype) if out is None else out
+    if not result.size:
+        return result
+
+    # read columns [x0, x1) of rows y0, y0 + ystep, ... into `roi`
+    itemsize = dtype.itemsize
+    x0, x1 = min(cols[0], cols[-1]), max(cols[0], cols[-1]) + 1
+    y0, ystep = rows[0], rows.step
+    flat = sections.ravel()
+    direct = cols.step == 1 and result.dtype == dtype and result.flags.c_contiguous
+    roi_shape = (flat.size, len(rows), x1 - x0)
+    roi = result.reshape(roi_shape) if direct else np.empty(roi_shape, dtype)
+
+    row_stride = ystep * nx * itemsize
+    row_bytes = (x1 - x0) * itemsize
+    plane_bytes = ny * nx * itemsize
+    if abs(row_stride) - row_bytes <= MAX_GAP_BYTES:
+        group = max(1, MAX_MERGE_BYTES // abs(row_stride))
+    else:
+        group = 1
+    scratch = np.empty((min(group, len(rows)), abs(row_stride)), np.uint8)
+    for i, section in enumerate(flat.tolist()):
+        first = offset + section * plane_bytes + x0 * itemsize
+        dest = roi[i].view(np.uint8).reshape(len(rows), row_bytes)
+        for r in range(0, len(rows), group):
+            n = min(group, len(rows) - r)
+            if n == 1:
+                start = first + (y0 + r * ystep) * nx * itemsize
+                readinto(file, dest[r].data, start, lock)
+                continue
+            # read n rows (and the gaps between them) with one call
+            row_a, row_b = y0 + r * ystep, y0 + (r + n - 1) * ystep
+            start = first + min(row_a, row_b) * nx * itemsize
+            nbytes = (n - 1) * abs(row_stride) + row_bytes
+            readinto(file, scratch.reshape(-1)[:nbytes].data, start, lock)
+            block = scratch[:n, :row_bytes]
+            dest[r : r + n] = block if ystep > 0 else block[::-1]
+
+    if not direct:
+        result[...] = roi[..., cols[0] - x0 :: cols.step].reshape(shape)
+    return result
+
+
+def coalesce(
+    sections: np.ndarray,
+    plane_bytes: int,
+    max_gap: int | None = None,
+    max_bytes: int | None = None,
+) -> list[tuple[int, int]]:
+    """Merge section indices into [first, stop) ranges to read in one call each.
+
+    Consecutive sections are always merged.  Runs separated by a gap of at most
+    `max_gap` bytes (default MAX_GAP_BYTES) are merged as long as the combined
+    range spans at most `max_bytes` (default MAX_MERGE_BYTES): reading (and
+    discarding) a small gap is cheaper than an extra read.
+    """
+    max_gap = MAX_GAP_BYTES if max_gap is None else max_gap
+    max_bytes = MAX_MERGE_BYTES if max_bytes is None else max_bytes
+    uniq = np.unique(sections)
+    if not uniq.size:
+        return []
+    breaks = np.flatnonzero(np.diff(uniq) != 1) + 1
+    starts = uniq[np.r_[0, breaks]].tolist()
+    stops = (uniq[np.r_[breaks - 1, uniq.size - 1]] + 1).tolist()
+
+    max_gap_planes = max_gap // plane_bytes if plane_bytes else 0
+    max_planes = max_bytes // plane_bytes if plane_bytes else 0
+    ranges = [(starts[0], stops[0])]
+    for start, stop in zip(starts[1:], stops[1:]):
+        first, prev_stop = ranges[-1]
+        if start - prev_stop <= max_gap_planes and stop - first <= max_planes:
+            ranges[-1] = (first, stop)
+        else:
+            ranges.append((start, stop))
+    return ranges
+
+
+def split_key(key: Any, ndim: int) -> tuple[tuple, tuple]:
+    """Split a numpy index into (plane, YX) parts, for an `ndim`-D array."""
+    key = expand_key(key, ndim)
+    return key[:-2], key[-2:]
+
+
+def expand_key(key: Any, ndim: int) -> tuple:
+    """Expand a numpy index to a tuple with one entry per dimension."""
+    key = tuple(key) if isinstance(key, tuple) else (key,)
+    if any(k is None for k in key):
+        raise IndexError("np.newaxis is not supported when indexing a DV file")
+    n_ellipsis = sum(k is Ellipsis for k in key)
+    if n_ellipsis > 1:
+        raise IndexError("an index can only have a single ellipsis ('...')")
+    if n_ellipsis:
+        i = next(i for i, k in enumerate(key) if k is Ellipsis)
+        fill = (slice(None),) * (ndim - len(key) + 1)
+        key = key[:i] + fill + key[i + 1 :]
+    if len(key) > ndim:
+        raise IndexError(
+            f"too many indices for array: array is {ndim}-dimensional, "
+            f"but {len(key)} were indexed"
+        )
+    return (*key, *(slice(None),) * (ndim - len(key)))
+
+
+def is_advanced(key: tuple) -> bool:
+    """Whether any index in `key` is an array (i.e. not an int or slice)."""
+    return any(not isinstance(k, (slice, int, np.integer)) for k in key)
+
+
+def spans_planes(plane_key: tuple, yx_key: tuple) -> bool:
+    """Whether advanced indexing combines the plane and YX parts of a key.
+
+    When the plane part has an array, numpy treats integer Y/X indices as
+    advanced indices too, and broadcasts them all together, so the two parts
+    can't be applied one after the other.
+    """
+    return is_advanced(plane_key) and not all(isinstance(k, slice) for k in yx_key)
+
+
+class ArrayReader:
+    """Picklable, array-like view of the pixels in a DV file.
+
+    Indexing returns an in-memory copy of the selection.  This is the object that
+    `DVFile.to_dask` hands to `dask.array.from_array`.
+    """
+
+    def __init__(
+        self, layout: Layout, backend: Backend = "mmap", cache_planes: bool = False
+    ) -> None:
+        self.layout = layout
+        self.backend = backend
+        self.cache_planes = cache_planes
+
+    @property
+    def shape(self) -> tuple[int, ...]:
+        return self.layout.shape
+
+    @property
+    def dtype(self) -> np.dtype:
+        return np.dtype(self.layout.dtype)
+
+    @property
+    def ndim(self) -> int:
+        return len(self.layout.shape)
+
+    def __getitem__(self, key: Any) -> np.ndarray:
+        if self.cache_planes:
+            from ._plane_cache import plane_cache
+
+            return plane_cache.getitem(self.layout, key, self.read_sections)
+        if self.backend == "pread":
+            with PreadFile(self.layout) as f:
+                return f[key]
+        return read_memmap(self.layout, lambda mm: np.array(mm[key]))
+
+    def read_sections(self, sections: np.ndarray) -> np.ndarray:
+        """Read the planes of (flat) `sections` into a new array."""
+        if self.backend == "pread":
+            with PreadFile(self.layout) as f:
+                return f.read_sections(sections)
+        plane_shape = self.shape[-2:]
+        return read_memmap(
+            self.layout, lambda mm: mm.reshape(-1, *plane_shape)[sections]
+        )
+
+    def __repr__(self) -> str:
+        return f"<ArrayReader {self.layout.path!r} {self.dtype}: {self.shape}>"
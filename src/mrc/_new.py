@@ -1,50 +1,170 @@
 from __future__ import annotations
 
+import mmap
+import os
 import struct
+from collections.abc import Iterator, Mapping, Sequence
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from typing import (
     TYPE_CHECKING,
     Any,
     BinaryIO,
     Callable,
+    Literal,
     NamedTuple,
+    Union,
     overload,
 )
 
 import numpy as np
 
-if TYPE_CHECKING:
-    from typing import Literal
+from ._header_cache import HeaderCache
+from ._io import (
+    ArrayReader,
+    Layout,
+    PreadFile,
+    is_advanced,
+    release,
+    resolve_backend,
+    split_key,
+)
+from ._plane_cache import plane_cache
+from ._prefetch import Prefetcher, madvise_willneed
 
+if TYPE_CHECKING:
     import dask.array
     import xarray
 
+    from ._header_cache import FileIdentity
+    from ._histogram import Histogram
+    from ._ranges import IntensityRanges
+
+DaskChunks = Union[
+    int, str, Mapping[str, Union[int, None]], Sequence[Union[int, None]], None
+]
+
+# minimum number of bytes read by each thread in DVFile.asarray
+_MIN_TASK_BYTES = 4 * 1024 * 1024
+
 __author__ = "Talley Lambert"
 __email__ = "talley.lambert@gmail.com"
 
 
 class DVFile:
-    ext_hdr: ExtHeader | None
     hdr: Header
     _data: np.memmap | None = None
 
-    def __init__(self, path: str | Path) -> None:
+    def __init__(
+        self,
+        path: str | Path,
+        *,
+        lazy: bool = False,
+        backend: Literal["mmap", "pread", "auto"] = "mmap",
+        header_cache: HeaderCache | str | Path | None = None,
+        cache_planes: bool = False,
+        prefetch: int = 0,
+    ) -> None:
+        """Open a DV file.
+
+        Parameters
+        ----------
+        path : str | Path
+            Path to the DV file.
+        lazy : bool, optional
+            If True, only the 1024-byte header is read up front.  The extended
+            header is read on first access of `ext_hdr`, and the pixel memmap is
+            created on first access of `data` (or anything that reads pixels).
+            By default False.
+        backend : {"mmap", "pread", "auto"}, optional
+            How pixel data is read by indexing, `asarray` and `to_dask`.  "mmap"
+            (default) indexes a memory map of the file.  "pread" reads whole runs
+            of planes with positional reads into new arrays (better on network
+            and FUSE filesystems, and reads from multiple threads overlap).
+            "auto" picks "pread" for network/FUSE filesystems, else "mmap".
+            The `data` attribute is always a memmap.
+        header_cache : HeaderCache | str | Path, optional
+            A `HeaderCache` (or its directory) from which to load the header and
+            extended header, if they were cached for this file as it currently is
+            on disk.  Otherwise, they are read from the file and stored in the
+            cache.  By default, no cache is used.
+        cache_planes : bool, optional
+            If True, planes read by indexing (and by `to_dask` chunks) are kept in
+            `mrc.plane_cache`, a byte-budgeted LRU cache shared by all files in the
+            process, and arrays returned by indexing are read-only.
+            By default False.
+        prefetch : int, optional
+            If > 0, indexing that follows a sequential or strided pattern (e.g.
+            scrolling through Z or T) prefetches this many reads ahead on a
+            background thread: into the plane cache if `cache_planes`, otherwise
+            by advising the kernel to read ahead (``MADV_WILLNEED`` on the memmap,
+            or ``POSIX_FADV_WILLNEED`` with the "pread" backend).  Prefetching
+            stops on any other access.  By default 0 (no prefetching).
+        """
         self._path = str(path)
-        with open(path, "rb") as fh:
-            self._byte_order = _byte_order(fh)
-            if self._byte_order is None:  # pragma: no cover
-                raise ValueError(f"{path} is not a recognized DV file.")
-            fh.seek(0)
-            strct = LE_HDR if self._byte_order == "<" else BE_HDR
-            *r, self._title = strct.unpack(fh.read(strct.size))
-
-            self.hdr = Header(*r)
-            if self.hdr.ext_hdr_len:
-                self.ext_hdr = ExtHeader(fh.read(self.hdr.ext_hdr_len), self.hdr)
-            else:
-                self.ext_hdr = None
+        self._lazy = lazy
+        self._backend = resolve_backend(backend, self._path)
+        self._cache_planes = cache_planes
+        self._pread: PreadFile | None = None
+        self._closed = True
+        self._ext_hdr: ExtHeader | None = None
+        self._ext_hdr_loaded = False
+        self._pending_entry: tuple[HeaderCache, FileIdentity, bytes] | None = None
+        if header_cache is not None:
+            if not isinstance(header_cache, HeaderCache):
+                header_cache = HeaderCache(header_cache)
+            self._load_cached_headers(header_cache)
+        else:
+            with open(path, "rb") as fh:
+                header = _read_header(fh)
+                if header is None:  # pragma: no cover
+                    raise ValueError(f"{path} is not a recognized DV file.")
+                self._byte_order, self.hdr, self._title = header
+                if not lazy:
+                    self._ext_hdr = self._read_ext_hdr(fh)
+                    self._ext_hdr_loaded = True
+        self._prefetcher: Prefetcher | None = None
+        if prefetch > 0:
+            # flat section number of each plane, to map keys to sections
+            self._section_numbers = np.arange(np.prod(self.shape[:-2])).reshape(
+                self.shape[:-2]
+            )
+            self._prefetcher = Prefetcher(
+                self._prefetch_sections, self._section_numbers.size, prefetch
+            )
         self.open()
 
+    def _load_cached_headers(self, cache: HeaderCache) -> None:
+        identity, cached = cache.lookup(self._path)
+        if cached is None:
+            with open(self._path, "rb") as fh:
+                hdr_buf = fh.read(LE_HDR.size)
+            ext_view = None
+        else:
+            hdr_buf, ext_view = cached
+        header = _parse_header(hdr_buf)
+        if header is None:  # pragma: no cover
+            raise ValueError(f"{self._path} is not a recognized DV file.")
+        self._byte_order, self.hdr, self._title = header
+        packed_size = _ext_hdr_dtype(
+            self.hdr.n_ints, self.hdr.n_floats, self._byte_order, packed=True
+        ).itemsize
+        if ext_view is not None and (
+            len(ext_view) or not (self.hdr.ext_hdr_len and packed_size)
+        ):
+            if self.hdr.ext_hdr_len:
+                self._ext_hdr = ExtHeader.from_packed(
+                    ext_view, self.hdr, self._byte_order
+                )
+            self._ext_hdr_loaded = True
+            return
+        # the entry is completed once the extended header is read (see `ext_hdr`)
+        self._pending_entry = (cache, identity, hdr_buf)
+        if not self._lazy:
+            self._load_ext_hdr()
+        elif cached is None:
+            cache.store(self._path, identity, hdr_buf, b"")
+
     def __enter__(self) -> DVFile:
         self.open()
         return self
@@ -54,50 +174,197 @@ class DVFile:
 
     def open(self) -> None:
         if self.closed:
-            self._data = np.memmap(
-                str(self._path),
-                self.dtype,
-                offset=LE_HDR.size + self.hdr.ext_hdr_len,
-                shape=self.shape,
-                mode="r",
-            )
+            self._closed = False
+            if not self._lazy:
+                self._data = self._memmap()
 
     def close(self) -> None:
-        if not self.closed:
-            self.data._mmap.close()  # type: ignore
+        if self._prefetcher is not None:
+            self._prefetcher.close()
+        if self._data is not None:
+            self._data._mmap.close()  # type: ignore
             self._data = None
+        if self._pread is not None:
+            self._pread.close()
+            self._pread = None
+        release(self._path)
+        self._closed = True
+
+    @property
+    def _data_offset(self) -> int:
+        return LE_HDR.size + self.hdr.ext_hdr_len
+
+    def _memmap(self) -> np.memmap:
+        return np.memmap(
+            self._path,
+            self.dtype,
+            offset=self._data_offset,
+            shape=self.shape,
+            mode="r",
+        )
+
+    def _layout(self) -> Layout:
+        return Layout.from_file(self._path, self.dtype, self.shape, self._data_offset)
+
+    def _read_ext_hdr(self, fh: BinaryIO) -> ExtHeader | None:
+        if not self.hdr.ext_hdr_len:
+            return None
+        fh.seek(LE_HDR.size)
+        buf = fh.read(self.hdr.ext_hdr_len)
+        return ExtHeader(buf, self.hdr, self._byte_order)
+
+    @property
+    def ext_hdr(self) -> ExtHeader | None:
+        if not self._ext_hdr_loaded:
+            self._load_ext_hdr()
+        return self._ext_hdr
+
+    def _load_ext_hdr(self) -> None:
+        with open(self._path, "rb") as fh:
+            self._ext_hdr = self._read_ext_hdr(fh)
+        self._ext_hdr_loaded = True
+        if self._pending_entry is not None:
+            # the extended header is cached packed: only named fields of the
+            # records of existing sections
+            cache, identity, hdr_buf = self._pending_entry
+            self._pending_entry = None
+            ext_buf = b""
+            if self._ext_hdr is not None:
+                ext_buf = self._ext_hdr.packed().tobytes()
+            cache.store(self._path, identity, hdr_buf, ext_buf)
 
     @property
     def path(self) -> str:
         return self._path
 
+    @property
+    def backend(self) -> Literal["mmap", "pread"]:
+        return self._backend
+
     @property
     def closed(self) -> bool:
-        return self._data is None
+        return self._closed
 
     @property
     def data(self) -> np.memmap:
-        if self._data is None:  # pragma: no cover
+        if self._closed:  # pragma: no cover
             raise RuntimeError(
                 "Cannot read from closed file.  Please reopen with .open()"
             )
+        if self._data is None:
+            self._data = self._memmap()
         return self._data
 
+    @property
+    def _reader(self) -> PreadFile:
+        if self._closed:  # pragma: no cover
+            raise RuntimeError(
+                "Cannot read from closed file.  Please reopen with .open()"
+            )
+        if self._pread is None:
+            self._pread = PreadFile(self._layout())
+        return self._pread
+
     def __array__(self) -> np.ndarray:
         return self.asarray()
 
-    def asarray(self, squeeze: bool = True) -> np.ndarray:
-        return (self.data.squeeze() if squeeze else self.data).copy()
+    def asarray(
+        self,
+        squeeze: bool = True,
+        *,
+        out: np.ndarray | None = None,
+        max_workers: int | None = None,
+    ) -> np.ndarray:
+        """Read all pixel data into memory.
 
-    def to_dask(self) -> dask.array.Array:
-        import dask.array as da
+        Parameters
+        ----------
+        squeeze : bool, optional
+            Whether to drop dimensions of size 1, by default True.
+        out : np.ndarray, optional
+            A C-contiguous array to read into, with the (squeezed, if `squeeze`)
+            shape of this file, and a dtype that this file's dtype can be cast to.
+            If provided, `out` is returned and no other array is allocated.
+        max_workers : int, optional
+            Maximum number of threads used to read ranges of planes concurrently.
+            By default, the `ThreadPoolExecutor` default.  Use 1 to read in the
+            calling thread.
+        """
+        shape = tuple(x for x in self.shape if x != 1) if squeeze else self.shape
+        if out is None:
+            out = np.empty(shape, self.dtype)
+        elif out.shape != shape:
+            raise ValueError(f"out must have shape {shape}, got {out.shape}")
+        elif not out.flags.c_contiguous:
+            raise ValueError("out must be C-contiguous")
+        elif not np.can_cast(self.dtype, out.dtype, "same_kind"):
+            raise TypeError(f"Cannot read {self.dtype} data into {out.dtype} array")
+
+        # copy ranges of whole sections, each large enough to be worth a thread
+        planes = out.reshape(-1, self.hdr.height, self.hdr.width)
+        n_sections = planes.shape[0]
+        n_tasks = min(
+            max_workers or min(32, (os.cpu_count() or 1) + 4),
+            n_sections,
+            -(-out.nbytes // _MIN_TASK_BYTES),
+        )
+        bounds = np.linspace(0, n_sections, max(n_tasks, 1) + 1).astype(int).tolist()
+        ranges = list(zip(bounds[:-1], bounds[1:]))
+        if self._backend == "pread":
+            reader = self._reader
 
-        chunks = [(1,) * v if k in "TZC" else (v,) for k, v in self.sizes.items()]
-        return da.map_blocks(self._dask_block, chunks=chunks, dtype=self.dtype)
+            def _read(start: int, stop: int) -> None:
+                reader.read_sections(np.arange(start, stop), out=planes[start:stop])
 
-    def _dask_block(self, block_id: tuple[int, ...]) -> np.ndarray:
-        ncoords = 3
-        return self[block_id[:ncoords]][(np.newaxis,) * ncoords]  # type: ignore
+        else:
+            src = self.data.reshape(planes.shape)
+
+            def _read(start: int, stop: int) -> None:
+                planes[start:stop] = src[start:stop]
+
+        if len(ranges) <= 1:
+            for start, stop in ranges:
+                _read(start, stop)
+        else:
+            with ThreadPoolExecutor(len(ranges)) as pool:
+                list(pool.map(lambda r: _read(*r), ranges))
+        return out
+
+    def to_dask(self, chunks: DaskChunks = None) -> dask.array.Array:
+        """Return a delayed dask array.
+
+        Parameters
+        ----------
+        chunks : int | str | Mapping[str, int] | Sequence[int] | None
+            How to chunk the array.  One of:
+
+            - None (default): one chunk per (T, C, Z) plane.
+            - a mapping of dimension name to chunk size (e.g. ``{"Z": 10}``),
+              or a sequence of chunk sizes in `sizes` order. -1 or None means the
+              full dimension.  Dimensions missing from a mapping are chunked as
+              in the default.
+            - an int: the chunk size of every dimension (as in dask).
+            - a byte budget, as a string (e.g. ``"64MiB"``): the largest block
+              that fits and is contiguous on disk is used.
+            - "auto": a byte budget of dask's ``array.chunk-size`` config value.
+        """
+        import dask.array as da
+        from dask.base import tokenize
+
+        # the graph holds only the path and layout (not this open DVFile), so it
+        # can be pickled; each worker process opens (and caches) its own memmap.
+        reader = ArrayReader(self._layout(), self._backend, self._cache_planes)
+        _chunks = _normalize_chunks(chunks, self.sizes, self.dtype.itemsize)
+        return da.from_array(  # type: ignore [no-untyped-call,no-any-return]
+            reader,
+            chunks=_chunks,
+            name=f"dvfile-{tokenize(reader.layout, reader.backend, _chunks)}",
+            asarray=False,
+            lock=False,
+            fancy=False,
+            meta=np.empty((0,) * self.ndim, self.dtype),
+            inline_array=True,
+        )
 
     def to_xarray(
         self, delayed: bool = False, squeeze: bool = True
@@ -113,20 +380,23 @@ class DVFile:
         return arr.squeeze() if squeeze else arr
 
     def _expand_coords(self) -> dict[str, Any]:
-        _ord = self.hdr.sequence_order[::-1]
-        _map: dict[str, Callable[[ExtHeaderFrame], str]] = {
-            "C": lambda x: f"{x.exWavelen:.0f}/{x.emWavelen:.0f}",
-            "T": lambda x: f"{x.timeStampSeconds}",
-            "Z": lambda x: f"{x.stageZCoord}",
+        _map: dict[str, Callable[[ExtHeader, tuple], list[str]]] = {
+            "C": lambda e, i: [
+                f"{x:.0f}/{y:.0f}"
+                for x, y in zip(e["exWavelen"][i].tolist(), e["emWavelen"][i].tolist())
+            ],
+            "T": lambda e, i: [f"{x}" for x in e["timeStampSeconds"][i].tolist()],
+            "Z": lambda e, i: [f"{x}" for x in e["stageZCoord"][i].tolist()],
         }
+        ext_hdr = self.ext_hdr
         coords = {}
         for key, val in self.sizes.items():
             if key in ("XY"):
                 coords[key] = np.arange(val) * getattr(self.voxel_size, key.lower())
-            elif self.ext_hdr:
-                stride = np.prod([self.sizes[_ord[i]] for i in range(_ord.index(key))])
-                f = [self.ext_hdr.frame(i * int(stride)) for i in range(val)]
-                coords[key] = [_map[key](x) for x in f]
+            elif ext_hdr:
+                # values along `key`, with all other (non-YX) dimensions at 0
+                idx = tuple(slice(None) if k == key else 0 for k in self.axes[:-2])
+                coords[key] = _map[key](ext_hdr, idx)
         return coords
 
     @property
@@ -137,8 +407,305 @@ class DVFile:
     def ndim(self) -> int:
         return len(self.shape)
 
+    def read_planes(
+        self,
+        indices: Mapping[str, int | slice | Sequence[int]] | Any,
+        out: np.ndarray | None = None,
+    ) -> np.ndarray:
+        """Read a selection of planes, coalescing nearby planes into large reads.
+
+        Requested planes are sorted by file offset and merged (across small gaps)
+        into as few reads as possible, then placed in the output in the requested
+        order.  This is much faster than fancy-indexing the memmap for scattered
+        selections, such as every 5th timepoint of one channel.
+
+        Parameters
+        ----------
+        indices : Mapping[str, int | slice | Sequence[int]] | array-like
+            Either an (N, 3) array of (T, C, Z) indices, giving an output of shape
+            (N, Y, X) in the requested order; or a mapping of dimension name
+            ("T", "C" or "Z") to an int, slice or sequence of indices, selected
+            independently along each dimension (omitted dimensions are selected
+            in full), giving an output with dimensions in `sizes` order.
+        out : np.ndarray, optional
+            Array to read into, with the output shape.
+        """
+        return self._reader.read_sections(self._sections(indices), out=out)
+
+    def read_roi(
+        self,
+        y: slice = slice(None),
+        x: slice = slice(None),
+        out: np.ndarray | None = None,
+        **dim_selection: int | slice | Sequence[int],
+    ) -> np.ndarray:
+        """Read a Y/X sub-rectangle of a selection of planes.
+
+        Only the selected rows of each plane are read, with nearby rows merged
+        into a single read per plane, into a compact output array.  This avoids
+        faulting in whole pages per row across many planes (as when slicing the
+        memmap).
+
+        Parameters
+        ----------
+        y, x : slice
+            Rows and columns to read.  By default, all of them.
+        out : np.ndarray, optional
+            Array to read into, with the output shape.
+        **dim_selection : int | slice | Sequence[int]
+            Selection along "T", "C" and/or "Z", as in `read_planes`.  Omitted
+            dimensions are selected in full.
+
+        Examples
+        --------
+        >>> f.read_roi(y=slice(100, 356), x=slice(200, 456), C=0)
+        """
+        sections = self._sections(dim_selection)
+        return self._reader.read_roi(sections, y, x, out=out)
+
+    def project(
+        self,
+        dim: str = "Z",
+        op: str | Sequence[str] = "max",
+        dtype: Any = None,
+        *,
+        max_workers: int | None = None,
+    ) -> np.ndarray | tuple[np.ndarray, ...]:
+        """Project the data along `dim`, reading each plane once, in file order.
+
+        Planes are read in blocks and reduced into running per-plane results on
+        a thread pool (while the next block is read), so memory use is bounded
+        by the output, not by the file size.
+
+        Parameters
+        ----------
+        dim : {"T", "C", "Z"}
+            Dimension to project along.  By default, "Z".
+        op : str | Sequence[str]
+            One of "max", "min", "sum", "mean", "argmax" or "argmin", or a
+            sequence of them to compute several in the same pass (e.g.
+            ``("max", "argmax")`` for a max projection and its height map).
+        dtype : np.dtype, optional
+            Output dtype.  By default, that of the equivalent numpy reduction.
+        max_workers : int, optional
+            Number of threads reducing planes.  By default, the number of CPUs.
+
+        Returns
+        -------
+        np.ndarray | tuple[np.ndarray, ...]
+            The projection, with the shape of the file without `dim`.  A tuple,
+            in the order of `op`, if `op` is a sequence.
+
+        Examples
+        --------
+        >>> mip, height = f.project("Z", ("max", "argmax"))
+        """
+        from ._project import project
+
+        return project(self, dim, op, dtype, max_workers)
+
+    def rolling(
+        self, dim: str = "T", window: int = 3, op: str = "mean", dtype: Any = None
+    ) -> Iterator[tuple[tuple[int, ...], np.ndarray]]:
+        """Iterate over a sliding-window reduction of the data along `dim`.
+
+        Each plane is read once, in file order, into a ring buffer of the last
+        `window` planes of its (e.g. C, Z) position; a result is yielded as soon
+        as a window is complete.  Only the ring buffers of positions in progress
+        are kept in memory (a single one if `dim` varies fastest in the file).
+
+        Parameters
+        ----------
+        dim : {"T", "C", "Z"}
+            Dimension to slide along.  By default, "T".
+        window : int
+            Number of planes in each window.  By default, 3.
+        op : {"mean", "median", "sum", "max", "min"}
+            Reduction of each window.  By default, "mean".
+        dtype : np.dtype, optional
+            Output dtype.  By default, that of the equivalent numpy reduction.
+
+        Yields
+        ------
+        tuple[tuple[int, ...], np.ndarray]
+            The index of the result (in ``axes[:-2]`` order, with the first
+            position of the window along `dim`), and the (Y, X) result, in file
+            order.  There are ``sizes[dim] - window + 1`` results along `dim`.
+
+        Examples
+        --------
+        Write a rolling median background to a new file:
+
+        >>> sizes = {**f.sizes, "T": f.sizes["T"] - 4}
+        >>> with mrc.create("bg.dv", sizes, "f4", f.axes[:-2]) as out:
+        ...     for index, plane in f.rolling("T", 5, "median"):
+        ...         out[index] = plane
+        """
+        from ._project import rolling
+
+        return rolling(self, dim, window, op, dtype)
+
+    def histogram(
+        self,
+        dim: str | None = "C",
+        bins: int = 256,
+        mode: Literal["exact", "sampled"] = "exact",
+        range: tuple[float, float] | None = None,
+        *,
+        max_workers: int | None = None,
+    ) -> Histogram:
+        """Compute a histogram of the data for each position along `dim`.
+
+        In "exact" mode, every plane is read once, in file order, and counted on
+        a thread pool (integer data of up to 16 bits with `np.bincount`, per
+        value).  In "sampled" mode, only an evenly spaced subset of the planes
+        and rows of each group (about 8 MiB in total) is read, for a fast
+        estimate, e.g. for auto-contrast.
+
+        Unless `range` is given, integer data of up to 16 bits is binned over
+        its observed min and max.  Other data is binned within the intensity
+        bounds stored in the extended header (``minInten`` / ``maxInten``) or
+        header (per-wave min/max), if these hold all values that were counted
+        and are at most twice as wide, else (counting again) over the observed
+        min and max.  The header defaults of `mrc.init_simple` are ignored.
+
+        Parameters
+        ----------
+        dim : {"C", "T", "Z"} or None
+            Dimension along which to compute separate histograms.  By default,
+            "C" (one per channel).  If None, a single histogram of all data.
+        bins : int
+            Number of equal-width bins.  By default, 256.
+        mode : {"exact", "sampled"}
+            Whether to count all pixels, or a sample.  By default, "exact".
+        range : tuple[float, float], optional
+            Lower and upper edge of the bins (as in `np.histogram`).
+        max_workers : int, optional
+            Number of threads counting planes in "exact" mode.  By default, the
+            number of CPUs.
+
+        Returns
+        -------
+        Histogram
+            Named tuple of ``counts``, shape ``(sizes[dim], bins)``, and
+            ``edges``, shape ``(sizes[dim], bins + 1)`` (without the first
+            dimension if `dim` is None).  Its `percentile` method estimates
+            percentiles from the counts.
+
+        Examples
+        --------
+        >>> lo, hi = f.histogram("C", mode="sampled").percentile([0.1, 99.9]).T
+        """
+        from ._histogram import histogram
+
+        return histogram(self, dim, bins, mode, range, max_workers)
+
+    def intensity_ranges(
+        self,
+        per_plane: bool = True,
+        scan: bool = True,
+        *,
+        max_workers: int | None = None,
+    ) -> IntensityRanges:
+        """Return the min/max of each channel and plane, from stored statistics.
+
+        Per-plane ranges (and means) come from the ``minInten`` / ``maxInten`` /
+        ``meanInten`` columns of the extended header, and channel ranges from
+        those, or else from the per-wave min/max of the header.  Stored values
+        that are missing or implausible (non-finite, out of order, outside the
+        dtype's range, all zero, or the header defaults of `mrc.init_simple`)
+        are replaced by scanning only the planes concerned, so for files with
+        complete statistics no pixels are read.
+
+        Parameters
+        ----------
+        per_plane : bool
+            Whether per-plane ranges are needed.  If False, planes are only
+            scanned when their channel has no stored range.  By default, True.
+        scan : bool
+            Whether to read pixel data at all.  If False, missing values are
+            NaN.  By default, True.
+        max_workers : int, optional
+            Number of threads scanning planes.  By default, the number of CPUs.
+
+        Returns
+        -------
+        IntensityRanges
+            Named tuple of ``channels``, shape ``(sizes["C"], 2)``, ``planes``,
+            shape ``shape[:-2] + (2,)``, ``means``, shape ``shape[:-2]``, and
+            ``n_scanned``, the number of planes that were read.
+
+        Examples
+        --------
+        >>> lo, hi = f.intensity_ranges(per_plane=False).channels[0]
+        """
+        from ._ranges import intensity_ranges
+
+        return intensity_ranges(self, per_plane, scan, max_workers)
+
+    def _sections(
+        self, indices: Mapping[str, int | slice | Sequence[int]] | Any
+    ) -> np.ndarray:
+        """Return (flat, file-order) section numbers for a plane selection."""
+        lead = self.shape[:-2]
+        dims = self.axes[:-2]
+        if isinstance(indices, Mapping):
+            unknown = set(indices) - set(dims)
+            if unknown:
+                raise ValueError(f"Unknown dimension(s): {unknown}. Use {set(dims)}")
+            sections = np.arange(int(np.prod(lead))).reshape(lead)
+            # select along each dimension independently, from the last, so that
+            # dimensions dropped by integer indices don't shift those before them
+            for axis in reversed(range(len(lead))):
+                sel = indices.get(dims[axis], slice(None))
+                if isinstance(sel, slice) or np.ndim(sel) == 0:
+                    sections = sections[(slice(None),) * axis + (sel,)]
+                else:
+                    sections = np.take(sections, np.asarray(sel, np.intp), axis=axis)
+            return sections
+
+        idx = np.asarray(indices, dtype=np.intp)
+        if idx.ndim != 2 or idx.shape[1] != 3:
+            raise ValueError("indices must be an (N, 3) array of (T, C, Z) indices")
+        tcz = dict(zip("TCZ", idx.T))
+        multi = [np.where(tcz[d] < 0, tcz[d] + n, tcz[d]) for d, n in zip(dims, lead)]
+        return np.asarray(np.ravel_multi_index(multi, lead))
+
     def __getitem__(self, key: int | slice) -> np.ndarray:
-        return self.data[key]
+        if self._cache_planes:
+            out = plane_cache.getitem(self._layout(), key, self._read_sections)
+        elif self._backend == "pread":
+            out = self._reader[key]
+        else:
+            out = self.data[key]
+        if self._prefetcher is not None:
+            plane_key, yx_key = split_key(key, self.ndim)
+            if not (is_advanced(plane_key) and is_advanced(yx_key)):
+                self._prefetcher.observe(self._section_numbers[plane_key])
+        return out
+
+    def _read_sections(self, sections: np.ndarray) -> np.ndarray:
+        if self._backend == "pread":
+            return self._reader.read_sections(sections)
+        planes = self.data.reshape(-1, self.hdr.height, self.hdr.width)
+        return np.asarray(planes[sections])
+
+    def _prefetch_sections(self, sections: np.ndarray) -> None:
+        if self._cache_planes:
+            plane_cache.prefetch(self._layout(), sections, self._read_sections)
+        elif self._backend == "pread":
+            self._reader.willneed(sections)
+        else:
+            data = self.data
+            mm_offset = data.offset - data.offset % mmap.ALLOCATIONGRANULARITY
+            plane_bytes = self.hdr.height * self.hdr.width * self.dtype.itemsize
+            madvise_willneed(
+                data._mmap,  # type: ignore [attr-defined]
+                mm_offset,
+                self._data_offset,
+                plane_bytes,
+                sections,
+            )
 
     @property
     def axes(self) -> str:
@@ -146,17 +713,7 @@ class DVFile:
 
     @property
     def dtype(self) -> np.dtype:
-        char = {
-            0: f"{self._byte_order}u1",
-            1: f"{self._byte_order}i2",
-            2: f"{self._byte_order}f4",
-            # 3: f"{self._byte_order}c4",  # not a thing in numpy
-            4: f"{self._byte_order}c8",
-            5: f"{self._byte_order}i2",
-            6: f"{self._byte_order}u2",
-            7: f"{self._byte_order}i4",
-        }[self.hdr.pixel_type]
-        return np.dtype(char)
+        return np.dtype(f"{self._byte_order}{PIXEL_TYPES[self.hdr.pixel_type]}")
 
     @property
     def sizes(self) -> dict[str, int]:
@@ -205,16 +762,119 @@ class DVFile:
 HDR_FORMAT = "10i6f3i3f2i2hi24s4h6f6h2f2h3f6h3fi800s"
 LE_HDR = struct.Struct(f"<{HDR_FORMAT}")
 BE_HDR = struct.Struct(f">{HDR_FORMAT}")
+# numpy dtype (without byte order) of each header pixel_type
+PIXEL_TYPES = {
+    0: "u1",
+    1: "i2",
+    2: "f4",
+    # 3: "c4",  # not a thing in numpy
+    4: "c8",
+    5: "i2",
+    6: "u2",
+    7: "i4",
+}
+# note, these are reversed from the header readme,
+# to reflect how numpy parses the memmap
+SEQUENCE_ORDERS = {0: "CTZ", 1: "TZC", 2: "TCZ"}
+IMAGE_TYPES = {
+    0: "NORMAL",
+    100: "NORMAL",
+    1: "TILT_SERIES",
+    2: "STEREO_TILT_SERIES",
+    3: "AVERAGED_IMAGES",
+    4: "AVERAGED_STEREO_PAIRS",
+    5: "EM_TILT_SERIES",
+    20: "MULTIPOSITION",
+    8000: "PUPIL_FUNCTION",
+}
+
+
+def _normalize_chunks(
+    chunks: DaskChunks, sizes: dict[str, int], itemsize: int
+) -> tuple[tuple[int, ...], ...]:
+    """Convert a `DVFile.to_dask` chunks argument to explicit dask chunks."""
+    shape = tuple(sizes.values())
+    default = tuple(1 if k in "TCZ" else v for k, v in sizes.items())
+    block: tuple[int | None, ...]
+    if chunks is None:
+        block = default
+    elif isinstance(chunks, Mapping):
+        unknown = set(chunks) - set(sizes)
+        if unknown:
+            raise ValueError(f"Unknown dimension(s) in chunks: {unknown}")
+        block = tuple(chunks.get(k, d) for k, d in zip(sizes, default))
+    elif isinstance(chunks, int):
+        block = (chunks,) * len(shape)
+    elif isinstance(chunks, str):
+        block = _contiguous_block(shape, itemsize, _parse_bytes(chunks))
+    else:
+        if len(chunks) != len(shape):
+            raise ValueError(f"chunks must have length {len(shape)}, got {chunks}")
+        block = tuple(chunks)
+
+    out = []
+    for b, size in zip(block, shape):
+        b = size if b is None or b == -1 else min(b, size)
+        if b < 1:
+            raise ValueError(f"Invalid chunk size: {b}")
+        out.append((b,) * (size // b) + ((size % b,) if size % b else ()))
+    return tuple(out)
+
+
+def _parse_bytes(nbytes: str) -> int:
+    import dask
+    from dask.utils import parse_bytes
+
+    if nbytes == "auto":
+        nbytes = dask.config.get("array.chunk-size")
+    return parse_bytes(nbytes)
+
+
+def _contiguous_block(
+    shape: tuple[int, ...], itemsize: int, limit: int
+) -> tuple[int, ...]:
+    """Largest block shape under `limit` bytes that is contiguous in a C-order file.
+
+    Dimensions are filled from the last (X) outwards: a dimension is only split
+    once all faster-varying dimensions are whole, and all slower-varying
+    dimensions then get a chunk size of 1.
+    """
+    block = list(shape)
+    nbytes = itemsize
+    for i in reversed(range(len(shape))):
+        if nbytes * shape[i] > limit:
+            block[i] = max(1, limit // nbytes)
+            block[:i] = [1] * i
+            break
+        nbytes *= shape[i]
+    return tuple(block)
+
+
+def _read_header(fh: BinaryIO) -> tuple[str, Header, bytes] | None:
+    """Read the 1024-byte header with a single read.
+
+    Returns (byte_order, header, title), or None if `fh` is not a DV file.
+    """
+    fh.seek(0)
+    return _parse_header(fh.read(LE_HDR.size))
+
+
+def _parse_header(buf: bytes) -> tuple[str, Header, bytes] | None:
+    """Parse a 1024-byte header.  Returns None if `buf` is not a DV header."""
+    byte_order = _BYTE_ORDERS.get(buf[24 * 4 : 24 * 4 + 2])
+    if byte_order is None or len(buf) < LE_HDR.size:
+        return None
+    strct = LE_HDR if byte_order == "<" else BE_HDR
+    *r, title = strct.unpack(buf)
+    return byte_order, Header(*r), title
+
+
+_BYTE_ORDERS = {b"\xa0\xc0": "<", b"\xc0\xa0": ">"}
 
 
 def _byte_order(fh: BinaryIO) -> str | None:
     fh.seek(24 * 4)
-    dvid = fh.read(2)
-    if dvid == b"\xa0\xc0":
-        return "<"
-    if dvid == b"\xc0\xa0":
-        return ">"
-    return None  # pragma: no cover
+    return _BYTE_ORDERS.get(fh.read(2))
 
 
 class Voxel(NamedTuple):
@@ -289,13 +949,7 @@ class Header(NamedTuple):
 
     @property
     def sequence_order(self) -> str:
-        # note, these are reversed from the header readme,
-        # to reflect how numpy parses the memmap
-        return {
-            0: "CTZ",
-            1: "TZC",
-            2: "TCZ",
-        }.get(self.img_seq, "CTZ")
+        return SEQUENCE_ORDERS.get(self.img_seq, "CTZ")
 
     @property
     def nz(self) -> int:
@@ -303,17 +957,7 @@ class Header(NamedTuple):
 
     @property
     def image_type(self) -> str:
-        return {
-            0: "NORMAL",
-            100: "NORMAL",
-            1: "TILT_SERIES",
-            2: "STEREO_TILT_SERIES",
-            3: "AVERAGED_IMAGES",
-            4: "AVERAGED_STEREO_PAIRS",
-            5: "EM_TILT_SERIES",
-            20: "MULTIPOSITION",
-            8000: "PUPIL_FUNCTION",
-        }[self.img_type]
+        return IMAGE_TYPES[self.img_type]
 
     @property
     def lens(self) -> str:
@@ -343,28 +987,117 @@ class ExtHeaderFrame(NamedTuple):
 
 
 class ExtHeader:
-    def __init__(self, buf: bytes, hdr: Header) -> None:
+    """Extended header, as a structured array with one record per section.
+
+    Columns are available by name, shaped by the file's `sequence_order`:
+
+    >>> ext_hdr["timeStampSeconds"]  # e.g. shape (nc, nt, nz) for "CTZ"
+    """
+
+    def __init__(
+        self,
+        buf: bytes | memoryview,
+        hdr: Header,
+        byte_order: str = "=",
+        packed: bool = False,
+    ) -> None:
         self.buffer = buf
         self._hdr = hdr
-        self.n_frames = hdr.n_sections
-        self._section_length = (hdr.n_floats + hdr.n_ints) * 4
+        self._byte_order = byte_order
         self._order = hdr.sequence_order
-        self._shape = [getattr(hdr, f"n{i.lower()}") for i in hdr.sequence_order]
-        self._struct = struct.Struct(f"{hdr.n_ints}i{len(ExtHeaderFrame._fields)}f")
+        self._shape = tuple(max(getattr(hdr, f"n{i.lower()}"), 1) for i in self._order)
+        self.dtype = _ext_hdr_dtype(hdr.n_ints, hdr.n_floats, byte_order, packed)
+        n_frames = len(buf) // self.dtype.itemsize if self.dtype.itemsize else 0
+        self.n_frames = min(hdr.n_sections, n_frames)
+        self.array = np.frombuffer(buf, self.dtype, count=self.n_frames)
+
+    @classmethod
+    def from_packed(
+        cls, buf: bytes | memoryview, hdr: Header, byte_order: str = "="
+    ) -> ExtHeader:
+        """Unpack an extended header stored by `packed` (unnamed floats are 0)."""
+        packed = cls(buf, hdr, byte_order, packed=True).array
+        array = np.zeros(
+            len(packed), _ext_hdr_dtype(hdr.n_ints, hdr.n_floats, byte_order)
+        )
+        for name in packed.dtype.names or ():
+            array[name] = packed[name]
+        array.flags.writeable = False
+        return cls(array.view(np.uint8).data, hdr, byte_order)
+
+    def packed(self) -> np.ndarray:
+        """Return the records with only their named fields (see `from_packed`)."""
+        dtype = _ext_hdr_dtype(
+            self._hdr.n_ints, self._hdr.n_floats, self._byte_order, packed=True
+        )
+        return self.array.astype(dtype)
+
+    @property
+    def fields(self) -> tuple[str, ...]:
+        return self.dtype.names or ()
+
+    def __len__(self) -> int:
+        return self.n_frames
+
+    def __getitem__(self, key: str) -> np.ndarray:
+        """Return a (zero-copy) column, shaped by `sequence_order` if possible."""
+        col = self.array[key]
+        if self.n_frames == np.prod(self._shape):
+            return col.reshape(self._shape + col.shape[1:])
+        return col  # pragma: no cover
 
     def frame(self, idx: int) -> ExtHeaderFrame:
         if idx >= self.n_frames:  # pragma: no cover
             raise IndexError(f"index {idx} out of range for {self.n_frames} frames")
-        f = self._struct.unpack_from(self.buffer, self._section_length * idx)
-        return ExtHeaderFrame(*f[8:])
+        record = dict(zip(self.fields, self.array[idx].item()))
+        return ExtHeaderFrame(*(record.get(f, np.nan) for f in ExtHeaderFrame._fields))
 
     def _asdict(self) -> dict:
+        n = self.n_frames
+        columns = [
+            self.array[f].tolist() if f in self.fields else [np.nan] * n
+            for f in ExtHeaderFrame._fields
+        ]
+        coords = np.stack(np.unravel_index(np.arange(n), self._shape), axis=-1)
+        keys = ["".join(f"{x}{y}" for x, y in zip(self._order, c)) for c in coords]
         return {
-            "".join(
-                f"{x}{y}" for x, y in zip(self._order, np.unravel_index(i, self._shape))
-            ): self.frame(i)._asdict()
-            for i in range(self.n_frames)
+            key: dict(zip(ExtHeaderFrame._fields, values))
+            for key, values in zip(keys, zip(*columns))
+        }
+
+
+def _ext_hdr_dtype(
+    n_ints: int, n_floats: int, byte_order: str = "=", packed: bool = False
+) -> np.dtype:
+    """Structured dtype for one extended header section.
+
+    Sections hold `n_ints` 4-byte integers (as a single "ints" field) followed by
+    `n_floats` 4-byte floats, the first of which are named as in ExtHeaderFrame.
+    Any additional floats are left unnamed (padding), unless `packed`, in which
+    case they are dropped from the record.
+    """
+    n_ints, n_floats = max(n_ints, 0), max(n_floats, 0)
+    if packed:
+        n_floats = min(n_floats, len(ExtHeaderFrame._fields))
+    names: list[str] = []
+    formats: list[Any] = []
+    offsets: list[int] = []
+    if n_ints:
+        names.append("ints")
+        formats.append((f"{byte_order}i4", (n_ints,)))
+        offsets.append(0)
+    for i, name in enumerate(ExtHeaderFrame._fields[:n_floats]):
+        names.append(name)
+        formats.append(f"{byte_order}f4")
+        offsets.append(4 * (n_ints + i))
+    return np.dtype(
+        {
+            "names": names,
+            "formats": formats,
+            "offsets": offsets,
+            "itemsize": 4 * (n_ints + n_floats),
         }
+    )
 
 
 @overload
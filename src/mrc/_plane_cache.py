@@ -0,0 +1,177 @@
+"""In-process LRU cache of DV planes, shared by all files."""
+
+from __future__ import annotations
+
+import threading
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Any, Callable, NamedTuple
+
+import numpy as np
+
+from ._io import spans_planes, split_key
+
+if TYPE_CHECKING:
+    from ._io import Layout
+
+    PlaneKey = tuple[Layout, int]
+
+
+class CacheInfo(NamedTuple):
+    hits: int
+    misses: int
+    evictions: int
+    n_planes: int
+    nbytes: int
+    max_bytes: int
+
+
+class PlaneCache:
+    """Least-recently-used cache of whole planes, with a total byte budget.
+
+    Planes are keyed by file layout (path, shape, dtype, size and mtime, so that
+    entries of a file that changed are never used) and section index.  Cached
+    planes are read-only, and so are the arrays returned by `getitem`.
+
+    Parameters
+    ----------
+    max_bytes : int, optional
+        Maximum total size of the cached planes, by default 512 MiB.  Least
+        recently used planes are evicted to stay within it.
+    """
+
+    def __init__(self, max_bytes: int = 512 * 1024**2) -> None:
+        self._planes: OrderedDict[PlaneKey, np.ndarray] = OrderedDict()
+        self._lock = threading.Lock()
+        self._max_bytes = max_bytes
+        self._nbytes = 0
+        self._hits = self._misses = self._evictions = 0
+
+    @property
+    def max_bytes(self) -> int:
+        return self._max_bytes
+
+    @max_bytes.setter
+    def max_bytes(self, value: int) -> None:
+        with self._lock:
+            self._max_bytes = value
+            self._evict()
+
+    def cache_info(self) -> CacheInfo:
+        """Return hit, miss and eviction counts, and the current size."""
+        with self._lock:
+            return CacheInfo(
+                self._hits,
+                self._misses,
+                self._evictions,
+                len(self._planes),
+                self._nbytes,
+                self._max_bytes,
+            )
+
+    def cache_clear(self) -> None:
+        """Drop all planes and reset the counters."""
+        with self._lock:
+            self._planes.clear()
+            self._nbytes = 0
+            self._hits = self._misses = self._evictions = 0
+
+    def __contains__(self, key: PlaneKey) -> bool:
+        with self._lock:
+            return key in self._planes
+
+    def get(self, key: PlaneKey) -> np.ndarray | None:
+        with self._lock:
+            plane = self._planes.get(key)
+            if plane is None:
+                self._misses += 1
+            else:
+                self._hits += 1
+                self._planes.move_to_end(key)
+            return plane
+
+    def put(self, key: PlaneKey, plane: np.ndarray) -> None:
+        plane.flags.writeable = False
+        with self._lock:
+            if plane.nbytes > self._max_bytes or key in self._planes:
+                return
+            self._planes[key] = plane
+            self._nbytes += plane.nbytes
+            self._evict()
+
+    def _evict(self) -> None:
+        while self._nbytes > self._max_bytes:
+            _, plane = self._planes.popitem(last=False)
+            self._nbytes -= plane.nbytes
+            self._evictions += 1
+
+    def read_sections(
+        self,
+        layout: Layout,
+        sections: np.ndarray,
+        read: Callable[[np.ndarray], np.ndarray],
+    ) -> np.ndarray:
+        """Return the planes of (flat) `sections`, reading missing ones with `read`.
+
+        `read` is called (once) with the sorted, unique sections that are not
+        cached, and must return their planes.  The result has shape
+        ``sections.shape + plane_shape``.  For a single (0-d) section, it is the
+        cached plane itself.
+        """
+        flat = sections.ravel().tolist()
+        found = {s: self.get((layout, s)) for s in dict.fromkeys(flat)}
+        missing = [s for s, plane in found.items() if plane is None]
+        if missing:
+            missing.sort()
+            for s, plane in zip(missing, read(np.asarray(missing, np.intp))):
+                self.put((layout, s), plane)
+                found[s] = plane
+        if sections.ndim == 0:
+            return found[flat[0]]  # type: ignore [return-value]
+        out = np.empty((len(flat), *layout.shape[-2:]), layout.dtype)
+        for i, s in enumerate(flat):
+            out[i] = found[s]
+        out = out.reshape(sections.shape + out.shape[1:])
+        out.flags.writeable = False
+        return out
+
+    def prefetch(
+        self,
+        layout: Layout,
+        sections: np.ndarray,
+        read: Callable[[np.ndarray], np.ndarray],
+    ) -> None:
+        """Read and cache the planes of `sections` that are not cached.
+
+        Unlike `read_sections`, this doesn't count hits or misses.
+        """
+        missing = [s for s in sections.ravel().tolist() if (layout, s) not in self]
+        if missing:
+            for s, plane in zip(missing, read(np.asarray(missing, np.intp))):
+                self.put((layout, s), plane)
+
+    def getitem(
+        self, layout: Layout, key: Any, read: Callable[[np.ndarray], np.ndarray]
+    ) -> np.ndarray:
+        """Index the file with `layout` (like a numpy array), through the cache.
+
+        `read` reads planes, as in `read_sections`.
+        """
+        shape = layout.shape
+        sections = np.arange(int(np.prod(shape[:-2])))
+        plane_key, yx_key = split_key(key, len(shape))
+        if spans_planes(plane_key, yx_key):
+            # indices that broadcast across the plane and YX dimensions (uncached)
+            out: np.ndarray = read(sections).reshape(shape)[key]
+            out.flags.writeable = False
+            return out
+        sections = sections.reshape(shape[:-2])[plane_key]
+        planes = self.read_sections(layout, sections, read)
+        if all(k == slice(None) for k in yx_key):
+            return planes
+        out = planes[(Ellipsis, *yx_key)]
+        out.flags.writeable = False
+        return out
+
+
+# the cache shared by all files opened with `cache_planes=True`
+plane_cache = PlaneCache()
@@ -0,0 +1,123 @@
+"""Background prefetching of planes for sequential or strided access."""
+
+from __future__ import annotations
+
+import mmap
+import threading
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable
+
+import numpy as np
+
+from ._io import coalesce
+
+# number of recent accesses used to detect a pattern (two equal strides)
+_HISTORY = 3
+
+
+class Prefetcher:
+    """Detect a sequential or strided pattern in plane reads, and fetch ahead.
+
+    Each call to `observe` records the (flat) sections of one read.  Once the
+    first sections of the last three reads are equally spaced (a non-zero
+    stride), the same selection shifted by up to `depth` strides ahead is passed
+    to `fetch`, on a background thread.  Sections already requested are skipped.
+    Any other access (random, or a new stride) cancels pending fetches.
+
+    Parameters
+    ----------
+    fetch : Callable[[np.ndarray], None]
+        Called with the (sorted, unique) sections to fetch.
+    n_sections : int
+        Number of sections in the file.
+    depth : int
+        Number of reads ahead to prefetch.
+    """
+
+    def __init__(
+        self, fetch: Callable[[np.ndarray], None], n_sections: int, depth: int
+    ) -> None:
+        self._fetch = fetch
+        self._n_sections = n_sections
+        self.depth = depth
+        self._history: deque[int] = deque(maxlen=_HISTORY)
+        self._stride = 0
+        self._requested: set[int] = set()
+        self._futures: list[Future] = []
+        self._executor: ThreadPoolExecutor | None = None
+        self._lock = threading.Lock()
+
+    def observe(self, sections: np.ndarray) -> None:
+        if not sections.size or self.depth < 1:
+            return
+        with self._lock:
+            self._history.append(int(sections.flat[0]))
+            if len(self._history) < _HISTORY:
+                return
+            strides = np.diff(self._history)
+            stride = int(strides[-1])
+            if stride == 0 or np.any(strides != stride):
+                self._cancel()
+                return
+            if stride != self._stride:
+                self._cancel()
+                self._stride = stride
+
+            ahead = []
+            for i in range(1, self.depth + 1):
+                shifted = sections.ravel() + i * stride
+                if shifted.min() < 0 or shifted.max() >= self._n_sections:
+                    break
+                ahead.extend(shifted.tolist())
+            new = sorted(set(ahead) - self._requested)
+            if not new:
+                return
+            if len(self._requested) > 8 * self.depth * sections.size:
+                self._requested.clear()  # keep the set bounded
+            self._requested.update(new)
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(1, thread_name_prefix="prefetch")
+            self._futures = [f for f in self._futures if not f.done()]
+            self._futures.append(
+                self._executor.submit(self._fetch, np.asarray(new, np.intp))
+            )
+
+    def _cancel(self) -> None:
+        for future in self._futures:
+            future.cancel()
+        self._futures.clear()
+        self._requested.clear()
+        self._stride = 0
+
+    def join(self) -> None:
+        """Wait for pending fetches to finish (re-raising any error)."""
+        for future in list(self._futures):
+            if not future.cancelled():
+                future.result()
+
+    def close(self) -> None:
+        """Cancel pending fetches, and wait for the running one to finish."""
+        with self._lock:
+            self._cancel()
+            self._history.clear()
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+
+def madvise_willneed(
+    mm: mmap.mmap, mm_offset: int, offset: int, plane_bytes: int, sections: np.ndarray
+) -> None:
+    """Advise the kernel that the planes of `sections` will be needed soon.
+
+    `mm` maps the file from `mm_offset`, and plane 0 starts at file `offset`.
+    Does nothing where `madvise` is not available.
+    """
+    if not hasattr(mm, "madvise") or not hasattr(mmap, "MADV_WILLNEED"):
+        return  # pragma: no cover
+    for first, stop in coalesce(sections, plane_bytes):
+        start = offset + first * plane_bytes - mm_offset
+        aligned = start - start % mmap.PAGESIZE
+        length = (stop - first) * plane_bytes + start - aligned
+        mm.madvise(mmap.MADV_WILLNEED, aligned, min(length, len(mm) - aligned))
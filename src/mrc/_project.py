@@ -0,0 +1,253 @@
+"""Streaming reductions of a DV file along one of its T, C or Z dimensions."""
+
+from __future__ import annotations
+
+import os
+from collections.abc import Iterator
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import TYPE_CHECKING, Any, Callable, Sequence
+
+import numpy as np
+
+if TYPE_CHECKING:
+    from ._new import DVFile
+
+# planes are read (in file order) in blocks of (at most) this many bytes
+PROJECT_BLOCK_BYTES = 16 * 1024 * 1024
+OPS = ("max", "min", "sum", "mean", "argmax", "argmin")
+ROLLING_OPS = ("mean", "median", "sum", "max", "min")
+
+
+def _total_dtype(dtype: np.dtype) -> type:
+    """Dtype of running sums of planes of `dtype`."""
+    acc = {"u": np.uint64, "i": np.int64, "c": np.complex128}.get(dtype.kind)
+    return acc or np.float64
+
+
+def _result_dtype(op: str, dtype: np.dtype) -> np.dtype:
+    """Dtype of numpy's `op` reduction of an array of `dtype`."""
+    if op == "sum":
+        total: np.ndarray = np.sum(np.zeros(1, dtype), keepdims=True)
+        return total.dtype
+    if op in ("mean", "median"):
+        return np.mean(np.zeros(1, dtype)).dtype
+    return dtype
+
+
+def _groups(
+    file: DVFile, dim: str
+) -> tuple[tuple[int, ...], np.ndarray, np.ndarray, tuple[np.ndarray, ...]]:
+    """Map each section (in file order) to a group of planes along `dim`.
+
+    Returns the lead shape of the file without `dim`, and for each section: its
+    (flat) group in that shape, its position along `dim`, and its coordinates.
+    """
+    lead = file.axes[:-2]
+    if dim not in lead:
+        raise ValueError(f"dim must be one of {tuple(lead)}, got {dim!r}")
+    lead_shape = file.shape[:-2]
+    axis = lead.index(dim)
+    out_lead = lead_shape[:axis] + lead_shape[axis + 1 :]
+    coords = np.unravel_index(np.arange(int(np.prod(lead_shape))), lead_shape)
+    group_of = np.ravel_multi_index(coords[:axis] + coords[axis + 1 :], out_lead)
+    return out_lead, group_of, coords[axis], coords
+
+
+class _Accumulator:
+    """Running reductions of groups of planes, one (Y, X) result per group."""
+
+    def __init__(
+        self, ops: Sequence[str], n_groups: int, plane_shape: tuple, dtype: np.dtype
+    ) -> None:
+        shape = (n_groups, *plane_shape)
+        self.best: dict[str, np.ndarray] = {}  # running max and/or min
+        self.index: dict[str, np.ndarray] = {}  # position of the max/min
+        for extreme in ("max", "min"):
+            if extreme in ops or f"arg{extreme}" in ops:
+                self.best[extreme] = np.empty(shape, dtype)
+            if f"arg{extreme}" in ops:
+                self.index[extreme] = np.zeros(shape, np.intp)
+        self.total: np.ndarray | None = None
+        if "sum" in ops or "mean" in ops:
+            self.total = np.zeros(shape, _total_dtype(dtype))
+
+    def add(self, group: int, k: int, plane: np.ndarray, mask: np.ndarray) -> None:
+        """Add `plane`, the `k`-th along the projected dimension of `group`."""
+        for extreme, best in self.best.items():
+            current = best[group]
+            if k == 0:
+                current[...] = plane
+                continue
+            if extreme not in self.index:
+                ufunc = np.maximum if extreme == "max" else np.minimum
+                ufunc(current, plane, out=current)
+                continue
+            # strict comparison: the first position wins ties, as in np.argmax
+            compare = np.greater if extreme == "max" else np.less
+            compare(plane, current, out=mask)
+            np.copyto(current, plane, where=mask)
+            np.copyto(self.index[extreme][group], k, where=mask)
+        if self.total is not None:
+            np.add(self.total[group], plane, out=self.total[group])
+
+    def result(self, op: str, count: int, dtype: np.dtype) -> np.ndarray:
+        """Result of `op` over `count` planes of `dtype`, as numpy would return."""
+        if op in ("max", "min"):
+            return self.best[op]
+        if op in ("argmax", "argmin"):
+            return self.index[op[3:]]
+        assert self.total is not None
+        total = self.total if op == "sum" else self.total / count
+        return total.astype(_result_dtype(op, dtype))
+
+
+def stream_sections(
+    file: DVFile,
+    group_of: np.ndarray,
+    reduce: Callable[[np.ndarray, int, Sequence[int]], None],
+    max_workers: int | None = None,
+) -> None:
+    """Read each plane of `file` once, in file order, and reduce it on a pool.
+
+    Planes are read in blocks of (at most) `PROJECT_BLOCK_BYTES`, and the next
+    block is read while the previous one is reduced.  `reduce(planes, start,
+    sections)` is called with a block (whose first section is `start`) and some
+    of its sections.  All sections of the same `group_of[section]` go to one
+    call, so each group is reduced by one thread at a time, in file order.
+    """
+    n_sections = len(group_of)
+    plane_bytes = int(np.prod(file.shape[-2:])) * file.dtype.itemsize
+    block = max(1, PROJECT_BLOCK_BYTES // plane_bytes)
+    n_workers = max_workers or os.cpu_count() or 1
+    pool = ThreadPoolExecutor(n_workers) if n_workers > 1 else None
+    try:
+        pending: list[Future] = []
+        for start in range(0, n_sections, block):
+            stop = min(start + block, n_sections)
+            planes = file._read_sections(np.arange(start, stop))
+            for future in pending:
+                future.result()
+            if pool is None:
+                reduce(planes, start, range(start, stop))
+                continue
+            tasks: list[list[int]] = [[] for _ in range(n_workers)]
+            for s in range(start, stop):
+                tasks[int(group_of[s]) % n_workers].append(s)
+            pending = [pool.submit(reduce, planes, start, t) for t in tasks if t]
+        for future in pending:
+            future.result()
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+
+def project(
+    file: DVFile,
+    dim: str = "Z",
+    op: str | Sequence[str] = "max",
+    dtype: Any = None,
+    max_workers: int | None = None,
+) -> np.ndarray | tuple[np.ndarray, ...]:
+    """Project `file` along `dim`, in one streaming pass (see `DVFile.project`)."""
+    ops = (op,) if isinstance(op, str) else tuple(op)
+    for o in ops:
+        if o not in OPS:
+            raise ValueError(f"op must be one of {OPS}, got {o!r}")
+    out_lead, group_of, k_of, _ = _groups(file, dim)
+    plane_shape = file.shape[-2:]
+    acc = _Accumulator(ops, int(np.prod(out_lead)), plane_shape, file.dtype)
+
+    def _reduce(planes: np.ndarray, start: int, sections: Sequence[int]) -> None:
+        mask = np.empty(plane_shape, bool)
+        for s in sections:
+            acc.add(int(group_of[s]), int(k_of[s]), planes[s - start], mask)
+
+    stream_sections(file, group_of, _reduce, max_workers)
+    results = []
+    for o in ops:
+        result = acc.result(o, file.sizes[dim], file.dtype)
+        result = result.reshape(out_lead + plane_shape)
+        results.append(result if dtype is None else result.astype(dtype, copy=False))
+    return results[0] if isinstance(op, str) else tuple(results)
+
+
+class _Window:
+    """The last `window` planes of one group, in a ring buffer, and their sum."""
+
+    def __init__(
+        self, window: int, plane_shape: tuple, dtype: np.dtype, total: bool
+    ) -> None:
+        self.planes = np.empty((window, *plane_shape), dtype)
+        self.total = np.zeros(plane_shape, _total_dtype(dtype)) if total else None
+
+    def push(self, k: int, plane: np.ndarray) -> None:
+        """Add `plane`, the `k`-th along the rolling dimension."""
+        slot = k % len(self.planes)
+        if self.total is not None:
+            if k >= len(self.planes):
+                self.total -= self.planes[slot]
+            self.total += plane
+        self.planes[slot] = plane
+
+    def result(self, op: str, dtype: np.dtype) -> np.ndarray:
+        """Result of `op` over the window, as a new array of `dtype`."""
+        result: np.ndarray
+        if op in ("max", "min", "median"):
+            result = getattr(np, op)(self.planes, axis=0)
+            return result.astype(dtype, copy=False)
+        assert self.total is not None
+        result = self.total if op == "sum" else self.total / len(self.planes)
+        return result.astype(dtype)
+
+
+def _read_blocks(file: DVFile) -> Iterator[np.ndarray]:
+    """Read all planes of `file` in file order, in blocks, reading one ahead."""
+    n_sections = int(np.prod(file.shape[:-2]))
+    plane_bytes = int(np.prod(file.shape[-2:])) * file.dtype.itemsize
+    block = max(1, PROJECT_BLOCK_BYTES // plane_bytes)
+    with ThreadPoolExecutor(1) as pool:
+        pending: Future | None = None
+        for start in range(0, n_sections, block):
+            sections = np.arange(start, min(start + block, n_sections))
+            future = pool.submit(file._read_sections, sections)
+            if pending is not None:
+                yield pending.result()
+            pending = future
+        if pending is not None:
+            yield pending.result()
+
+
+def rolling(
+    file: DVFile,
+    dim: str = "T",
+    window: int = 3,
+    op: str = "mean",
+    dtype: Any = None,
+) -> Iterator[tuple[tuple[int, ...], np.ndarray]]:
+    """Sliding-window reduction of `file` along `dim` (see `DVFile.rolling`)."""
+    if op not in ROLLING_OPS:
+        raise ValueError(f"op must be one of {ROLLING_OPS}, got {op!r}")
+    _, group_of, k_of, coords = _groups(file, dim)
+    size = file.sizes[dim]
+    if not 1 <= window <= size:
+        raise ValueError(f"window must be between 1 and {size}, got {window}")
+    axis = file.axes.index(dim)
+    out_dtype = np.dtype(dtype) if dtype is not None else _result_dtype(op, file.dtype)
+
+    # windows of the groups in progress (all of them, if `dim` varies slowest)
+    windows: dict[int, _Window] = {}
+    s = 0
+    for planes in _read_blocks(file):
+        for plane in planes:
+            group, k = int(group_of[s]), int(k_of[s])
+            if group not in windows:
+                total = op in ("sum", "mean")
+                windows[group] = _Window(window, plane.shape, file.dtype, total)
+            windows[group].push(k, plane)
+            if k >= window - 1:
+                index = [int(c[s]) for c in coords]
+                index[axis] = k - window + 1
+                yield tuple(index), windows[group].result(op, out_dtype)
+            if k == size - 1:
+                del windows[group]
+            s += 1
@@ -0,0 +1,155 @@
+"""Intensity ranges of a DV file, from its stored statistics where possible."""
+
+from __future__ import annotations
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, NamedTuple
+
+import numpy as np
+
+from ._histogram import header_ranges
+from ._project import PROJECT_BLOCK_BYTES
+
+if TYPE_CHECKING:
+    from ._new import DVFile
+
+_STAT_FIELDS = ("minInten", "maxInten", "meanInten")
+
+
+class IntensityRanges(NamedTuple):
+    """Intensity ranges of a DV file, per channel and per plane.
+
+    Attributes
+    ----------
+    channels : np.ndarray
+        Min and max of each channel, shape ``(sizes["C"], 2)``.
+    planes : np.ndarray
+        Min and max of each plane, shape ``shape[:-2] + (2,)``.
+    means : np.ndarray
+        Mean of each plane, shape ``shape[:-2]``.
+    n_scanned : int
+        Number of planes whose pixels were read, because their stored
+        statistics were missing or invalid.
+
+    Values that are not stored and were not scanned are NaN.
+    """
+
+    channels: np.ndarray
+    planes: np.ndarray
+    means: np.ndarray
+    n_scanned: int
+
+
+def _plausible(stats: np.ndarray, dtype: np.dtype) -> np.ndarray:
+    """Which rows of (n, 3) min, max, mean `stats` look like real statistics.
+
+    Rows are rejected if min or max are not finite, out of order (the mean, if
+    finite, must lie between them), outside the range of integer `dtype`, or
+    all zero (as left by writers that don't fill them in).
+    """
+    lo, hi, mean = stats.T
+    with np.errstate(invalid="ignore"):
+        ok: np.ndarray = np.isfinite(lo) & np.isfinite(hi) & (lo <= hi)
+        ok &= ~np.isfinite(mean) | ((lo <= mean) & (mean <= hi))
+        if dtype.kind in "ui":
+            info = np.iinfo(dtype)
+            ok &= (lo >= info.min) & (hi <= info.max)
+    ok &= (lo != 0) | (hi != 0) | (np.isfinite(mean) & (mean != 0))
+    return ok
+
+
+def _header_ranges(file: DVFile) -> np.ndarray:
+    """Per-wave min and max of the header, shape ``(sizes["C"], 2)``.
+
+    Ranges left at the defaults of `mrc.init_simple` count as unset (NaN).
+    """
+    ranges = header_ranges(file)
+    stats = np.column_stack([ranges, np.full(len(ranges), np.nan)])
+    ranges[~_plausible(stats, file.dtype)] = np.nan
+    return ranges
+
+
+def _channel_ranges(file: DVFile, stats: np.ndarray, known: np.ndarray) -> np.ndarray:
+    """Min and max of each channel whose planes all have `known` `stats`."""
+    lead_shape = file.shape[:-2]
+    c_axis = file.axes.index("C")
+    stats = np.moveaxis(stats.reshape(*lead_shape, 3), c_axis, 0)
+    stats = stats.reshape(file.sizes["C"], -1, 3)
+    known = np.moveaxis(known.reshape(lead_shape), c_axis, 0)
+    complete = np.all(known.reshape(file.sizes["C"], -1), axis=1)
+    ranges = np.full((len(stats), 2), np.nan)
+    ranges[complete] = np.column_stack(
+        [stats[complete, :, 0].min(axis=1), stats[complete, :, 1].max(axis=1)]
+    )
+    return ranges
+
+
+def _scan(file: DVFile, sections: np.ndarray, max_workers: int | None) -> np.ndarray:
+    """Read the planes of (sorted) `sections`, and return their min, max, mean.
+
+    Complex data is reduced by magnitude.
+    """
+    plane_bytes = int(np.prod(file.shape[-2:])) * file.dtype.itemsize
+    block = max(1, PROJECT_BLOCK_BYTES // plane_bytes)
+    chunks = [sections[i : i + block] for i in range(0, len(sections), block)]
+
+    def _stats(chunk: np.ndarray) -> np.ndarray:
+        planes = file._read_sections(chunk).reshape(len(chunk), -1)
+        if planes.dtype.kind == "c":
+            planes = np.abs(planes)
+        return np.column_stack(
+            [planes.min(axis=1), planes.max(axis=1), planes.mean(axis=1)]
+        )
+
+    n_workers = min(max_workers or os.cpu_count() or 1, len(chunks))
+    if n_workers <= 1:
+        return np.concatenate([_stats(chunk) for chunk in chunks])
+    with ThreadPoolExecutor(n_workers) as pool:
+        return np.concatenate(list(pool.map(_stats, chunks)))
+
+
+def intensity_ranges(
+    file: DVFile,
+    per_plane: bool = True,
+    scan: bool = True,
+    max_workers: int | None = None,
+) -> IntensityRanges:
+    """Intensity ranges of `file` (see `DVFile.intensity_ranges`)."""
+    lead_shape = file.shape[:-2]
+    n_sections = int(np.prod(lead_shape))
+    stats = np.full((n_sections, 3), np.nan)
+    known = np.zeros(n_sections, bool)
+    ext = file.ext_hdr
+    if ext is not None and len(ext) == n_sections and "minInten" in ext.fields:
+        stored = np.column_stack(
+            [
+                ext.array[f] if f in ext.fields else np.full(n_sections, np.nan)
+                for f in _STAT_FIELDS
+            ]
+        ).astype(float)
+        known = _plausible(stored, file.dtype)
+        stats[known] = stored[known]
+
+    channels = _channel_ranges(file, stats, known)
+    from_header = np.isnan(channels[:, 0])
+    channels[from_header] = _header_ranges(file)[from_header]
+
+    # planes of channels without a range, and (if per_plane) all unknown planes
+    c_of = np.unravel_index(np.arange(n_sections), lead_shape)[file.axes.index("C")]
+    missing = ~known & (per_plane | np.isnan(channels[c_of, 0]))
+    n_scanned = 0
+    if scan and missing.any():
+        sections = np.flatnonzero(missing)
+        stats[sections] = _scan(file, sections, max_workers)
+        known |= missing
+        n_scanned = len(sections)
+        unknown = np.isnan(channels[:, 0])
+        channels[unknown] = _channel_ranges(file, stats, known)[unknown]
+
+    return IntensityRanges(
+        channels,
+        stats[:, :2].reshape(*lead_shape, 2),
+        stats[:, 2].reshape(lead_shape),
+        n_scanned,
+    )
@@ -0,0 +1,201 @@
+"""Fast, header-only scanning of many DV files."""
+
+from __future__ import annotations
+
+import glob
+import os
+import re
+from collections.abc import Iterator, Sequence
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from pathlib import Path
+
+import numpy as np
+
+from ._new import (
+    HDR_FORMAT,
+    IMAGE_TYPES,
+    LE_HDR,
+    PIXEL_TYPES,
+    SEQUENCE_ORDERS,
+    Header,
+)
+
+# number of files whose headers are held in memory (and parsed) at once
+_SCAN_BATCH = 8192
+# number of files read by each task submitted to the thread pool
+_TASK_SIZE = 64
+_HDR_SIZE = LE_HDR.size
+# offset of the byte-order stamp (the `nblank` field) in the header
+_STAMP = 24 * 4
+
+
+def header_dtype(byte_order: str = "<") -> np.dtype:
+    """Structured dtype equivalent to `HDR_FORMAT`, with `Header` field names.
+
+    Records have the same 1024-byte (unaligned) layout as the struct, with an
+    additional "title" field for the trailing 800 bytes.
+    """
+    codes = {"i": "i4", "f": "f4", "h": "i2"}
+    formats: list[str] = []
+    for count, code in re.findall(r"(\d*)([a-z])", HDR_FORMAT):
+        n = int(count or 1)
+        if code == "s":
+            formats.append(f"S{n}")
+        else:
+            formats.extend([f"{byte_order}{codes[code]}"] * n)
+    return np.dtype({"names": [*Header._fields, "title"], "formats": formats})
+
+
+def scan(
+    paths: str | Path | Sequence[str | Path],
+    *,
+    workers: int | None = None,
+    recursive: bool = False,
+) -> np.ndarray:
+    """Read the headers of many DV files into a table.
+
+    Only the first 1024 bytes of each file are read (no memmap, extended header
+    or second open), from a pool of threads, and all headers of the same byte
+    order are parsed at once with `header_dtype`.
+
+    Parameters
+    ----------
+    paths : str | Path | Sequence[str | Path]
+        A directory (all files in it are scanned), a glob pattern, or a sequence
+        of file paths.
+    workers : int, optional
+        Number of threads reading headers.  By default, the `ThreadPoolExecutor`
+        default.  Use 1 to read in the calling thread.
+    recursive : bool, optional
+        Whether to also scan subdirectories, if `paths` is a directory.
+
+    Returns
+    -------
+    np.ndarray
+        A structured array with one record per DV file, in order of `paths`
+        (sorted, for a directory or glob).  Files that are not DV files (or
+        could not be read) are omitted.  Fields are "path", "byte_order",
+        "dtype", "axes", the sizes "T", "C", "Z", "Y", "X", voxel size "dx",
+        "dy", "dz", "lens_num", wavelengths "wave1" ... "wave5", "img_type",
+        "image_type", and "ext_hdr_len".  Use `pandas.DataFrame(result)` for a
+        DataFrame.
+
+    Examples
+    --------
+    >>> table = scan("/data/experiment", recursive=True, workers=16)
+    >>> table[table["C"] > 1]["path"]
+    """
+    if isinstance(paths, (str, Path)):
+        if os.path.isdir(paths):
+            files = sorted(_iter_files(os.fspath(paths), recursive))
+        else:
+            files = sorted(glob.glob(os.fspath(paths)))
+    else:
+        files = [os.fspath(p) for p in paths]
+
+    workers = workers or min(32, (os.cpu_count() or 1) + 4)
+    dtype = _scan_dtype(max(map(len, files), default=1))
+    batches = [np.zeros(0, dtype)]
+    with ThreadPoolExecutor(workers) as executor:
+        for start in range(0, len(files), _SCAN_BATCH):
+            batch = files[start : start + _SCAN_BATCH]
+            raw = np.zeros((len(batch), _HDR_SIZE), np.uint8)
+            tasks = range(0, len(batch), _TASK_SIZE)
+            if workers == 1:
+                ok = [_read_headers(batch, raw, i) for i in tasks]
+            else:
+                read = partial(_read_headers, batch, raw)
+                ok = list(executor.map(read, tasks))
+            batches.append(_parse(batch, raw, np.concatenate(ok), dtype))
+    return np.concatenate(batches)
+
+
+def _iter_files(path: str, recursive: bool) -> Iterator[str]:
+    with os.scandir(path) as entries:
+        for entry in entries:
+            if entry.is_file():
+                yield entry.path
+            elif recursive and entry.is_dir(follow_symlinks=False):
+                yield from _iter_files(entry.path, recursive)
+
+
+def _read_headers(paths: list[str], raw: np.ndarray, start: int) -> np.ndarray:
+    """Read the first bytes of `paths[start:start + _TASK_SIZE]` into rows of `raw`.
+
+    Returns a boolean array of which files were read completely.
+    """
+    stop = min(start + _TASK_SIZE, len(paths))
+    ok = np.zeros(stop - start, bool)
+    for i in range(start, stop):
+        try:
+            with open(paths[i], "rb", buffering=0) as fh:
+                ok[i - start] = fh.readinto(raw[i]) == _HDR_SIZE
+        except OSError:
+            pass
+    return ok
+
+
+def _parse(
+    paths: list[str], raw: np.ndarray, ok: np.ndarray, dtype: np.dtype
+) -> np.ndarray:
+    """Convert raw headers (rows of `raw`) to scan records."""
+    stamp = raw[:, _STAMP : _STAMP + 2]
+    little = ok & (stamp[:, 0] == 0xA0) & (stamp[:, 1] == 0xC0)
+    big = ok & (stamp[:, 0] == 0xC0) & (stamp[:, 1] == 0xA0)
+    valid = little | big
+    n = int(valid.sum())
+    out = np.zeros(n, dtype)
+    if not n:
+        return out
+
+    # parse each byte order in bulk, and convert to native order
+    hdr = np.empty(len(raw), header_dtype("="))
+    for mask, byte_order in ((little, "<"), (big, ">")):
+        if mask.any():
+            hdr[mask] = raw[mask].view(header_dtype(byte_order))[:, 0]
+    hdr = hdr[valid]
+
+    out["path"] = np.asarray(paths)[valid]
+    out["byte_order"] = np.where(little[valid], "<", ">")
+    out["dtype"] = [
+        f"{o}{PIXEL_TYPES[p]}" if p in PIXEL_TYPES else ""
+        for o, p in zip(out["byte_order"], hdr["pixel_type"].tolist())
+    ]
+    out["axes"] = [
+        f"{SEQUENCE_ORDERS.get(s, 'CTZ')}YX" for s in hdr["img_seq"].tolist()
+    ]
+    nt, nc = hdr["nt"].astype(np.int64), hdr["nc"].astype(np.int64)
+    out["T"], out["C"] = nt, nc
+    out["Z"] = hdr["n_sections"] // np.maximum(nc, 1) // np.maximum(nt, 1)
+    out["Y"], out["X"] = hdr["height"], hdr["width"]
+    for name in ("dx", "dy", "dz", "lens_num", "img_type", "ext_hdr_len"):
+        out[name] = hdr[name]
+    for i in range(1, 6):
+        out[f"wave{i}"] = hdr[f"wave{i}"]
+    out["image_type"] = [IMAGE_TYPES.get(t, "") for t in hdr["img_type"].tolist()]
+    return out
+
+
+def _scan_dtype(path_len: int) -> np.dtype:
+    return np.dtype(
+        [
+            ("path", f"U{path_len}"),
+            ("byte_order", "U1"),
+            ("dtype", "U3"),
+            ("axes", "U5"),
+            ("T", "i4"),
+            ("C", "i4"),
+            ("Z", "i4"),
+            ("Y", "i4"),
+            ("X", "i4"),
+            ("dx", "f4"),
+            ("dy", "f4"),
+            ("dz", "f4"),
+            ("lens_num", "i2"),
+            *((f"wave{i}", "i2") for i in range(1, 6)),
+            ("img_type", "i2"),
+            ("image_type", f"U{max(map(len, IMAGE_TYPES.values()))}"),
+            ("ext_hdr_len", "i4"),
+        ]
+    )
@@ -0,0 +1,444 @@
+"""Preallocated DV files, written region by region (e.g. by `dask.array.store`)."""
+
+from __future__ import annotations
+
+import contextlib
+import io
+import operator
+import os
+import threading
+import warnings
+from collections.abc import Mapping
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+
+from ._io import split_key, writefrom
+from ._new import SEQUENCE_ORDERS, DVFile
+from ._writer import _resolve_sizes
+from .mrc import add_metadata, dtype2MrcMode, init_simple, makeHdrArray
+
+# statistics of the part of one section written by one assignment
+JOURNAL_RECORD = np.dtype(
+    [
+        ("section", "<i8"),
+        ("y0", "<i4"),
+        ("y1", "<i4"),
+        ("x0", "<i4"),
+        ("x1", "<i4"),
+        ("min", "<f8"),
+        ("max", "<f8"),
+        ("sum", "<f8"),
+    ]
+)
+_REGION = ["section", "y0", "y1", "x0", "x1"]
+_HDR_SIZE = 1024
+
+
+class DVStore:
+    """A preallocated DV file, written by assigning to regions of it.
+
+    The file is created (at its full size) on construction.  Any region can then
+    be assigned (``store[key] = values``, with integer or step-1 slice indices
+    for Y and X), which makes the store a target for `dask.array.store`.  Each
+    assignment is written with positional writes, so many threads, or processes
+    (a store can be pickled), can write concurrently.
+
+    The min/max/sum of the data of each assignment are appended to a journal next
+    to the file (``<path>.journal``), and merged into the header's min/max/mean
+    fields by `close`, which then removes the journal.  The statistics are those
+    of the assigned data only: a region that is assigned more than once counts
+    once, with its last values, but overlapping regions all count.  The journal
+    also records which planes have been written (see `filled`), so that a store
+    that was not closed (e.g. after a crash) can be reopened with `resume`.
+
+    Parameters
+    ----------
+    path : str | Path
+        Path of the file to create (overwritten if it exists).
+    sizes : Mapping[str, int]
+        Size of each dimension of the stored array, from slowest to fastest
+        varying (e.g. ``{"T": 100, "C": 2, "Z": 30, "Y": 2048, "X": 2048}``).  As
+        for `DVWriter`, the order of "T", "C" and "Z" must be consistent with one
+        of the DV sequence orders, and "Y" and "X" must be last.
+    dtype : np.dtype
+        Pixel data type (uint8, int16, uint16, int32, float32 or complex64).
+    metadata : dict, optional
+        Header fields to set, as in `mrc.save`.
+    preallocate : bool, optional
+        Whether to allocate the file's disk space up front (with
+        `posix_fallocate`, where supported), which avoids fragmentation when
+        planes are written out of order.  By default False: the file is sparse
+        until written.
+
+    Examples
+    --------
+    >>> store = DVStore("out.dv", dict(zip("TCZYX", arr.shape)), arr.dtype)
+    >>> da.store(arr, store, lock=False)
+    >>> store.close()
+    """
+
+    def __init__(
+        self,
+        path: str | Path,
+        sizes: Mapping[str, int],
+        dtype: Any,
+        *,
+        metadata: dict | None = None,
+        preallocate: bool = False,
+    ) -> None:
+        self._setup(path, sizes, dtype, _HDR_SIZE)
+        size = self._offset + self._sections.size * self._plane_bytes
+        with open(self.path, "wb") as fh:
+            fh.write(self._new_header(metadata)._array.tobytes())
+            fh.truncate(size)
+            if preallocate and hasattr(os, "posix_fallocate"):
+                with contextlib.suppress(OSError):  # e.g. unsupported by the fs
+                    os.posix_fallocate(fh.fileno(), 0, size)
+        open(self.journal_path, "wb").close()
+
+    def _setup(
+        self, path: str | Path, sizes: Mapping[str, int], dtype: Any, offset: int
+    ) -> None:
+        self.path = os.fspath(path)
+        self.dtype = np.dtype(dtype)
+        self.sequence_order, full = _resolve_sizes(sizes)
+        if None in full.values():
+            raise ValueError(f"All sizes of a DVStore must be known, got {sizes}")
+        self._full: dict[str, int] = {d: int(n or 0) for d, n in full.items()}
+        self.sizes = {d: int(n) for d, n in sizes.items()}
+        self.shape = tuple(self.sizes.values())
+        self._offset = offset
+        self._ny, self._nx = self.shape[-2:]
+        self._plane_bytes = self._ny * self._nx * self.dtype.itemsize
+        # section numbers of the planes, indexed like the stored array (dimensions
+        # missing from `sizes` have size 1, so they don't change the order)
+        self._sections = np.arange(int(np.prod(self.shape[:-2]))).reshape(
+            self.shape[:-2]
+        )
+        self._file: io.FileIO | None = None
+        self._journal: io.FileIO | None = None
+        self._lock = threading.Lock()
+        self._closed = False
+
+    @classmethod
+    def resume(
+        cls, path: str | Path, sizes: Mapping[str, int] | None = None
+    ) -> DVStore:
+        """Reopen a store that was not closed, to write more planes or `close` it.
+
+        The file's journal must still exist.  If given, `sizes` (as for
+        `DVStore`) must match the file's layout, and sets the store's shape.  By
+        default, the store has the dimensions of `DVFile`.
+        """
+        journal = f"{os.fspath(path)}.journal"
+        if not os.path.exists(journal):
+            raise FileNotFoundError(f"No journal to resume from: {journal!r}")
+        with DVFile(path, lazy=True) as f:
+            file_sizes, dtype, offset = f.sizes, f.dtype, f._data_offset
+        if not dtype.isnative:
+            raise ValueError("Only files in native byte order can be resumed.")
+        store = cls.__new__(cls)
+        store._setup(path, sizes or file_sizes, dtype.newbyteorder("="), offset)
+        # (the position of dimensions of size 1 doesn't change the layout)
+        if [(d, n) for d, n in store._full.items() if n != 1] != [
+            (d, n) for d, n in file_sizes.items() if n != 1
+        ]:
+            raise ValueError(f"sizes {sizes} don't match the file's: {file_sizes}")
+        return store
+
+    @property
+    def journal_path(self) -> str:
+        return f"{self.path}.journal"
+
+    @property
+    def ndim(self) -> int:
+        return len(self.shape)
+
+    @property
+    def closed(self) -> bool:
+        return self._closed
+
+    def __enter__(self) -> DVStore:
+        return self
+
+    def __exit__(self, exc_type: Any, *args: Any) -> None:
+        if exc_type is None:
+            self.close()
+        else:
+            self._release()  # keep the journal of what was written
+
+    def __getstate__(self) -> dict[str, Any]:
+        state = self.__dict__.copy()
+        state["_file"] = state["_journal"] = None
+        del state["_lock"]
+        return state
+
+    def __setstate__(self, state: dict[str, Any]) -> None:
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def _new_header(self, metadata: dict | None) -> Any:
+        hdr = makeHdrArray()
+        shape = (self._sections.size, self._ny, self._nx)
+        init_simple(hdr, dtype2MrcMode(self.dtype.type), shape)
+        hdr.ImgSequence = {v: k for k, v in SEQUENCE_ORDERS.items()}[
+            self.sequence_order
+        ]
+        hdr.NumWaves = self._full["C"]
+        hdr.NumTimes = self._full["T"]
+        if metadata is not None:
+            add_metadata(metadata, hdr)
+        return hdr
+
+    def _files(self) -> tuple[io.FileIO, io.FileIO]:
+        with self._lock:
+            if self._closed:
+                raise ValueError("Cannot write to a closed DVStore.")
+            if self._file is None or self._journal is None:
+                self._file = io.FileIO(self.path, "r+")
+                # appends of whole records are atomic, across processes
+                self._journal = io.FileIO(self.journal_path, "a")
+            return self._file, self._journal
+
+    def _release(self) -> None:
+        with self._lock:
+            for fh in (self._file, self._journal):
+                if fh is not None:
+                    fh.close()
+            self._file = self._journal = None
+
+    def write_plane(self, data: Any, t: int = 0, c: int = 0, z: int = 0) -> None:
+        """Write the (Y, X) plane at timepoint `t`, channel `c` and section `z`.
+
+        Planes can be written in any order, and from any number of threads.
+        """
+        coords = {"T": t, "C": c, "Z": z}
+        key = tuple(coords.pop(d) for d in self.sizes if d in coords)
+        for d, i in coords.items():
+            if i not in (0, -1):
+                raise IndexError(f"index {i} is out of bounds for {d} (size 1)")
+        self[key] = data
+
+    def __setitem__(self, key: Any, value: Any) -> None:
+        plane_key, (y_key, x_key) = split_key(key, self.ndim)
+        sections = self._sections[plane_key]
+        y0, y1, y_int = _bounds(y_key, self._ny)
+        x0, x1, x_int = _bounds(x_key, self._nx)
+        shape = (
+            *np.shape(sections),
+            *(() if y_int else (y1 - y0,)),
+            *(() if x_int else (x1 - x0,)),
+        )
+        data = np.broadcast_to(np.asarray(value, dtype=self.dtype), shape)
+        data = np.ascontiguousarray(data).reshape(-1, y1 - y0, x1 - x0)
+        flat = np.ravel(sections)
+        if not data.size:
+            return
+
+        file, journal = self._files()
+        itemsize = self.dtype.itemsize
+        if (y0, y1, x0, x1) == (0, self._ny, 0, self._nx):
+            # whole planes: one write per run of consecutive sections
+            breaks = np.flatnonzero(np.diff(flat) != 1) + 1
+            for lo, hi in zip((0, *breaks), (*breaks, len(flat))):
+                offset = self._offset + int(flat[lo]) * self._plane_bytes
+                writefrom(file, data[lo:hi].data, offset, self._lock)
+        else:
+            for i, s in enumerate(flat.tolist()):
+                offset = self._offset + s * self._plane_bytes
+                if (x0, x1) == (0, self._nx):  # whole rows are contiguous
+                    offset += y0 * self._nx * itemsize
+                    writefrom(file, data[i].data, offset, self._lock)
+                    continue
+                for r in range(y1 - y0):
+                    pos = offset + ((y0 + r) * self._nx + x0) * itemsize
+                    writefrom(file, data[i, r].data, pos, self._lock)
+
+        values = np.abs(data) if np.iscomplexobj(data) else data
+        values = values.reshape(len(data), -1)
+        records = np.zeros(len(flat), JOURNAL_RECORD)
+        records["section"] = flat
+        records["y0"], records["y1"], records["x0"], records["x1"] = y0, y1, x0, x1
+        records["min"] = values.min(axis=1)
+        records["max"] = values.max(axis=1)
+        records["sum"] = values.sum(axis=1, dtype=np.float64)
+        journal.write(records.tobytes())
+
+    def _records(self) -> np.ndarray:
+        """Return the last journal record of each region written."""
+        if self._closed:
+            raise ValueError("The journal of a closed DVStore has been removed.")
+        with open(self.journal_path, "rb") as fh:
+            buf = fh.read()
+        # ignore a record that was only partly written (e.g. on a crash)
+        n = len(buf) // JOURNAL_RECORD.itemsize
+        records = np.frombuffer(buf, JOURNAL_RECORD, count=n)[::-1]
+        _, idx = np.unique(records[_REGION].copy(), return_index=True)
+        return records[idx]
+
+    @property
+    def filled(self) -> np.ndarray:
+        """Whether each plane has been completely written, as a boolean array.
+
+        Indexed like the store (without Y and X).  Read from the journal, so it
+        includes the writes of other processes (and of earlier sessions).
+        """
+        records = self._records()
+        ny, nx = self._ny, self._nx
+        full = (records["y0"] == 0) & (records["y1"] == ny)
+        full &= (records["x0"] == 0) & (records["x1"] == nx)
+        filled = np.zeros(self._sections.size, bool)
+        filled[records["section"][full]] = True
+        # planes written in parts: check the union of their (maybe overlapping)
+        # regions
+        partial = records[~full & ~filled[records["section"]]]
+        for section in np.unique(partial["section"]):
+            filled[section] = _covers(partial[partial["section"] == section], ny, nx)
+        return filled.reshape(self._sections.shape)
+
+    def close(self) -> None:
+        """Write the merged statistics to the header, and remove the journal.
+
+        Call this once, after all regions have been written (by all processes).
+        Warns if some planes were not (completely) written.
+        """
+        if self._closed:
+            return
+        self._release()
+        records = self._records()
+        n_missing = int(np.count_nonzero(~self.filled))
+        if n_missing:
+            warnings.warn(
+                f"{n_missing} of {self._sections.size} planes of {self.path!r} were "
+                "not (completely) written.",
+                stacklevel=2,
+            )
+        self._closed = True
+        with open(self.path, "r+b") as fh:
+            hdr = makeHdrArray(np.frombuffer(bytearray(fh.read(_HDR_SIZE)), np.uint8))
+            self._write_stats(hdr, records)
+            fh.seek(0)
+            fh.write(hdr._array.tobytes())
+        with contextlib.suppress(FileNotFoundError):
+            os.unlink(self.journal_path)
+
+    def _write_stats(self, hdr: Any, records: np.ndarray) -> None:
+        if not len(records):
+            return
+        order = self.sequence_order
+        nc = self._full["C"]
+        c_stride = int(np.prod([self._full[d] for d in order[order.index("C") + 1 :]]))
+        channels = (records["section"] // c_stride) % nc
+        mins = np.full(nc, np.inf)
+        maxs = np.full(nc, -np.inf)
+        np.minimum.at(mins, channels, records["min"])
+        np.maximum.at(maxs, channels, records["max"])
+        first = records[channels == 0]
+        if len(first):
+            n_pixels = (first["y1"] - first["y0"]) * (first["x1"] - first["x0"])
+            mean = first["sum"].sum() / n_pixels.sum()
+            hdr.mmm1 = (mins[0], maxs[0], mean)
+        for c, field in enumerate(("mm2", "mm3", "mm4", "mm5"), start=1):
+            if c < nc and np.isfinite(mins[c]):
+                setattr(hdr, field, (mins[c], maxs[c]))
+
+    def __repr__(self) -> str:
+        dims = ", ".join(f"{d}={n}" for d, n in self.sizes.items())
+        return f"<DVStore {self.path!r} {self.dtype} ({dims})>"
+
+
+def _covers(regions: np.ndarray, ny: int, nx: int) -> bool:
+    """Whether the union of journal `regions` covers a whole (ny, nx) plane."""
+    # a grid of the cells between all region edges, marked where covered
+    ys = np.unique(np.concatenate([[0, ny], regions["y0"], regions["y1"]]))
+    xs = np.unique(np.concatenate([[0, nx], regions["x0"], regions["x1"]]))
+    grid = np.zeros((len(ys) - 1, len(xs) - 1), bool)
+    for r in regions:
+        y0, y1 = np.searchsorted(ys, [r["y0"], r["y1"]])
+        x0, x1 = np.searchsorted(xs, [r["x0"], r["x1"]])
+        grid[y0:y1, x0:x1] = True
+    return bool(grid.all())
+
+
+def _bounds(key: Any, size: int) -> tuple[int, int, bool]:
+    """Return (start, stop, is_int) of a Y or X index, which must be contiguous."""
+    if isinstance(key, slice):
+        start, stop, step = key.indices(size)
+        if step != 1:
+            raise IndexError("Only step-1 slices of Y and X can be assigned.")
+        return start, max(start, stop), False
+    try:
+        i = operator.index(key)
+    except TypeError:
+        raise IndexError(
+            f"Y and X can only be assigned with integers or slices, got {key!r}"
+        ) from None
+    if not -size <= i < size:
+        raise IndexError(f"index {i} is out of bounds for size {size}")
+    i %= size
+    return i, i + 1, True
+
+
+def create(
+    path: str | Path,
+    sizes: Mapping[str, int],
+    dtype: Any,
+    sequence_order: str | None = None,
+    *,
+    metadata: dict | None = None,
+    resume: bool = False,
+) -> DVStore:
+    """Create a preallocated DV file, whose planes can be written in any order.
+
+    Planes are written with `DVStore.write_plane` (or by assigning regions),
+    independently and concurrently.  The file's disk space is allocated up front,
+    and written planes are recorded in a journal until the store is closed.
+
+    Parameters
+    ----------
+    path : str | Path
+        Path of the file to create.
+    sizes : Mapping[str, int]
+        Size of each dimension ("T", "C", "Z", "Y" and "X"; missing dimensions
+        have size 1).
+    dtype : np.dtype
+        Pixel data type.
+    sequence_order : str, optional
+        Order of the planes in the file: one of "CTZ", "TZC" or "TCZ" (slowest to
+        fastest varying).  If given, `sizes` may be in any order, and the store's
+        dimensions are ``sequence_order + "YX"``.  Otherwise, the store's
+        dimensions are those of `sizes`, in order (see `DVStore`).
+    metadata : dict, optional
+        Header fields to set, as in `mrc.save`.
+    resume : bool, optional
+        If True, and `path` is a store that was not closed (its journal exists),
+        reopen it (see `DVStore.resume`) rather than overwriting it.  The planes
+        left to write are then those that are not `filled`.
+
+    Examples
+    --------
+    >>> store = mrc.create("out.dv", {"T": 10, "C": 3, "Y": 2048, "X": 2048},
+    ...                    np.uint16, "TCZ", resume=True)
+    >>> store.write_plane(frame, t=4, c=2)  # from any thread, in any order
+    >>> store.close()
+    """
+    if sequence_order is not None:
+        if sequence_order not in SEQUENCE_ORDERS.values():
+            raise ValueError(
+                f"sequence_order must be one of {', '.join(SEQUENCE_ORDERS.values())}"
+                f", got {sequence_order!r}"
+            )
+        if set(sizes) - set("TCZYX") or not {"Y", "X"} <= set(sizes):
+            raise ValueError(
+                "sizes must have keys from 'TCZYX' (including 'Y' and 'X'), "
+                f"got {''.join(sizes)!r}"
+            )
+        sizes = {d: sizes.get(d, 1) for d in f"{sequence_order}YX"}
+    if resume and os.path.exists(f"{os.fspath(path)}.journal"):
+        store = DVStore.resume(path, sizes)
+        if store.dtype != np.dtype(dtype):
+            raise ValueError(f"dtype {dtype} doesn't match the file's: {store.dtype}")
+        return store
+    return DVStore(path, sizes, dtype, metadata=metadata, preallocate=True)
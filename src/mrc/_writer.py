@@ -0,0 +1,415 @@
+"""Streaming writer for DV files."""
+
+from __future__ import annotations
+
+import os
+import queue
+import threading
+import time
+import warnings
+from collections.abc import Mapping
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, NamedTuple
+
+import numpy as np
+
+from ._new import SEQUENCE_ORDERS
+from .mrc import Mrc2, WaveStats, add_metadata, dtype2MrcMode, init_simple
+
+if TYPE_CHECKING:
+    from typing import Literal, Union
+
+    SyncPolicy = Union[Literal["none", "batch", "close"], float]
+
+# planes are collected in a buffer of (at most) this many bytes between writes
+WRITE_BUFFER_BYTES = 32 * 1024 * 1024
+# how often a blocked `write` checks for an error on the writer thread (seconds)
+_POLL_INTERVAL = 0.1
+
+
+class WriterStats(NamedTuple):
+    """Counters of a DVWriter, to monitor throughput and backpressure."""
+
+    planes_written: int  # planes written to the file (not just buffered)
+    batches: int  # number of (multi-plane) writes
+    queue_depth: int  # full buffers waiting to be written
+    max_queue_depth: int
+    stalls: int  # times `write` waited for a free buffer
+    stall_time: float  # total time `write` waited (seconds)
+    write_time: float  # total time spent writing (seconds)
+    sync_time: float  # total time spent syncing to disk (seconds)
+
+
+class DVWriter:
+    """Write a DV file one plane (or stack of planes) at a time.
+
+    Planes are written in file order (as given by `sizes`), through a buffer so
+    that the file is written with large sequential writes.  The number of
+    timepoints may be unknown up front: the section count, number of timepoints
+    and min/max/mean header fields are (re)written on `close`.
+
+    Parameters
+    ----------
+    path : str | Path
+        Path of the file to write (overwritten if it exists).
+    sizes : Mapping[str, int | None]
+        Size of each dimension, in file order (slowest to fastest varying), e.g.
+        ``{"T": None, "C": 2, "Z": 30, "Y": 512, "X": 512}``.  "Y" and "X" are
+        required, and must be last.  Missing "T", "C" or "Z" dimensions have size
+        1.  The order of "T", "C" and "Z" must be one of the DV sequence orders
+        (CTZ, TZC or TCZ).  "T" may be None (unknown) if it is the slowest
+        varying dimension (that is, if there is more than one channel, the order
+        must be TZC or TCZ).
+    dtype : np.dtype
+        Pixel data type (uint8, int16, uint16, int32, float32 or complex64).
+    metadata : dict, optional
+        Header fields to set, as in `mrc.save` (e.g. ``{"dxyz": (0.1, 0.1, 0.3),
+        "wave1": 525}``).
+    buffer_size : int, optional
+        Size of the write buffer, in bytes.  By default WRITE_BUFFER_BYTES.
+    background : bool, optional
+        If True, planes are written by a dedicated thread, so that `write` only
+        copies them into a buffer (and never waits for the disk, unless all
+        buffers are full).  By default False.
+    n_buffers : int, optional
+        Number of (preallocated) buffers when writing in the background, by
+        default 2 (one being filled while the other is written).  More buffers
+        absorb longer disk stalls.  Check `stats` for the time `write` waited.
+    sync : {"none", "batch", "close"} or float, optional
+        When to flush written data to disk (fsync), for durability: never ("none",
+        the default, leaving it to the OS), after every buffer written
+        ("batch"), once on `close` ("close"), or at most every `sync` seconds.
+
+    Examples
+    --------
+    >>> with DVWriter("out.dv", {"T": None, "C": 2, "Z": 30, "Y": 512, "X": 512},
+    ...               np.uint16) as w:
+    ...     for stack in acquire():  # (C, Z, Y, X) per timepoint
+    ...         w.write(stack)
+
+    >>> w = DVWriter("out.dv", sizes, np.uint16, background=True, n_buffers=4,
+    ...              sync=5.0)
+    >>> for frame in camera:
+    ...     w.write(frame)
+    >>> w.close()
+    >>> assert w.stats.stalls == 0  # the disk kept up
+    """
+
+    def __init__(
+        self,
+        path: str | Path,
+        sizes: Mapping[str, int | None],
+        dtype: Any,
+        *,
+        metadata: dict | None = None,
+        buffer_size: int = WRITE_BUFFER_BYTES,
+        background: bool = False,
+        n_buffers: int = 2,
+        sync: SyncPolicy = "none",
+    ) -> None:
+        if not (
+            sync in ("none", "batch", "close")
+            or (isinstance(sync, (int, float)) and sync >= 0)
+        ):
+            raise ValueError(
+                "sync must be 'none', 'batch', 'close' or a number of seconds, "
+                f"got {sync!r}"
+            )
+        if background and n_buffers < 2:
+            raise ValueError(f"n_buffers must be at least 2, got {n_buffers}")
+        self.dtype = np.dtype(dtype)
+        self.sequence_order, self.sizes = _resolve_sizes(sizes)
+        lead = self.sequence_order
+        self._nt = self.sizes["T"]
+        known = {d: n for d, n in self.sizes.items() if n is not None}
+        self._ny, self._nx, n_channels = known["Y"], known["X"], known["C"]
+        self._per_t = int(np.prod([known[d] for d in lead if d != "T"]))
+
+        self._mrc = Mrc2(str(path), "w")
+        hdr = self._mrc.hdr
+        init_simple(hdr, dtype2MrcMode(self.dtype.type), (0, self._ny, self._nx))
+        hdr.ImgSequence = {v: k for k, v in SEQUENCE_ORDERS.items()}[lead]
+        hdr.NumWaves = n_channels
+        # per-wave min/max/mean, of the sections as they are written.  WaveStats
+        # takes the stride of the wave axis from the sizes in the header, which
+        # are only written on close.  Stats are reduced before `write` returns
+        # (maxWorkers=1), as the planes' buffers may be reused after that.
+        hdr.Num = (self._nx, self._ny, self._per_t * (self._nt or 1))
+        hdr.NumTimes = self._nt or 1
+        self._stats = WaveStats(hdr, maxWorkers=1)
+        hdr.Num = (self._nx, self._ny, 0)
+        hdr.NumTimes = 1
+        if metadata is not None:
+            add_metadata(metadata, hdr)
+        self._mrc._initWhenHdrArraySet()
+        self._mrc.writeHeader()  # reserve space, rewritten on close
+
+        n_buffer = max(1, buffer_size // (self._ny * self._nx * self.dtype.itemsize))
+        self._buffer = np.empty((n_buffer, self._ny, self._nx), self.dtype)
+        self._n_buffered = 0
+        self._n_written = 0  # sections written (or buffered)
+        self._closed = False
+
+        self._sync_policy = sync
+        self._last_sync = time.monotonic()
+        self._planes_written = self._batches = self._stalls = 0
+        self._max_depth = 0
+        self._stall_time = self._write_time = self._sync_time = 0.0
+        self._thread: threading.Thread | None = None
+        if background:
+            # full buffers (with their number of planes) go to the writer
+            # thread, which returns them to `_free` once written
+            self._queue: queue.Queue[tuple[np.ndarray, int] | None]
+            self._queue = queue.Queue()
+            self._free: queue.Queue[np.ndarray] = queue.Queue()
+            for _ in range(n_buffers - 1):
+                self._free.put(np.empty_like(self._buffer))
+            self._error: BaseException | None = None
+            self._thread = threading.Thread(
+                target=self._run, name="DVWriter", daemon=True
+            )
+            self._thread.start()
+
+    @property
+    def n_sections(self) -> int:
+        """Number of sections written so far."""
+        return self._n_written
+
+    @property
+    def closed(self) -> bool:
+        return self._closed
+
+    @property
+    def stats(self) -> WriterStats:
+        """Throughput and backpressure counters (see `WriterStats`)."""
+        return WriterStats(
+            self._planes_written,
+            self._batches,
+            self._queue.qsize() if self._thread is not None else 0,
+            self._max_depth,
+            self._stalls,
+            self._stall_time,
+            self._write_time,
+            self._sync_time,
+        )
+
+    def __enter__(self) -> DVWriter:
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        self.close()
+
+    def write(self, data: Any) -> None:
+        """Append one or more planes, in file order.
+
+        `data` has shape (..., Y, X): a single plane or any stack of planes, which
+        are appended in C order.  It is cast to the writer's dtype.
+        """
+        if self._closed:
+            raise ValueError("Cannot write to a closed DVWriter.")
+        planes = np.asarray(data, dtype=self.dtype)
+        if planes.shape[-2:] != (self._ny, self._nx):
+            raise ValueError(
+                f"planes must have shape (..., {self._ny}, {self._nx}), "
+                f"got {planes.shape}"
+            )
+        planes = planes.reshape(-1, self._ny, self._nx)
+        n = planes.shape[0]
+        nt = self._nt
+        if nt is not None and self._n_written + n > nt * self._per_t:
+            raise ValueError(
+                f"Cannot write {n} more planes: file has {nt * self._per_t} sections "
+                f"and {self._n_written} have been written."
+            )
+        if self._thread is not None:
+            self._raise_error()
+            pos = 0
+            while pos < n:
+                k = min(n - pos, len(self._buffer) - self._n_buffered)
+                self._buffer[self._n_buffered : self._n_buffered + k] = planes[
+                    pos : pos + k
+                ]
+                self._n_buffered += k
+                pos += k
+                if self._n_buffered == len(self._buffer):
+                    self._submit()
+            self._n_written += n
+            return
+
+        self._stats.add(planes)
+        if n > len(self._buffer) - self._n_buffered:
+            self._write_buffer()
+        if n >= len(self._buffer):
+            # stacks at least as large as the buffer are written directly
+            self._write(np.ascontiguousarray(planes))
+        else:
+            self._buffer[self._n_buffered : self._n_buffered + n] = planes
+            self._n_buffered += n
+        self._n_written += n
+
+    def _write(self, planes: np.ndarray) -> None:
+        start = time.perf_counter()
+        self._mrc.writeStack(planes)
+        self._write_time += time.perf_counter() - start
+        self._planes_written += len(planes)
+        self._batches += 1
+        policy = self._sync_policy
+        if policy == "batch" or (
+            not isinstance(policy, str) and time.monotonic() - self._last_sync >= policy
+        ):
+            self._sync()
+
+    def _sync(self) -> None:
+        start = time.perf_counter()
+        self._mrc.flush()
+        getattr(os, "fdatasync", os.fsync)(self._mrc._f.fileno())
+        self._sync_time += time.perf_counter() - start
+        self._last_sync = time.monotonic()
+
+    def _write_buffer(self) -> None:
+        if self._thread is not None:
+            self._submit()
+        elif self._n_buffered:
+            self._write(self._buffer[: self._n_buffered])
+            self._n_buffered = 0
+
+    def _submit(self) -> None:
+        """Hand the current buffer to the writer thread, and take a free one."""
+        if not self._n_buffered:
+            return
+        self._queue.put((self._buffer, self._n_buffered))
+        self._max_depth = max(self._max_depth, self._queue.qsize())
+        self._n_buffered = 0
+        try:
+            self._buffer = self._free.get_nowait()
+            return
+        except queue.Empty:
+            pass
+        start = time.perf_counter()
+        while True:
+            try:
+                self._buffer = self._free.get(timeout=_POLL_INTERVAL)
+                break
+            except queue.Empty:
+                self._raise_error()
+        self._stalls += 1
+        self._stall_time += time.perf_counter() - start
+
+    def _run(self) -> None:
+        while True:
+            item = self._queue.get()
+            if item is None:
+                self._queue.task_done()
+                return
+            buffer, n = item
+            try:
+                if self._error is None:
+                    self._stats.add(buffer[:n])
+                    self._write(buffer[:n])
+            except BaseException as e:
+                self._error = e
+            finally:
+                self._free.put(buffer)
+                self._queue.task_done()
+
+    def _raise_error(self) -> None:
+        if self._error is not None:
+            raise OSError(f"Writing {self._mrc._path!r} failed") from self._error
+
+    def flush(self) -> None:
+        """Write buffered planes to the file.
+
+        When writing in the background, waits for all planes to be written.
+        """
+        self._write_buffer()
+        if self._thread is not None:
+            self._queue.join()
+            self._raise_error()
+        self._mrc.flush()
+
+    def close(self) -> None:
+        """Flush buffered planes and rewrite the header with the final sizes."""
+        if self._closed:
+            return
+        self._closed = True
+        try:
+            try:
+                self.flush()
+            finally:
+                if self._thread is not None:
+                    self._queue.put(None)
+                    self._thread.join()
+            n_sections = self._n_written
+            nt = n_sections // self._per_t
+            if nt * self._per_t != n_sections:
+                warnings.warn(
+                    f"{n_sections} sections were written, which is not a multiple "
+                    f"of {self._per_t} (sections per timepoint). The header records "
+                    f"only the {nt} complete timepoint(s).",
+                    stacklevel=2,
+                )
+            elif self._nt is not None and nt != self._nt:
+                warnings.warn(
+                    f"Only {nt} of {self._nt} timepoints were written.",
+                    stacklevel=2,
+                )
+            hdr = self._mrc.hdr
+            hdr.Num = (self._nx, self._ny, nt * self._per_t)
+            hdr.NumTimes = nt
+            self._stats.setHdr(hdr)
+            self._mrc.writeHeader()
+            if self._sync_policy != "none":
+                self._sync()
+        finally:
+            self._mrc.close()
+
+    def __repr__(self) -> str:
+        state = "closed" if self._closed else f"{self._n_written} sections"
+        return f"<DVWriter {self._mrc._path!r} {self.dtype} ({state})>"
+
+
+def _resolve_sizes(
+    sizes: Mapping[str, int | None],
+) -> tuple[str, dict[str, int | None]]:
+    """Return the sequence order and full (TCZYX) sizes of a DVWriter."""
+    dims = "".join(sizes)
+    if set(dims) - set("TCZYX") or len(set(dims)) != len(dims):
+        raise ValueError(f"sizes must have unique keys from 'TCZYX', got {dims!r}")
+    if not dims.endswith("YX"):
+        raise ValueError(f"sizes must end with 'Y' and 'X', got {dims!r}")
+    lead = dims[:-2]
+    # the first sequence order consistent with the order of the given dimensions
+    order = next(
+        (
+            o
+            for o in SEQUENCE_ORDERS.values()
+            if "".join(d for d in o if d in lead) == lead
+        ),
+        None,
+    )
+    if order is None:
+        raise ValueError(
+            f"Unsupported dimension order {dims!r}: the order of T, C and Z must be "
+            f"one of {', '.join(SEQUENCE_ORDERS.values())}"
+        )
+    full: dict[str, int | None] = dict.fromkeys(order, 1)
+    full.update(sizes)
+    for d, n in full.items():
+        if n is None and d != "T":
+            raise ValueError(f"Only the size of 'T' may be unknown, got {d}=None")
+    if full["T"] is None and full["C"] != 1 and order[0] != "T":
+        # try an order in which T varies slowest
+        order = next(
+            (
+                o
+                for o in SEQUENCE_ORDERS.values()
+                if o[0] == "T" and "".join(d for d in o if d in lead) == lead
+            ),
+            order,
+        )
+        if order[0] != "T":
+            raise ValueError(
+                "The number of timepoints may only be unknown if T is the slowest "
+                f"varying dimension (got {dims!r}, with {full['C']} channels)."
+            )
+    return order, {d: full[d] for d in (*order, "Y", "X")}
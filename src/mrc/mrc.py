@@ -21,6 +21,8 @@ import weakref
 
 import numpy as np
 
+from ._io import read_sections
+
 try:
     input = raw_input
 except NameError:
@@ -155,29 +157,7 @@ class Mrc:
         #   byteorder=byteorder
         # )
 
-        _fmt = "%sf4" % (byteorder)
-        dv_floats = []
-        names = (
-            "photosensorReading",
-            "timeStampSeconds",
-            "stageXCoord",
-            "stageYCoord",
-            "stageZCoord",
-            "minInten",
-            "maxInten",
-            "meanInten",
-            "expTime",
-            "ndFilter",
-            "exWavelen",
-            "emWavelen",
-            "intenScaling",
-            "energyConvFactor",
-        )
-        for name in names:
-            dv_floats.append((name, _fmt))
-        for i in range(self.numFloats - len(names)):
-            dv_floats.append(("empty%d" % i, _fmt))
-        dv_floats = np.dtype(dv_floats)
+        dv_floats = dvExtHdrFloats_dtype(self.numFloats, byteorder)
 
         type_descr = np.dtype(
             [
@@ -339,24 +319,121 @@ def mm(a):
 
 
 def calculate_mmm(a, m):
-    # add min/max/mean info to m.hdr
-    wAxis = axisOrderStr(m.hdr).find("w")
-    if wAxis < 0:
-        if a.dtype != np.complex64 and a.dtype != np.complex128:
-            m.hdr.mmm1 = mmm(a)
+    # add min/max/mean info to m.hdr (a is in file order), in one chunked pass
+    stats = WaveStats(m.hdr)
+    try:
+        for block in iterSectionBlocks(a):
+            stats.add(block)
+    finally:
+        stats.close()
+    stats.setHdr(m.hdr)
+
+
+# size of the pieces of sections reduced at once (small enough to stay in cache)
+STATS_CHUNK_BYTES = 1024 * 1024
+waveStatsFields = ("mmm1", "mm2", "mm3", "mm4", "mm5")
+
+
+class WaveStats:
+    """min, max and mean of each wave of a file, accumulated over blocks of
+    consecutive sections in file order (for instance while they are written)
+    each block is split into pieces of at most STATS_CHUNK_BYTES, whose
+    min, max and sum are computed in one pass while in cache, in parallel
+    only one block is reduced at a time: add() waits for the previous one
+    """
+
+    def __init__(self, hdr, maxWorkers=None):
+        self.nw = max(int(hdr.NumWaves), 1)
+        nt = max(int(hdr.NumTimes), 1)
+        self._secSize = int(hdr.Num[0]) * int(hdr.Num[1])
+        letters = axisOrderStr(hdr)[:-2]
+        sizes = {"w": self.nw, "t": nt, "z": max(int(hdr.Num[2]) // (self.nw * nt), 1)}
+        # stride (in sections) of the wave axis
+        after = letters[letters.index("w") + 1 :] if "w" in letters else ""
+        self._wStride = int(np.prod([sizes[x] for x in after]))
+        self.min = np.full(self.nw, np.inf)
+        self.max = np.full(self.nw, -np.inf)
+        self.sum = 0.0  # of the first wave
+        self.count = 0
+        self._nSecs = 0  # sections added
+        self._maxWorkers = maxWorkers
+        self._pool = None
+        self._pending = []
+
+    def _pieces(self, flat):
+        itemsize = flat.dtype.itemsize
+        n, size = flat.shape
+        if size * itemsize >= STATS_CHUNK_BYTES:
+            step = max(1, STATS_CHUNK_BYTES // itemsize)
+            for i in range(n):
+                for j in range(0, size, step):
+                    yield i, flat[i : i + 1, j : j + step]
         else:
-            m.hdr.mmm1 = mmm(np.abs(a))
-    else:
-        nw = m.hdr.NumWaves
-        m.hdr.mmm1 = mmm(a.take((0,), wAxis))
-        if nw >= 2:
-            m.hdr.mm2 = mm(a.take((1,), wAxis))
-        if nw >= 3:
-            m.hdr.mm3 = mm(a.take((2,), wAxis))
-        if nw >= 4:
-            m.hdr.mm4 = mm(a.take((3,), wAxis))
-        if nw >= 5:
-            m.hdr.mm5 = mm(a.take((4,), wAxis))
+            step = max(1, STATS_CHUNK_BYTES // (size * itemsize))
+            for i in range(0, n, step):
+                yield i, flat[i : i + step]
+
+    @staticmethod
+    def _reduce(piece):
+        if np.iscomplexobj(piece):
+            piece = np.abs(piece)
+        return (
+            piece.min(axis=1),
+            piece.max(axis=1),
+            piece.sum(axis=1, dtype=np.float64),
+            piece.shape[1],
+        )
+
+    def add(self, block):
+        """add the stats of block, the next (contiguous) sections of the file"""
+        self._merge()
+        flat = np.ascontiguousarray(block).reshape(-1, self._secSize)
+        first = self._nSecs
+        self._nSecs += len(flat)
+        pieces = list(self._pieces(flat))
+        if len(pieces) == 1 or (self._maxWorkers or os.cpu_count() or 1) == 1:
+            self._pending = [(first + i, self._reduce(piece)) for i, piece in pieces]
+            return
+        if self._pool is None:
+            from concurrent.futures import ThreadPoolExecutor
+
+            self._pool = ThreadPoolExecutor(self._maxWorkers)
+        self._pending = [
+            (first + i, self._pool.submit(self._reduce, piece)) for i, piece in pieces
+        ]
+
+    def _merge(self):
+        for first, result in self._pending:
+            if not isinstance(result, tuple):
+                result = result.result()
+            mins, maxs, sums, n = result
+            waves = (np.arange(first, first + len(mins)) // self._wStride) % self.nw
+            np.minimum.at(self.min, waves, mins)
+            np.maximum.at(self.max, waves, maxs)
+            isFirst = waves == 0
+            self.sum += float(sums[isFirst].sum())
+            self.count += n * int(isFirst.sum())
+        self._pending = []
+
+    def close(self):
+        """wait for pending work and shut down the thread pool"""
+        try:
+            self._merge()
+        finally:
+            if self._pool is not None:
+                self._pool.shutdown()
+                self._pool = None
+
+    def setHdr(self, hdr, skip=()):
+        """set the min/max/mean fields of hdr (except those in skip)"""
+        self.close()
+        if not self.count:
+            return
+        values = [(self.min[0], self.max[0], self.sum / self.count)]
+        values += [(self.min[w], self.max[w]) for w in range(1, min(self.nw, 5))]
+        for field, value in zip(waveStatsFields, values):
+            if field not in skip:
+                setattr(hdr, field, np.array(value, dtype="f"))
 
 
 def save(
@@ -382,7 +459,9 @@ def save(
           (spaces,commas,dots,minuses  are ignored)
        examples:
           4D: time,z,y,x          -->  zAxisOrder= 't z'
-          5D: time, wave, z,y,x   -->  zAxisOrder= 't,z,w'
+          5D: time, wave, z,y,x   -->  zAxisOrder= 't,w,z'
+       5D arrays can have any axis order: the file is written with the
+       closest ImgSequence, in blocks of sections (without a transposed copy)
        refer to Mrc spec 'ImgSequence' (interleaved or not)
        zAxisOrder None means:
           3D: 'z'
@@ -390,7 +469,10 @@ def save(
           5D: 'tzw'
     if hdr is not None:  copy all fields(except 'Num',...)
     if calcMMM:  calculate min,max,mean of data set and set hdr field
-    TODO: not implemented yet, extInts=None, extFloats=None
+    extInts, extFloats: extended header values for each section, written in
+       one block (see makeExtHdrArray), e.g.
+          extFloats={'timeStampSeconds': t, 'exWavelen': 488}
+       or a structured array such as DVFile.ext_hdr.array
 
     metadata (dict): fields to overwrite in the header, accepts all field names in hdr
     """
@@ -415,12 +497,10 @@ def save(
         if hasattr(a, "Mrc"):
             if hasattr(a.Mrc, "hdr"):
                 copyHdrInfo(m.hdr, a.Mrc.hdr)
-    if calcMMM:
-        calculate_mmm(a, m)
     if metadata is not None:
         add_metadata(metadata, m.hdr)
     if extInts is not None or extFloats is not None:
-        raise NotImplementedError("todo: implement ext hdr")
+        m.makeExtendedHdr(extInts=extInts, extFloats=extFloats)
     # if hdrEval:
     #     import sys
     #     fr = sys._getframe(1)
@@ -429,7 +509,21 @@ def save(
     #     glo = fr.f_globals
     #     exec(hdrEval, globals=glo, locals=loc)
     m.writeHeader()
-    m.writeStack(a)
+    if extInts is not None or extFloats is not None:
+        m.writeExtHeader(seekTo0=True)
+    if calcMMM:
+        # stats are computed while writing (in one pass), then the header updated
+        stats = WaveStats(m.hdr)
+        try:
+            for block in iterSectionBlocks(m.fileOrderView(a)):
+                stats.add(block)
+                m.writeStack(block)
+        finally:
+            stats.close()
+        stats.setHdr(m.hdr, skip=metadata or ())
+        m.writeHeader()
+    else:
+        m.writeArr(a)
     m.close()
 
 
@@ -465,12 +559,56 @@ def add_metadata(metadata, hdr):
         setattr(hdr, key, value)
 
 
+# zAxisOrder (python order: last is fastest) of the sections for each
+# hdr.ImgSequence (0 = ZTW, 1 = WZT, 2 = ZWT)
+imgSequenceAxisOrder = ("wtz", "tzw", "twz")
+
+# (maximal) size of the blocks of sections copied when writing an array whose
+# axis order differs from the file's
+WRITE_BLOCK_BYTES = 32 * 1024 * 1024
+
+
+def closestImgSequence(zAxisOrder):
+    """return the ImgSequence closest to zAxisOrder (a permutation of 'tzw')
+    that is, the one sharing the most fastest-varying axes, so that sections are
+    written in the largest possible contiguous blocks
+    """
+
+    def nShared(i):
+        order = imgSequenceAxisOrder[i]
+        n = 0
+        while n < 3 and order[-1 - n] == zAxisOrder[-1 - n]:
+            n += 1
+        return n
+
+    return max(range(len(imgSequenceAxisOrder)), key=nShared)
+
+
+def iterSectionBlocks(a, maxBytes=WRITE_BLOCK_BYTES):
+    """yield C-contiguous blocks of consecutive sections of a (..., ny, nx)
+    each block is at most maxBytes (but at least one section) and is only a
+    copy if the sections are not already contiguous in a
+    """
+    lead = a.shape[:-2]
+    inner = a[(0,) * len(lead)].nbytes if a.size else 0
+    # a block holds all of dims k: and a step of dim k-1
+    k = len(lead)
+    while k > 0 and inner * lead[k - 1] <= maxBytes:
+        k -= 1
+        inner *= lead[k]
+    if k == 0:
+        yield np.ascontiguousarray(a)
+        return
+    step = max(1, maxBytes // inner) if inner else 1
+    for idx in np.ndindex(*lead[: k - 1]):
+        for i in range(0, lead[k - 1], step):
+            yield np.ascontiguousarray(a[idx + (slice(i, i + step),)])
+
+
 def pick_zAxisOrder(arr):
     if hasattr(arr, "Mrc"):
         # if arr.Mrc exists... was likely opened from an existing file
-        # hdr.ImgSequence (0 = ZTW, 1 = WZT, 2 = ZWT)
-        orderlookup = ["wtz", "tzw", "twz"]
-        return orderlookup[arr.Mrc.hdr.ImgSequence]
+        return imgSequenceAxisOrder[arr.Mrc.hdr.ImgSequence]
 
     shape = arr.shape
     if arr.ndim == 3:
@@ -589,11 +727,37 @@ class Mrc2:
             else:
                 raise ValueError("unsupported axis order")
         elif arr.ndim == 5:
-            raise ValueError("FIXME TODO: 5D")
+            if sorted(zAxisOrder) != ["t", "w", "z"]:
+                raise ValueError("unsupported axis order")
+            self.hdr.ImgSequence = closestImgSequence(zAxisOrder)
+            self.hdr.NumTimes = arr.shape[zAxisOrder.index("t")]
+            self.hdr.NumWaves = arr.shape[zAxisOrder.index("w")]
         else:
             raise ValueError("unsupported array ndim")
+        self._arrAxisOrder = zAxisOrder if arr.ndim == 5 else None
         self._initWhenHdrArraySet()
 
+    def fileOrderView(self, arr):
+        """return arr (as given to initHdrForArr) with its axes in file order
+        (a view: only 5D arrays are ever transposed)
+        """
+        if getattr(self, "_arrAxisOrder", None) is None:
+            return arr
+        fileOrder = imgSequenceAxisOrder[self.hdr.ImgSequence]
+        axes = [self._arrAxisOrder.index(ax) for ax in fileOrder]
+        return arr.transpose(axes + [3, 4])
+
+    def writeArr(self, arr, maxBytes=WRITE_BLOCK_BYTES):
+        """write all sections of arr (as given to initHdrForArr) in file order
+        at current position; arrays that are not contiguous in file order are
+        written in blocks of sections of at most maxBytes
+        """
+        arr = self.fileOrderView(arr)
+        if arr.flags.c_contiguous:
+            return self.writeStack(arr)
+        for block in iterSectionBlocks(arr, maxBytes):
+            self.writeStack(block)
+
     def _initFromExistingFile(self):
         self.seekHeader()
         hdrArray = np.rec.fromfile(self._f, dtype=mrcHdr_dtype, shape=1)
@@ -638,12 +802,21 @@ class Mrc2:
         self.hdr.Num = shape[-1], shape[-2], np.prod(shape[:-2])
         self._initWhenHdrArraySet()
 
-    def makeExtendedHdr(self, numInts, numFloats, nSecs=None):
+    def makeExtendedHdr(
+        self, numInts=None, numFloats=None, nSecs=None, extInts=None, extFloats=None
+    ):
+        """set up the extended header, optionally filled with extInts/extFloats
+        (see makeExtHdrArray; numInts/numFloats default to the number given)
+        write it with writeExtHeader
+        """
+        if nSecs is None:
+            nSecs = self._shape[0]
+        values = makeExtHdrArray(nSecs, extInts, extFloats, numInts, numFloats)
+        numInts = values.dtype["int"].shape[0]
+        numFloats = values.dtype["float"].shape[0]
         self._extHdrNumInts = self.hdr.NumIntegers = numInts
         self._extHdrNumFloats = self.hdr.NumFloats = numFloats
         self._extHdrBytesPerSec = (self._extHdrNumInts + self._extHdrNumFloats) * 4
-        if nSecs is None:
-            nSecs = self._shape[0]
         self._extHdrSize = self.hdr.next = minExtHdrSize(nSecs, self._extHdrBytesPerSec)
         self._dataOffset = self._hdrSize + self._extHdrSize
         if self._extHdrSize > 0 and (
@@ -655,6 +828,9 @@ class Mrc2:
                 formats="%di4,%df4" % (self._extHdrNumInts, self._extHdrNumFloats),
                 names="int,float",
             )
+            self._extHdrArray.fill(0)
+            self._extHdrArray.field("int")[: len(values)].flat = values.field("int")
+            self._extHdrArray.field("float")[: len(values)].flat = values.field("float")
             # shape=nSecs)#  ,
             # byteorder=byteorder)
             self.extInts = self._extHdrArray.field("int")
@@ -681,12 +857,25 @@ class Mrc2:
     def seekExtHeader(self):
         self._f.seek(self._hdrSize)
 
+    def _currentSec(self):
+        return (self._f.tell() - self._dataOffset) // self._secByteSize
+
+    def readSecs(self, indices):
+        """read sections `indices` (in any order) into array of shape (n, ny, nx)
+        nearby sections are merged into large reads (see _io.read_sections)
+        """
+        if self._mode != "r":
+            self._f.flush()
+        return read_sections(
+            self._f, self._dataOffset, self._shape2d, np.dtype(self._dtype), indices
+        )
+
     def readSec(self, i=None):
         """if i is None read "next" section at current position"""
-        if i is not None:
-            self.seekSec(i)
-        a = np.fromfile(self._f, self._dtype, np.prod(self._shape2d))
-        a.shape = self._shape2d
+        if i is None:
+            i = self._currentSec()
+        a = self.readSecs([i])[0]
+        self.seekSec(i + 1)
         return a
 
     def writeSec(self, a, i=None):
@@ -698,10 +887,10 @@ class Mrc2:
 
     def readStack(self, nz, i=None):
         """if i is None read "next" section at current position"""
-        if i is not None:
-            self.seekSec(i)
-        a = np.fromfile(self._f, self._dtype, nz * np.prod(self._shape2d))
-        a.shape = (nz,) + self._shape2d
+        if i is None:
+            i = self._currentSec()
+        a = self.readSecs(np.arange(i, i + nz))
+        self.seekSec(i + nz)
         return a
 
     def writeStack(self, a, i=None):
@@ -725,6 +914,97 @@ class Mrc2:
 
 
 ###########################################################################
+# names of the (first) floats of each section in the DV extended header
+dvExtHdrFloatNames = (
+    "photosensorReading",
+    "timeStampSeconds",
+    "stageXCoord",
+    "stageYCoord",
+    "stageZCoord",
+    "minInten",
+    "maxInten",
+    "meanInten",
+    "expTime",
+    "ndFilter",
+    "exWavelen",
+    "emWavelen",
+    "intenScaling",
+    "energyConvFactor",
+)
+
+
+def dvExtHdrFloats_dtype(numFloats, byteorder="="):
+    """dtype of the floats of one section, with names in the DV layout
+    (floats beyond the named ones are called 'empty0', 'empty1', ...)
+    """
+    _fmt = "%sf4" % byteorder
+    names = list(dvExtHdrFloatNames[:numFloats])
+    names += ["empty%d" % i for i in range(numFloats - len(names))]
+    return np.dtype([(name, _fmt) for name in names])
+
+
+def makeExtHdrArray(nSecs, extInts=None, extFloats=None, numInts=None, numFloats=None):
+    """return extended header recarray (fields 'int' and 'float') for nSecs sections
+
+    extInts: (nSecs, numInts) array of integers
+    extFloats: either a (nSecs, numFloats) array of floats,
+        or per-field columns in the DV float layout (see dvExtHdrFloatNames):
+        a structured array or dict of columns, each with nSecs values (in any
+        shape, e.g. as returned by DVFile.ext_hdr[name]) or a single value.
+        A structured array may also have an 'ints' or 'int' field (as in
+        DVFile.ext_hdr.array), which is used if extInts is None.
+    numInts, numFloats: default to the number of ints/floats given
+    all values are assigned in bulk, missing values are 0.
+    """
+    columns = None
+    if extFloats is not None:
+        names = getattr(np.asarray(extFloats).dtype, "names", None)
+        if isinstance(extFloats, dict) or names:
+            if names:
+                extFloats = np.asarray(extFloats)
+                if extInts is None:
+                    for intName in ("ints", "int"):
+                        if intName in names:
+                            extInts = extFloats[intName]
+                columns = {n: extFloats[n] for n in names if n not in ("ints", "int")}
+            else:
+                columns = dict(extFloats)
+            unknown = set(columns) - set(dvExtHdrFloatNames)
+            if unknown:
+                raise ValueError(
+                    "Unrecognized extended header field(s): %s... must be in %s"
+                    % (", ".join(sorted(unknown)), ", ".join(dvExtHdrFloatNames))
+                )
+            if numFloats is None:
+                numFloats = 1 + max(dvExtHdrFloatNames.index(n) for n in columns)
+        else:
+            extFloats = np.asarray(extFloats, dtype=np.float32).reshape(nSecs, -1)
+            if numFloats is None:
+                numFloats = extFloats.shape[1]
+    if extInts is not None:
+        extInts = np.asarray(extInts, dtype=np.int32).reshape(nSecs, -1)
+        if numInts is None:
+            numInts = extInts.shape[1]
+    numInts = numInts or 0
+    numFloats = numFloats or 0
+
+    arr = np.recarray(
+        nSecs, formats="(%d,)i4,(%d,)f4" % (numInts, numFloats), names="int,float"
+    )
+    arr.fill(0)
+    if extInts is not None:
+        arr.field("int")[:, : extInts.shape[1]] = extInts
+    floats = arr.field("float")
+    if columns is not None:
+        for name, value in columns.items():
+            value = np.asarray(value, dtype=np.float32)
+            i = dvExtHdrFloatNames.index(name)
+            floats[:, i] = value.reshape(nSecs) if value.size == nSecs else value
+    elif extFloats is not None:
+        floats[:, : extFloats.shape[1]] = extFloats
+    return arr
+
+
 def minExtHdrSize(nSecs, bytesPerSec):
     """return smallest multiple of 1024 to fit extHdr data"""
     return int(np.ceil(nSecs * bytesPerSec / 1024.0) * 1024)
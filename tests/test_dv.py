@@ -1,12 +1,29 @@
+import asyncio
 import importlib
 import importlib.util
+import os
+import pickle
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 import numpy as np
 import psutil
 import pytest
 
-from mrc import DVFile, imread
+import mrc
+from mrc import (
+    AsyncDVFile,
+    DVDataset,
+    DVFile,
+    DVStore,
+    DVWriter,
+    HeaderCache,
+    PlaneCache,
+    imread,
+    scan,
+)
+from mrc._new import BE_HDR, LE_HDR
+from mrc._scan import header_dtype
 
 DATA = Path(__file__).parent / "data"
 IMAGES = [f for f in DATA.iterdir() if f.suffix in {".dv", ".r3d", ".otf"}]
@@ -49,3 +66,795 @@ def test_dual_read(fname):
         arr = imread(fname)
         a1 = f.asarray()
     assert np.all(a1 == arr)
+
+
+@pytest.mark.parametrize("fname", IMAGES, ids=lambda x: x.name)
+def test_lazy_open(fname):
+    with DVFile(fname, lazy=True) as f:
+        assert f._data is None
+        assert f._ext_hdr_loaded is False
+        assert f.sizes and f.voxel_size
+        assert f._data is None
+        np.testing.assert_array_equal(f.asarray(), imread(fname))
+        assert f._data is not None
+        if f.hdr.ext_hdr_len:
+            assert f.ext_hdr is not None
+    assert f.closed
+
+
+@pytest.mark.parametrize("fname", IMAGES, ids=lambda x: x.name)
+def test_ext_hdr_columns(fname):
+    with DVFile(fname) as f:
+        ext = f.ext_hdr
+        if ext is None:
+            pytest.skip("no extended header")
+        ts = ext["timeStampSeconds"]
+        assert ts.shape == tuple(f.sizes[k] for k in f.hdr.sequence_order)
+        assert ts.base is not None  # a view on the buffer, not a copy
+        assert ext.dtype.itemsize == (f.hdr.n_ints + f.hdr.n_floats) * 4
+        for i in (0, len(ext) - 1):
+            idx = np.unravel_index(i, ts.shape)
+            assert ext.frame(i).timeStampSeconds == ts[idx]
+
+
+@pytest.mark.parametrize(
+    "chunks", [None, "auto", "10kB", "1MiB", 4, {"Z": -1}, {"Y": 7}], ids=str
+)
+def test_to_dask_chunks(chunks):
+    pytest.importorskip("dask")
+    with DVFile(IMAGES[0]) as f:
+        d = f.to_dask(chunks)
+        assert d.shape == f.shape
+        np.testing.assert_array_equal(d, f.asarray(squeeze=False))
+        if chunks == "10kB":
+            assert d.blocks[(0,) * d.ndim].nbytes <= 10_000
+        if chunks == 4:
+            # an int is the chunk size of every dimension, as in dask
+            assert d.chunksize == tuple(min(4, n) for n in f.shape)
+
+
+def test_to_dask_picklable():
+    pytest.importorskip("dask")
+    import pickle
+
+    with DVFile(IMAGES[0]) as f:
+        expected = f.asarray(squeeze=False)
+        d = f.to_dask({"Y": 1})
+    # the graph does not hold on to the (now closed) DVFile
+    assert len(d.dask.layers) == 1
+    d2 = pickle.loads(pickle.dumps(d))
+    np.testing.assert_array_equal(d2.compute(scheduler="threads"), expected)
+    np.testing.assert_array_equal(d.compute(scheduler="processes"), expected)
+
+
+@pytest.mark.parametrize("fname", IMAGES, ids=lambda x: x.name)
+def test_pread_backend(fname):
+    with DVFile(fname) as f:
+        expected = f.asarray(squeeze=False)
+    with DVFile(fname, backend="pread") as f:
+        assert f.backend == "pread"
+        np.testing.assert_array_equal(f.asarray(squeeze=False), expected)
+        keys = [0, -1, (0, 0), (..., 0, 1), (slice(None, None, 2), ..., 3)]
+        keys += [(slice(None), [0, -1], slice(None), slice(2, 5))]
+        # arrays in the plane part, with integer Y/X indices
+        keys += [(slice(None), [0, -1, 0], 0, slice(None), 5), ([-1, 0], ..., 2, 3)]
+        # a repeated plane that fills the gap of a range
+        keys += [(0, 0, [0, 0, 2 % expected.shape[2]])]
+        for key in keys:
+            np.testing.assert_array_equal(f[key], expected[key])
+        if importlib.util.find_spec("dask") is not None:
+            np.testing.assert_array_equal(f.to_dask({"Z": 2}), expected)
+
+
+def test_pread_multi_block(monkeypatch):
+    import mrc._io
+
+    # reads cross several (unaligned) block boundaries
+    monkeypatch.setattr(mrc._io, "READ_BLOCK_SIZE", 1000)
+    with DVFile(IMAGES[0]) as f:
+        expected = f.asarray(squeeze=False)
+    with DVFile(IMAGES[0], backend="pread") as f:
+        np.testing.assert_array_equal(f.asarray(squeeze=False), expected)
+        np.testing.assert_array_equal(f[:, 1:], expected[:, 1:])
+
+
+def test_backend_auto():
+    with DVFile(IMAGES[0], backend="auto") as f:
+        assert f.backend in ("mmap", "pread")
+    with pytest.raises(ValueError, match="backend must be"):
+        DVFile(IMAGES[0], backend="nope")
+
+
+@pytest.mark.parametrize("backend", ["mmap", "pread"])
+def test_asarray_out(backend, monkeypatch):
+    import mrc._io
+    import mrc._new
+
+    # force multiple threads and (unaligned) multi-block reads, even for small files
+    monkeypatch.setattr(mrc._new, "_MIN_TASK_BYTES", 1)
+    monkeypatch.setattr(mrc._io, "READ_BLOCK_SIZE", 1000)
+    with DVFile(IMAGES[0], backend=backend) as f:
+        expected = f.asarray()
+        batch = np.zeros((2, *expected.shape), expected.dtype)
+        out = batch[1]
+        assert f.asarray(out=out, max_workers=3) is out
+        np.testing.assert_array_equal(batch[1], expected)
+        assert not batch[0].any()
+
+        np.testing.assert_array_equal(f.asarray(max_workers=1), expected)
+        with pytest.raises(ValueError, match="must have shape"):
+            f.asarray(out=batch)
+        with pytest.raises(ValueError, match="C-contiguous"):
+            f.asarray(out=np.zeros(expected.shape[::-1], expected.dtype).T)
+
+
+def test_coalesce():
+    from mrc._io import coalesce
+
+    secs = np.array([9, 0, 1, 2, 5, 20, 21, 1])
+    assert coalesce(secs, 100, max_gap=300) == [(0, 10), (20, 22)]
+    assert coalesce(secs, 100, max_gap=300, max_bytes=500) == [
+        (0, 3),
+        (5, 10),
+        (20, 22),
+    ]
+    assert coalesce(secs, 100, max_gap=0) == [(0, 3), (5, 6), (9, 10), (20, 22)]
+
+
+@pytest.mark.parametrize("max_merge", [None, 1])
+@pytest.mark.parametrize("fname", IMAGES, ids=lambda x: x.name)
+def test_read_planes(fname, max_merge, monkeypatch):
+    import mrc._io
+
+    if max_merge is not None:
+        # read every range in small pieces through the scratch buffer
+        monkeypatch.setattr(mrc._io, "MAX_MERGE_BYTES", max_merge)
+    with DVFile(fname) as f:
+        data = f.asarray(squeeze=False)
+        tczyx = data.transpose([f.axes.index(k) for k in "TCZYX"])
+        tcz = np.indices(tczyx.shape[:3]).reshape(3, -1).T[::-2]
+        tcz = np.concatenate([tcz, tcz[:1], [[-1, -1, -1]]])
+        expected = tczyx[tuple(tcz.T)]
+        np.testing.assert_array_equal(f.read_planes(tcz), expected)
+        if f.sizes["Z"] >= 3:
+            # a repeated section fills the gap of a range
+            tcz = np.array([[0, 0, 0], [0, 0, 0], [0, 0, 2]])
+            np.testing.assert_array_equal(f.read_planes(tcz), tczyx[tuple(tcz.T)])
+
+        for sel in ({"T": slice(None, None, 2), "Z": [0, -1, 0]}, {"C": -1}):
+            key = tuple(sel.get(k, slice(None)) for k in f.axes[:3])
+            out = np.empty_like(data[key])
+            assert f.read_planes(sel, out=out) is out
+            np.testing.assert_array_equal(out, data[key])
+
+
+@pytest.mark.parametrize(
+    "y, x",
+    [
+        (slice(None), slice(None)),
+        (slice(3, 9), slice(2, 10)),
+        (slice(None, None, -3), slice(10, 2, -2)),
+        (slice(1, None, 4), slice(5, 6)),
+    ],
+    ids=str,
+)
+@pytest.mark.parametrize("max_gap", [None, 0])
+def test_read_roi(y, x, max_gap, monkeypatch):
+    import mrc._io
+
+    if max_gap is not None:
+        # read rows one at a time
+        monkeypatch.setattr(mrc._io, "MAX_GAP_BYTES", max_gap)
+    with DVFile(IMAGES[0]) as f:
+        data = f.asarray(squeeze=False)
+        np.testing.assert_array_equal(f.read_roi(y, x), data[..., y, x])
+
+        key = tuple(0 if k == "T" else slice(None) for k in f.axes[:3])
+        out = np.empty_like(data[key][..., y, x], dtype="f8")
+        assert f.read_roi(y=y, x=x, out=out, T=0) is out
+        np.testing.assert_array_equal(out, data[key][..., y, x])
+
+
+@pytest.mark.parametrize("max_workers", [1, 4])
+@pytest.mark.parametrize("dim", ["T", "C", "Z"])
+def test_project(dim, max_workers, monkeypatch):
+    import mrc._project
+
+    with DVFile(IMAGES[0]) as f:
+        data = f.asarray(squeeze=False)
+        # blocks of 3 planes
+        monkeypatch.setattr(
+            mrc._project, "PROJECT_BLOCK_BYTES", 3 * data[0, 0, 0].nbytes
+        )
+        axis = f.axes.index(dim)
+        ops = ("max", "min", "sum", "mean", "argmax", "argmin")
+        results = f.project(dim, ops, max_workers=max_workers)
+        for op, result in zip(ops, results):
+            expected = getattr(np, op)(data, axis=axis)
+            assert result.dtype == expected.dtype
+            np.testing.assert_allclose(result, expected)
+        mip = f.project(dim, dtype="f4", max_workers=max_workers)
+        np.testing.assert_array_equal(mip, data.max(axis=axis).astype("f4"))
+
+        with pytest.raises(ValueError, match="op must be"):
+            f.project(dim, "median")
+        with pytest.raises(ValueError, match="dim must be"):
+            f.project("Y")
+
+
+@pytest.mark.parametrize("op", ["mean", "median", "sum", "max", "min"])
+@pytest.mark.parametrize("dim", ["T", "C", "Z"])
+def test_rolling(dim, op, monkeypatch):
+    import mrc._project
+
+    with DVFile(IMAGES[0]) as f:
+        data = f.asarray(squeeze=False)
+        monkeypatch.setattr(
+            mrc._project, "PROJECT_BLOCK_BYTES", 3 * data[0, 0, 0].nbytes
+        )
+        windows = np.lib.stride_tricks.sliding_window_view(
+            data, 2, axis=f.axes.index(dim)
+        )
+        expected = getattr(np, op)(windows, axis=-1)
+
+        read = []
+        read_sections = f._read_sections
+        monkeypatch.setattr(
+            f, "_read_sections", lambda s: read.append(s) or read_sections(s)
+        )
+        out = np.zeros_like(expected)
+        indices = []
+        for index, plane in f.rolling(dim, 2, op):
+            assert plane.dtype == expected.dtype
+            out[index] = plane
+            indices.append(index)
+        # each plane is read once, in file order
+        np.testing.assert_array_equal(
+            np.concatenate(read), np.arange(data[..., 0, 0].size)
+        )
+        assert len(set(indices)) == len(indices) == expected[..., 0, 0].size
+        np.testing.assert_allclose(out, expected)
+
+        with pytest.raises(ValueError, match="window must be"):
+            next(f.rolling(dim, f.sizes[dim] + 1))
+        with pytest.raises(ValueError, match="op must be"):
+            next(f.rolling(dim, 2, "std"))
+
+
+@pytest.mark.parametrize(
+    "fname", [f for f in IMAGES if f.suffix != ".otf"], ids=lambda x: x.name
+)
+def test_histogram(fname, monkeypatch):
+    import mrc._histogram
+
+    with DVFile(fname) as f:
+        data = np.moveaxis(f.asarray(squeeze=False), f.axes.index("C"), 0)
+        data = data.reshape(len(data), -1)
+        hist = f.histogram("C", bins=64, max_workers=2)
+        assert hist.counts.shape == (len(data), 64)
+        for counts, edges, values in zip(*hist, data):
+            assert edges[0] <= values.min() and values.max() <= edges[-1]
+            np.testing.assert_array_equal(counts, np.histogram(values, edges)[0])
+        lo, hi = hist.percentile([0.1, 99.9]).T
+        width = np.diff(hist.edges[:, :2]).ravel()
+        np.testing.assert_allclose(
+            lo, np.percentile(data, 0.1, axis=1), atol=width.max()
+        )
+        np.testing.assert_allclose(
+            hi, np.percentile(data, 99.9, axis=1), atol=width.max()
+        )
+
+        counts, edges = f.histogram(None, bins=8, range=(0, 100))
+        np.testing.assert_array_equal(counts, np.histogram(data, 8, (0, 100))[0])
+
+        # stored bounds that don't hold the data are not used
+        bounds = np.tile([[0.4, 0.5]], (len(data), 1))
+        monkeypatch.setattr(mrc._histogram, "stored_bounds", lambda *a: bounds)
+        np.testing.assert_array_equal(f.histogram(bins=64).counts, hist.counts)
+
+        monkeypatch.setattr(mrc._histogram, "HISTOGRAM_SAMPLE_BYTES", data.nbytes // 8)
+        sample = f.histogram(bins=64, mode="sampled")
+        assert 0 < sample.counts.sum() < data.size
+
+        with pytest.raises(ValueError, match="mode must be"):
+            f.histogram(mode="fast")
+        with pytest.raises(ValueError, match="dim must be"):
+            f.histogram("Y")
+
+
+@pytest.mark.parametrize("dtype", ["f4", "u2"])
+def test_histogram_default_header(dtype, tmp_path, monkeypatch):
+    import mrc._histogram
+
+    # header min/max left at the defaults (0..100000, 0..10000)
+    data = (np.random.default_rng(0).random((2, 3, 2, 16, 16)) * 5).astype(dtype)
+    mrc.save(data, tmp_path / "t.dv", calcMMM=False)
+    with DVFile(tmp_path / "t.dv") as f:
+        assert (f.hdr.max, f.hdr.max2) == (100000, 10000)
+        values = np.moveaxis(f.asarray(squeeze=False), f.axes.index("C"), 0)
+        values = values.reshape(f.sizes["C"], -1)
+        hist = f.histogram(bins=64)
+        np.testing.assert_array_equal(hist.edges[:, 0], values.min(axis=1))
+        np.testing.assert_array_equal(hist.edges[:, -1], values.max(axis=1))
+        width = np.diff(hist.edges[:, :2]).max()
+        expected = np.percentile(values, 99.9, axis=1)
+        np.testing.assert_allclose(hist.percentile(99.9), expected, atol=width)
+
+        # too many groups to count per value: the same histograms, binned as read
+        with monkeypatch.context() as m:
+            m.setattr(mrc._histogram, "MAX_VALUE_TABLE_BYTES", 0)
+            binned = f.histogram(bins=64, max_workers=2)
+        np.testing.assert_array_equal(binned.counts, hist.counts)
+        np.testing.assert_array_equal(binned.edges, hist.edges)
+
+        # stored bounds that hold the data, but are far wider, are not used
+        wide = np.tile([[-100.0, 100.0]], (f.sizes["C"], 1))
+        monkeypatch.setattr(mrc._histogram, "stored_bounds", lambda *a: wide)
+        np.testing.assert_array_equal(f.histogram(bins=64).edges, hist.edges)
+
+
+def test_intensity_ranges(tmp_path, monkeypatch):
+    def _no_read(sections):
+        raise AssertionError("pixel data was read")
+
+    path = tmp_path / "ctz_ext.dv"
+    path.write_bytes((DATA / "ctz_ext.dv").read_bytes())
+    with DVFile(path) as f:
+        data = f.asarray(squeeze=False)
+        planes = np.stack([data.min(axis=(-2, -1)), data.max(axis=(-2, -1))], -1)
+        c_data = np.moveaxis(data, f.axes.index("C"), 0).reshape(f.sizes["C"], -1)
+        channels = np.stack([c_data.min(axis=1), c_data.max(axis=1)], -1)
+        ext_dtype, n_sections = f.ext_hdr.dtype, data[..., 0, 0].size
+        with monkeypatch.context() as m:
+            m.setattr(f, "_read_sections", _no_read)
+            ranges = f.intensity_ranges()
+        assert ranges.n_scanned == 0
+        np.testing.assert_array_equal(ranges.planes, planes)
+        np.testing.assert_array_equal(ranges.channels, channels)
+        np.testing.assert_allclose(ranges.means, data.mean(axis=(-2, -1)), rtol=1e-5)
+
+    # invalid stored statistics of one plane
+    ext = np.memmap(path, ext_dtype, "r+", offset=1024, shape=n_sections)
+    ext["minInten"][1] = np.nan
+    ext.flush()
+    del ext
+    with DVFile(path) as f:
+        assert np.isnan(f.intensity_ranges(scan=False).planes.reshape(-1, 2)[1, 0])
+        ranges = f.intensity_ranges()
+        assert ranges.n_scanned == 1
+        np.testing.assert_array_equal(ranges.planes, planes)
+        np.testing.assert_array_equal(ranges.channels, channels)
+
+    # no extended header: channels from the header, planes by scanning
+    with DVFile(DATA / "toxo.dv") as f:
+        hdr = f.hdr
+        with monkeypatch.context() as m:
+            m.setattr(f, "_read_sections", _no_read)
+            ranges = f.intensity_ranges(per_plane=False)
+        assert ranges.n_scanned == 0
+        np.testing.assert_array_equal(
+            ranges.channels, [[hdr.min, hdr.max], [hdr.min2, hdr.max2]]
+        )
+        assert np.isnan(ranges.planes).all()
+        data = f.asarray(squeeze=False)
+        ranges = f.intensity_ranges(max_workers=2)
+        assert ranges.n_scanned == data[..., 0, 0].size
+        np.testing.assert_array_equal(ranges.planes[..., 1], data.max(axis=(-2, -1)))
+
+    # header min/max left at the defaults (0..100000, 0..10000)
+    data = (np.random.default_rng(0).random((2, 3, 2, 16, 16)) * 5).astype("f4")
+    mrc.save(data, tmp_path / "defaults.dv", calcMMM=False)
+    with DVFile(tmp_path / "defaults.dv") as f:
+        values = np.moveaxis(f.asarray(squeeze=False), f.axes.index("C"), 0)
+        values = values.reshape(f.sizes["C"], -1)
+        ranges = f.intensity_ranges(per_plane=False)
+        assert ranges.n_scanned == data[..., 0, 0].size
+        np.testing.assert_array_equal(
+            ranges.channels, np.stack([values.min(1), values.max(1)], -1)
+        )
+
+
+@pytest.mark.parametrize("axis", ["P", "T"])
+def test_dataset(axis, tmp_path):
+    paths = []
+    for i in range(3):
+        paths.append(tmp_path / f"pos{i}.dv")
+        paths[-1].write_bytes(IMAGES[0].read_bytes())
+    with DVFile(IMAGES[0]) as f:
+        data = f.asarray(squeeze=False)
+        ax = f.axes.index(axis) if axis in f.axes else None
+
+    with DVDataset(str(tmp_path / "pos*.dv"), axis=axis) as ds:
+        assert ds.paths == [str(p) for p in paths]
+        if ax is None:
+            expected = np.stack([data] * 3)
+        else:
+            expected = np.concatenate([data] * 3, axis=ax)
+        assert ds.shape == expected.shape
+        assert ds.sizes[axis] == expected.shape[ds.axes.index(axis)]
+        np.testing.assert_array_equal(ds.asarray(squeeze=False), expected)
+
+        ax = ds.axes.index(axis)
+        sel = [(slice(None),) * ax + (k,) for k in (1, slice(None, None, -2), [2, 0])]
+        for key in [*sel, (..., 0, 0)]:
+            np.testing.assert_array_equal(ds[key], expected[key])
+        if importlib.util.find_spec("dask") is not None:
+            np.testing.assert_array_equal(ds.to_dask("auto"), expected)
+        if importlib.util.find_spec("xarray") is not None:
+            assert ds.to_xarray(squeeze=False).dims == tuple(ds.axes)
+
+
+def test_dataset_incompatible(tmp_path):
+    import mrc
+
+    mrc.save(np.zeros((4, 16, 16), "u2"), str(tmp_path / "a.dv"), zAxisOrder="z")
+    mrc.save(np.zeros((4, 16, 8), "u2"), str(tmp_path / "b.dv"), zAxisOrder="z")
+    with pytest.raises(ValueError, match="incompatible"):
+        DVDataset(str(tmp_path / "*.dv"), axis="Z")
+    with pytest.raises(ValueError, match="No files found"):
+        DVDataset(str(tmp_path / "*.tif"))
+
+
+def test_scan(tmp_path):
+    # a big-endian copy of the first image, and a file that isn't a DV file
+    buf = IMAGES[0].read_bytes()
+    swapped = BE_HDR.pack(*LE_HDR.unpack(buf[: LE_HDR.size]))
+    (tmp_path / "sub").mkdir()
+    (tmp_path / "sub" / "big.dv").write_bytes(swapped + buf[LE_HDR.size :])
+    (tmp_path / "notes.txt").write_text("not a dv file")
+
+    table = scan([*IMAGES, tmp_path / "notes.txt"], workers=2)
+    assert len(table) == len(IMAGES)
+    for row, path in zip(table, IMAGES):
+        with DVFile(path, lazy=True) as f:
+            assert row["path"] == str(path)
+            assert np.dtype(row["dtype"]) == f.dtype
+            assert {k: row[k] for k in row["axes"]} == f.sizes
+            assert row["dx"] == np.float32(f.voxel_size.x)
+            assert row["image_type"] == f.hdr.image_type
+            hdr = np.frombuffer(path.read_bytes()[:1024], header_dtype(f._byte_order))
+            for name, value in f.hdr._asdict().items():
+                assert hdr[name][0] == (
+                    value.rstrip(b"\0") if name == "blank" else value
+                )
+
+    big = scan(tmp_path, recursive=True, workers=1)
+    assert len(big) == 1
+    assert big["byte_order"][0] == ">"
+    expected = scan([IMAGES[0]])[0]
+    for name in set(big.dtype.names) - {"path", "byte_order", "dtype"}:
+        assert big[name][0] == expected[name]
+    assert len(scan(tmp_path, recursive=False)) == 0
+
+
+def test_header_cache(tmp_path, monkeypatch):
+    src = next(p for p in IMAGES if p.name == "ctz_ext.dv")
+    path = tmp_path / src.name
+    path.write_bytes(src.read_bytes())
+    cache = HeaderCache(tmp_path / "cache")
+
+    with DVFile(path) as f:
+        expected = f.hdr, f.ext_hdr.array.copy()
+    assert cache.lookup(str(path))[1] is None
+    # a lazy open only caches the header, until the extended header is read
+    with DVFile(path, lazy=True, header_cache=cache) as f:
+        assert f.hdr == expected[0]
+        assert len(cache.lookup(str(path))[1][1]) == 0
+    for _ in range(2):
+        with DVFile(path, lazy=True, header_cache=cache) as f:
+            assert f.hdr == expected[0]
+            assert f.ext_hdr.dtype == expected[1].dtype
+            np.testing.assert_array_equal(f.ext_hdr.array, expected[1])
+            assert len(cache.lookup(str(path))[1][1]) > 0
+    with DVFile(path, header_cache=cache) as f:
+        assert f.ext_hdr.dtype == expected[1].dtype
+        np.testing.assert_array_equal(f.ext_hdr.array, expected[1])
+    (entry,) = cache.directory.iterdir()
+
+    # changing the file invalidates its entry
+    os.utime(path, ns=(0, 0))
+    assert cache.lookup(str(path))[1] is None
+    with DVFile(path, header_cache=str(cache.directory)) as f:
+        assert f.sizes
+    assert cache.lookup(str(path))[1] is not None
+
+    # oldest-written entries are evicted beyond max_bytes
+    other = tmp_path / "other.dv"
+    other.write_bytes(path.read_bytes())
+    os.utime(entry, ns=(0, 0))
+    cache.max_bytes = entry.stat().st_size
+    with DVFile(other, header_cache=cache):
+        pass
+    assert cache.lookup(str(path))[1] is None
+    assert cache.lookup(str(other))[1] is not None
+
+    # the directory is scanned on the first store, then only once over max_bytes
+    scans = []
+    scandir = os.scandir
+    monkeypatch.setattr(os, "scandir", lambda p: scans.append(p) or scandir(p))
+    cache = HeaderCache(tmp_path / "cache2")
+    identity = cache.lookup(str(path))[0]
+    for i in range(12):
+        cache.store(str(tmp_path / f"{i:02}.dv"), identity, bytes(1024), b"")
+        if i == 0:
+            # room for 10 entries: the 11th evicts down to 9
+            cache.max_bytes = 10 * next(cache.directory.iterdir()).stat().st_size
+    assert len(scans) == 2
+    assert len(list(cache.directory.iterdir())) == 10
+
+
+@pytest.mark.parametrize("backend", ["mmap", "pread"])
+def test_plane_cache(backend, monkeypatch):
+    cache = PlaneCache()
+    monkeypatch.setattr("mrc._new.plane_cache", cache)
+    with DVFile(IMAGES[0]) as f:
+        expected = f.asarray(squeeze=False)
+    plane_bytes = expected[0, 0, 0].nbytes
+
+    with DVFile(IMAGES[0], backend=backend, cache_planes=True) as f:
+        plane = f[0, 0, 0]
+        assert not plane.flags.writeable
+        assert f[0, 0, 0] is plane
+        assert cache.cache_info()[:4] == (1, 1, 0, 1)
+        keys = [(0, 0), (0, slice(None), 0, slice(1, 5)), (0, [1, 0], -1), ...]
+        keys += [(slice(None), [0, 1, 2], 0, slice(None), 5)]
+        for key in keys:
+            np.testing.assert_array_equal(f[key], expected[key])
+            assert not f[key].flags.writeable
+        info = cache.cache_info()
+        assert info.n_planes == expected[..., 0, 0].size
+        assert info.nbytes == info.n_planes * plane_bytes
+
+        cache.max_bytes = 2 * plane_bytes
+        assert cache.cache_info().evictions == info.n_planes - 2
+        np.testing.assert_array_equal(f[0, 0], expected[0, 0])
+        assert cache.cache_info().n_planes == 2
+
+
+@pytest.mark.parametrize("backend", ["mmap", "pread"])
+@pytest.mark.parametrize("cache_planes", [True, False])
+def test_prefetch(backend, cache_planes, monkeypatch):
+    cache = PlaneCache()
+    monkeypatch.setattr("mrc._new.plane_cache", cache)
+    path = DATA / "toxo.dv"  # CTZ: (2, 1, 17)
+    with DVFile(path, backend=backend, cache_planes=cache_planes, prefetch=3) as f:
+        layout = f._layout()
+        for z in range(0, 6, 2):  # stride 2 in Z, all channels
+            f[:, 0, z]
+        f._prefetcher.join()
+        if cache_planes:
+            ahead = {int(s) for z in (6, 8, 10) for s in f._section_numbers[:, 0, z]}
+            cached = {s for _, s in cache._planes} - set(
+                f._section_numbers[:, 0, :6:2].flat
+            )
+            assert cached == ahead
+            assert all((layout, s) in cache for s in ahead)
+        # random access stops prefetching
+        f[1, 0, 15]
+        assert not f._prefetcher._futures
+
+
+def test_async_dvfile():
+    path = DATA / "toxo.dv"  # CTZ: (2, 1, 17)
+    with DVFile(path) as f:
+        expected = f.asarray(squeeze=False)
+
+    async def main():
+        async with AsyncDVFile(path) as f:
+            reads = []
+            _read_sections = f.file._read_sections
+
+            def counting(sections):
+                reads.append(sections.tolist())
+                return _read_sections(sections)
+
+            f.file._read_sections = counting
+            planes = await asyncio.gather(*(f.read_plane(c=1, z=3) for _ in range(8)))
+            assert len(reads) == 1
+            for plane in planes:
+                np.testing.assert_array_equal(plane, expected[1, 0, 3])
+            planes[0][:] = 0  # merged results don't alias
+            np.testing.assert_array_equal(planes[1], expected[1, 0, 3])
+
+            # overlapping requests only read planes that are not in flight
+            reads.clear()
+            a, b = await asyncio.gather(
+                f.read_planes({"C": 0, "Z": slice(0, 4)}),
+                f.read_planes({"C": 0, "Z": slice(2, 6)}),
+            )
+            assert reads == [[0, 1, 2, 3], [4, 5]]
+            np.testing.assert_array_equal(a, expected[0, :, 0:4])
+            np.testing.assert_array_equal(b, expected[0, :, 2:6])
+
+            rois = await asyncio.gather(
+                *(f.read_roi(y=slice(10, 20), x=slice(5, 50), C=1) for _ in range(3))
+            )
+            for roi in rois:
+                np.testing.assert_array_equal(roi, expected[1, :, :, 10:20, 5:50])
+            np.testing.assert_array_equal(await f.asarray(squeeze=False), expected)
+
+    asyncio.run(main())
+
+
+@pytest.mark.parametrize("buffer_size", [1, 2**20])
+def test_dv_writer(tmp_path, buffer_size):
+    rng = np.random.default_rng(0)
+    data = rng.integers(0, 1000, (3, 2, 4, 16, 24), dtype=np.uint16)  # TCZYX
+    path = tmp_path / "out.dv"
+    sizes = {"T": None, "C": 2, "Z": 4, "Y": 16, "X": 24}
+    meta = {"dxyz": (0.1, 0.1, 0.3)}
+    with DVWriter(path, sizes, "uint16", metadata=meta, buffer_size=buffer_size) as w:
+        for t, stack in enumerate(data):
+            if t == 0:
+                for plane in stack.reshape(-1, 16, 24):
+                    w.write(plane)
+            else:
+                w.write(stack)
+        assert w.n_sections == data[..., 0, 0].size
+
+    with DVFile(path) as f:
+        assert f.sizes == {"T": 3, "C": 2, "Z": 4, "Y": 16, "X": 24}
+        np.testing.assert_array_equal(f.asarray(squeeze=False), data)
+        assert f.voxel_size == pytest.approx((0.1, 0.1, 0.3))
+        hdr = f.hdr
+        assert (hdr.min, hdr.max) == (data[:, 0].min(), data[:, 0].max())
+        assert hdr.mean == pytest.approx(data[:, 0].mean())
+        assert (hdr.min2, hdr.max2) == (data[:, 1].min(), data[:, 1].max())
+
+    # channels varying slowest (CTZ): the channel stride spans the timepoints
+    data = rng.integers(0, 1000, (2, 3, 2, 8, 8), dtype=np.uint16)
+    with DVWriter(path, {"C": 2, "T": 3, "Z": 2, "Y": 8, "X": 8}, "uint16") as w:
+        w.write(data)
+    with DVFile(path) as f:
+        assert f.axes == "CTZYX"
+        assert (f.hdr.min, f.hdr.max) == (data[0].min(), data[0].max())
+        assert f.hdr.mean == pytest.approx(data[0].mean())
+        assert (f.hdr.min2, f.hdr.max2) == (data[1].min(), data[1].max())
+
+
+def test_dv_writer_errors(tmp_path):
+    with pytest.raises(ValueError, match="slowest"):
+        DVWriter(tmp_path / "a.dv", {"C": 2, "T": None, "Y": 4, "X": 4}, "uint8")
+    with pytest.raises(ValueError, match="order"):
+        DVWriter(tmp_path / "a.dv", {"Z": 2, "C": 2, "T": 1, "Y": 4, "X": 4}, "uint8")
+    with DVWriter(tmp_path / "a.dv", {"Z": 2, "Y": 4, "X": 4}, "uint8") as w:
+        with pytest.raises(ValueError, match="shape"):
+            w.write(np.zeros((4, 5)))
+        w.write(np.zeros((2, 4, 4)))
+        with pytest.raises(ValueError, match="more planes"):
+            w.write(np.zeros((4, 4)))
+    with pytest.warns(UserWarning, match="complete timepoint"):
+        with DVWriter(
+            tmp_path / "b.dv", {"T": None, "Z": 2, "Y": 4, "X": 4}, "f4"
+        ) as w:
+            w.write(np.zeros((3, 4, 4)))
+    with DVFile(tmp_path / "b.dv") as f:
+        assert f.sizes["T"] == 1
+
+
+def test_dv_store(tmp_path):
+    path = tmp_path / "out.dv"
+    rng = np.random.default_rng(0)
+    data = rng.integers(0, 1000, (2, 3, 4, 16, 12), dtype=np.uint16)  # T, C, Z
+    store = DVStore(path, dict(zip("TCZYX", data.shape)), data.dtype)
+    store = pickle.loads(pickle.dumps(store))  # as sent to other processes
+    store[:, :, :2] = data[:, :, :2]  # whole planes
+    store[1, :, 2:, 5:] = data[1, :, 2:, 5:]  # whole rows
+    store[1, :, 2:, :5, 3:] = data[1, :, 2:, :5, 3:]
+    store[1, :, 2:, :5, :3] = 0
+    store[1, :, 2:, :5, :3] = data[1, :, 2:, :5, :3]  # overwritten regions count once
+    store[0, :, 2:, ...] = data[0, :, 2:]
+    store.close()
+    assert not os.path.exists(f"{path}.journal")
+    with DVFile(path) as f:
+        assert f.axes == "TCZYX"
+        np.testing.assert_array_equal(f.asarray(), data)
+        assert (f.hdr.min, f.hdr.max) == (data[:, 0].min(), data[:, 0].max())
+        assert f.hdr.mean == pytest.approx(data[:, 0].mean())
+        assert (f.hdr.min3, f.hdr.max3) == (data[:, 2].min(), data[:, 2].max())
+
+    with pytest.raises(IndexError, match="step-1"):
+        DVStore(path, {"Y": 4, "X": 4}, "uint8")[::2] = 1
+
+
+def test_dv_store_dask(tmp_path):
+    da = pytest.importorskip("dask.array")
+    arr = da.random.random((5, 2, 32, 32), chunks=(2, 1, 16, 32)).astype("float32")
+    with DVStore(tmp_path / "out.dv", dict(zip("ZCYX", arr.shape)), arr.dtype) as s:
+        da.store(arr, s, lock=False)
+    with DVFile(tmp_path / "out.dv") as f:
+        assert f.sizes == {"T": 1, "Z": 5, "C": 2, "Y": 32, "X": 32}
+        np.testing.assert_array_equal(f.asarray(), arr.compute())
+
+
+def test_create_out_of_order(tmp_path):
+    path = tmp_path / "out.dv"
+    rng = np.random.default_rng(0)
+    data = rng.integers(0, 1000, (3, 2, 4, 8, 8), dtype=np.uint16)  # T, C, Z
+    sizes = {"Z": 4, "C": 2, "T": 3, "Y": 8, "X": 8}
+    planes = [(t, c, z) for t in range(3) for c in range(2) for z in range(4)]
+    rng.shuffle(planes)
+
+    store = mrc.create(path, sizes, np.uint16, "TCZ")
+    assert store.shape == data.shape
+    with ThreadPoolExecutor(4) as pool:
+        for t, c, z in planes[:10]:
+            pool.submit(store.write_plane, data[t, c, z], t=t, c=c, z=z)
+    assert store.filled.sum() == 10
+    store._release()  # as if the writing process crashed
+
+    store = mrc.create(path, sizes, np.uint16, "TCZ", resume=True)
+    assert store.filled.sum() == 10
+    for t, c, z in np.argwhere(~store.filled):
+        store.write_plane(data[t, c, z], t=t, c=c, z=z)
+    store.close()
+    with DVFile(path) as f:
+        assert f.axes == "TCZYX"
+        np.testing.assert_array_equal(f.asarray(), data)
+        assert (f.hdr.min2, f.hdr.max2) == (data[:, 1].min(), data[:, 1].max())
+
+    with pytest.raises(FileNotFoundError):
+        DVStore.resume(path)
+    store = mrc.create(path, {"Z": 3, "Y": 8, "X": 8}, np.float32)
+    store.write_plane(np.ones((8, 8)), z=1)
+    with pytest.raises(IndexError):
+        store.write_plane(np.ones((8, 8)), t=1)
+    store._release()
+    with pytest.raises(ValueError, match="match"):
+        mrc.create(path, {"Z": 4, "Y": 8, "X": 8}, np.float32, resume=True)
+    with pytest.warns(UserWarning, match="2 of 3 planes"):
+        DVStore.resume(path).close()
+
+    # overlapping partial writes
+    store = mrc.create(path, {"Z": 2, "Y": 8, "X": 8}, np.float32)
+    store[0, 0:6] = 1
+    store[0, 1:6] = 2
+    store[1, :, :5] = 1
+    store[1, 3:, 2:] = 2
+    assert not store.filled.any()
+    store[0, 5:] = 3
+    store[1, :3, 4:] = 3
+    assert store.filled.all()
+    store[0, :2] = 4
+    assert store.filled.all()
+    store.close()
+
+
+@pytest.mark.parametrize("sync", ["none", "batch", "close", 0.0])
+def test_dv_writer_background(tmp_path, sync):
+    path = tmp_path / "out.dv"
+    rng = np.random.default_rng(0)
+    data = rng.integers(0, 1000, (5, 2, 3, 16, 16), dtype=np.uint16)  # T, C, Z
+    sizes = {"T": None, "C": 2, "Z": 3, "Y": 16, "X": 16}
+    # buffers of 4 planes, so that writes don't align with them
+    with DVWriter(
+        path, sizes, np.uint16, background=True, buffer_size=4 * 512, sync=sync
+    ) as w:
+        for stack in data:
+            w.write(stack)
+    stats = w.stats
+    assert stats.planes_written == 30
+    assert stats.batches == 8
+    assert stats.queue_depth == 0
+    assert (stats.sync_time > 0) == (sync != "none")
+    with DVFile(path) as f:
+        np.testing.assert_array_equal(f.asarray(), data)
+        assert (f.hdr.min2, f.hdr.max2) == (data[:, 1].min(), data[:, 1].max())
+
+
+def test_dv_writer_background_errors(tmp_path):
+    sizes = {"Z": 20, "Y": 4, "X": 4}
+    w = DVWriter(tmp_path / "out.dv", sizes, "u1", background=True, buffer_size=16)
+
+    def fail(planes):
+        raise OSError("disk full")
+
+    w._mrc.writeStack = fail
+    with pytest.raises(OSError, match="failed"):
+        for _ in range(20):
+            w.write(np.zeros((4, 4)))
+    with pytest.raises(OSError, match="failed"):
+        w.close()
+    assert w.closed
+    with pytest.raises(ValueError, match="sync"):
+        DVWriter(tmp_path / "a.dv", {"Y": 4, "X": 4}, "u1", sync="always")
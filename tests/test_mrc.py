@@ -1,5 +1,7 @@
 from pathlib import Path
 
+import numpy as np
+
 from mrc.mrc import imread
 
 dv_file = Path(__file__).parent / "toxo.dv"
@@ -9,3 +11,99 @@ def test_reader():
     array = imread(str(dv_file))
     assert array.shape == (2, 17, 128, 128)
     assert array.Mrc.header.dvid == -16224
+
+
+def test_read_sections():
+    import mrc
+
+    expected = imread(str(dv_file)).reshape(-1, 128, 128)
+    m = mrc.open(str(dv_file))
+    try:
+        np.testing.assert_array_equal(m.readSec(3), expected[3])
+        np.testing.assert_array_equal(m.readSec(), expected[4])
+        np.testing.assert_array_equal(m.readStack(5, 10), expected[10:15])
+        np.testing.assert_array_equal(m.readStack(2), expected[15:17])
+        np.testing.assert_array_equal(
+            m.readSecs([30, 1, 2, 1]), expected[[30, 1, 2, 1]]
+        )
+    finally:
+        m.close()
+
+
+def test_save_ext_hdr(tmp_path):
+    import mrc
+
+    data = imread(str(dv_file))
+    out = str(tmp_path / "out.dv")
+
+    # per-field columns (any shape), or a single value for all sections
+    times = np.arange(34, dtype=np.float32).reshape(2, 17)
+    mrc.save(data, out, zAxisOrder="w z", extFloats={"timeStampSeconds": times})
+    with mrc.DVFile(out) as f:
+        assert (f.hdr.n_ints, f.hdr.n_floats) == (0, 2)
+        np.testing.assert_array_equal(f.ext_hdr["timeStampSeconds"].squeeze(), times)
+    ints = np.arange(68).reshape(34, 2)
+    mrc.save(data, out, zAxisOrder="w z", extInts=ints, extFloats={"expTime": 5})
+    with mrc.DVFile(out) as f:
+        assert (f.hdr.n_ints, f.hdr.n_floats) == (2, 9)
+        assert np.all(f.ext_hdr["expTime"] == 5)
+        np.testing.assert_array_equal(f.asarray().squeeze(), data)
+        ext = f.ext_hdr.array.copy()
+
+    # a whole structured array, as read by DVFile
+    out2 = str(tmp_path / "out2.dv")
+    mrc.save(data, out2, zAxisOrder="w z", extFloats=ext)
+    with mrc.DVFile(out2) as f:
+        assert f.ext_hdr.dtype == ext.dtype
+        np.testing.assert_array_equal(f.ext_hdr.array, ext)
+        np.testing.assert_array_equal(f.ext_hdr["ints"].reshape(34, 2), ints)
+
+
+def test_save_5d(tmp_path):
+    import mrc
+
+    rng = np.random.default_rng(0)
+    data = rng.integers(0, 1000, (3, 2, 4, 16, 16), dtype=np.uint16)  # t, w, z
+    out = str(tmp_path / "out.dv")
+    expected_axes = {"twz": "TCZ", "tzw": "TZC", "wzt": "CTZ", "ztw": "TZC"}
+    for order, axes in expected_axes.items():
+        perm = ["twz".index(ax) for ax in order]
+        mrc.save(data.transpose(*perm, 3, 4), out, zAxisOrder=order)
+        with mrc.DVFile(out) as f:
+            assert f.axes == axes + "YX"
+            assert (f.hdr.min2, f.hdr.max2) == (data[:, 1].min(), data[:, 1].max())
+            file_perm = ["TCZ".index(ax) for ax in axes]
+            np.testing.assert_array_equal(f.asarray(), data.transpose(*file_perm, 3, 4))
+
+    # blocks of any size
+    view = data.transpose(2, 1, 0, 3, 4)  # z, w, t
+    for max_bytes in (1, 2000, 5000):
+        m = mrc.Mrc2(out, "w")
+        m.initHdrForArr(view, "zwt")
+        m.writeHeader()
+        m.writeArr(view, maxBytes=max_bytes)
+        m.close()
+        with mrc.DVFile(out) as f:
+            np.testing.assert_array_equal(f.asarray(), data.transpose(1, 0, 2, 3, 4))
+
+
+def test_save_stats(tmp_path, monkeypatch):
+    import mrc
+    import mrc.mrc
+
+    # small pieces, to check that they are merged per wave
+    monkeypatch.setattr(mrc.mrc, "STATS_CHUNK_BYTES", 1000)
+    rng = np.random.default_rng(0)
+    out = str(tmp_path / "out.dv")
+    for dtype in ("uint16", "float32", "complex64"):
+        data = (rng.random((4, 3, 32, 32)) * 1000).astype(dtype)  # z, w
+        mrc.save(data, out, zAxisOrder="zw", metadata={"mm3": (1, 2)})
+        values = np.abs(data) if dtype == "complex64" else data
+        with mrc.DVFile(out) as f:
+            np.testing.assert_allclose(
+                (f.hdr.min, f.hdr.max, f.hdr.mean),
+                (values[:, 0].min(), values[:, 0].max(), values[:, 0].mean()),
+                rtol=1e-6,
+            )
+            assert (f.hdr.min2, f.hdr.max2) == (values[:, 1].min(), values[:, 1].max())
+            assert (f.hdr.min3, f.hdr.max3) == (1, 2)  # not overwritten